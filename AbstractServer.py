@@ -9,20 +9,24 @@ import abc
 class AbstractServer(metaclass=abc.ABCMeta):
 
     @abc.abstractmethod
-    def initialize_client(self, client_id, game_id):
+    def initialize_client(self, client_id, game_id, delta=False):
         """
         Generates initial message to send to client
         :param client_id: which client will receive message
         :param game_id: unique game id
+        :param delta: true if client gets delta updates, so starts from a full snapshot
         :return: initial message for client
         """
         pass
 
     @abc.abstractmethod
-    def request_move(self, client_id):
+    def request_move(self, client_id, delta=False, move_time=None, bank=None):
         """
         Generates move-request message to send to client
         :param client_id: which client will receive message
+        :param delta: true to send position hash instead of full grid
+        :param move_time: seconds client has for the move, None if unlimited
+        :param bank: seconds left on client's clock, None if no clock
         :return: move-request message for client
         """
         pass
@@ -38,11 +42,12 @@ class AbstractServer(metaclass=abc.ABCMeta):
         pass
 
     @abc.abstractmethod
-    def send_move(self, client_id, msg):
+    def send_move(self, client_id, msg, delta=False):
         """
         Generates message informing client of most recent move
         :param client_id: who moved
         :param msg: the most recent move
+        :param delta: true to send position hash instead of full grid
         :return: recent-move message for client
         """
         pass
@@ -0,0 +1,502 @@
+"""
+Asynchronous game server
+
+Runs every game as a task on a single asyncio event loop instead of
+one thread per game, with the same protocol, matchmaking and
+GameSession as ThreadedServer.py. A game costs a task rather than a
+thread, so max_games and max_pending default far higher than
+ThreadedServer.py's pool. On shutdown, every player in a game or
+waiting for one is sent QUIT_MESS before their connection is closed.
+
+Starbuck Beagley
+"""
+
+import asyncio
+import itertools
+import time
+import pickle
+import socket
+import LOAServer
+import Transport
+import Protocol
+import Matchmaker
+import SessionPool
+import GameSession
+import Metrics
+
+INIT = 0
+P1_MOVE_REQ = 1
+P2_MOVE_REQ = 2
+P1_MOVE_WAS = 3
+P2_MOVE_WAS = 4
+WIN_MESS = 5
+ERR_MESS = 6
+QUIT_MESS = 7
+CONTINUE_GAME = 8
+END_GAME = 9
+RESYNC_MESS = 10
+
+P1 = 1
+P2 = 2
+
+BUFF_SIZE = 1024
+SERVER_PORT = 7667
+MAX_CLIENTS = 4096
+MAX_GAMES = 10000
+MAX_PENDING = 1000
+FIRST_GAME_ID = 1
+TIME_DELAY = 0.5
+HANDSHAKE_TIMEOUT = 10
+PRUNE_INTERVAL = 0.5
+BUSY_MESS = "Server busy. Try again later."
+
+log = Metrics.log
+
+
+class Connection:
+    def __init__(self, reader, writer):
+        """
+        Constructor
+        :param reader: asyncio stream reader
+        :param writer: asyncio stream writer
+        """
+        self.reader = reader
+        self.writer = writer
+        self.framed = None
+        self.codec = Protocol.PickleCodec()
+        self.delta = False
+
+    async def send(self, msg, board=None):
+        """
+        Sends message to client
+        :param msg: message list
+        :param board: board the message's grid came from, if any
+        """
+        start = time.perf_counter()
+        payload = self.codec.encode(msg, board)
+        Metrics.encode_time.since(start)
+        if self.framed is not False:
+            self.writer.write(Transport.HEADER.pack(len(payload)) + payload)
+        else:
+            self.writer.write(bytes(payload))
+        await self.writer.drain()
+
+    async def recv(self):
+        """
+        Receives message from client, choosing framing from the first byte
+        received and codec from the first message
+        :return: message list
+        """
+        try:
+            if self.framed is None:
+                first = await self.reader.readexactly(1)
+                self.framed = first[0] != Transport.PICKLE_PROTO
+                if not self.framed:
+                    return self.decode(first + await self.reader.read(BUFF_SIZE))
+                header = first + await self.reader.readexactly(Transport.HEADER.size - 1)
+                length = Transport.HEADER.unpack(header)[0]
+                if length > Transport.MAX_FRAME:
+                    raise ValueError("Incoming message too large")
+                payload = await self.reader.readexactly(length)
+                self.codec = Protocol.negotiate(payload)
+                return self.decode(payload)
+            elif self.framed:
+                header = await self.reader.readexactly(Transport.HEADER.size)
+            else:
+                data = await self.reader.read(BUFF_SIZE)
+                if not data:
+                    raise EOFError("Connection closed")
+                return self.decode(data)
+            length = Transport.HEADER.unpack(header)[0]
+            if length > Transport.MAX_FRAME:
+                raise ValueError("Incoming message too large")
+            return self.decode(await self.reader.readexactly(length))
+        except asyncio.IncompleteReadError:
+            raise EOFError("Connection closed")
+
+    def decode(self, payload):
+        """
+        Decodes message with the connection's codec
+        :param payload: bytes received
+        :return: message list
+        """
+        start = time.perf_counter()
+        msg = self.codec.decode(payload)
+        Metrics.decode_time.since(start)
+        return msg
+
+    def is_alive(self):
+        """
+        Checks whether the client is still connected, e.g. while it waits for an opponent
+        :return: false if the client closed the connection
+        """
+        return not self.reader.at_eof() and not self.writer.is_closing()
+
+    def close(self):
+        """ Closes connection """
+        try:
+            self.writer.close()
+        except OSError:
+            pass
+
+
+class AsyncGameServer:
+    def __init__(self, max_games=MAX_GAMES, max_pending=MAX_PENDING):
+        """
+        Constructor
+        :param max_games: games played at once
+        :param max_pending: games that may wait for a free slot before new games are refused
+        """
+        self.matchmaker = Matchmaker.Matchmaker()
+        self.game_ids = itertools.count(FIRST_GAME_ID)
+        self.games = set()
+        self.handshakes = set()
+        self.max_games = max_games
+        self.max_pending = max_pending
+        self.slots = None
+        self.active = 0
+        self.pending = 0
+        self.finished = 0
+        self.rejected = 0
+        self.stopped = None
+        self.server = None
+
+    async def serve(self, host, port):
+        """
+        Accepts clients until a client sends QUIT_MESS, then tells every
+        player still connected that the server is shutting down
+        :param host: host name to bind
+        :param port: port to bind
+        """
+        self.stopped = asyncio.Event()
+        self.slots = asyncio.Semaphore(self.max_games)
+        self.server = await asyncio.start_server(self.handle_client, host, port, backlog=MAX_CLIENTS)
+        Metrics.active_games.set_function(lambda: self.active)
+        Metrics.queue_depth.set_function(self.matchmaker.queue_depth)
+        log.info("Waiting for players")
+        pruning = asyncio.get_running_loop().create_task(self.prune_queue())
+        await self.stopped.wait()
+        self.server.close()
+        await cancel_all([pruning])
+        await cancel_all(self.handshakes)
+        for game_id, conn in self.matchmaker.waiting():
+            await stop_game(conn, None)
+        await cancel_all(self.games)
+        await self.server.wait_closed()
+        log.info("Matchmaking: " + Matchmaker.format_stats(self.matchmaker.stats()))
+        log.info("Games: " + SessionPool.format_stats(self.stats()))
+
+    async def prune_queue(self):
+        """ Drops players who disconnect while waiting for an opponent, until cancelled """
+        while 1:
+            await asyncio.sleep(PRUNE_INTERVAL)
+            self.matchmaker.prune()
+
+    async def handle_client(self, reader, writer):
+        """
+        Handles a new client, keeping its handshake task where shutdown can cancel it
+        :param reader: asyncio stream reader
+        :param writer: asyncio stream writer
+        """
+        accepted = time.monotonic()
+        conn = Connection(reader, writer)
+        Metrics.connections.inc()
+        log.debug("Got connection from %s" % str(writer.get_extra_info("peername")))
+        task = asyncio.current_task()
+        self.handshakes.add(task)
+        try:
+            await self.handshake(conn, accepted)
+        except asyncio.CancelledError:
+            conn.close()
+        finally:
+            self.handshakes.discard(task)
+
+    async def handshake(self, conn, accepted):
+        """
+        Reads first message from a new client and starts or queues its game
+        :param conn: client's connection
+        :param accepted: time.monotonic() when the connection was accepted
+        """
+        try:
+            msg = Protocol.check_first_message(await asyncio.wait_for(conn.recv(), HANDSHAKE_TIMEOUT))
+        except asyncio.TimeoutError:
+            log.warning("Client sent no first message in " + str(HANDSHAKE_TIMEOUT) + " seconds. Disconnecting.")
+            conn.close()
+            return
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError) as err:
+            log.warning("Error: " + str(err) + ".")
+            try:
+                await conn.send([ERR_MESS, str(err)])
+            except OSError:
+                pass
+            conn.close()
+            return
+
+        if msg[0] == INIT:
+            conn.delta = len(msg) > 2 and bool(msg[2])
+            size = msg[3] if len(msg) > 3 else LOAServer.ROWS
+            rating = msg[4] if len(msg) > 4 else Matchmaker.UNRATED
+            if size != LOAServer.ROWS:
+                err_msg = "Board size " + str(size) + " is not supported."
+                log.warning(err_msg)
+                try:
+                    await conn.send([ERR_MESS, err_msg])
+                except OSError:
+                    pass
+                conn.close()
+            elif msg[1]:
+                game_id, opp, wait = self.matchmaker.pair(conn, self.game_ids, size, rating, accepted)
+                if opp is not None:
+                    Metrics.pairing_time.observe(wait)
+                    Metrics.pairing_time.observe(time.monotonic() - accepted)
+                    log.info("Game #" + str(game_id) + ": Got remote opponent after %.1f s. Starting game." % wait)
+                    self.start_game(game_id, opp, conn)
+                else:
+                    log.info("Game #" + str(game_id) + ": Got player who needs remote opponent. Adding to queue (" +
+                             str(self.matchmaker.queue_depth()) + " waiting).")
+            else:
+                game_id = next(self.game_ids)
+                Metrics.pairing_time.observe(time.monotonic() - accepted)
+                log.info("Game #" + str(game_id) + ": No remote player needed. Starting game.")
+                self.start_game(game_id, conn, None)
+        elif msg[0] == QUIT_MESS:
+            log.info("Server remotely shut down.")
+            conn.close()
+            self.stopped.set()
+        else:
+            err_msg = "Server needs to know if player 2 is remote. Passing."
+            log.warning(err_msg)
+            try:
+                await conn.send([ERR_MESS, err_msg])
+            except OSError:
+                pass
+            conn.close()
+
+    def start_game(self, game_id, conn1, conn2):
+        """
+        Starts game as a task on the event loop, refusing it if too many games are waiting
+        :param game_id: unique game identifier
+        :param conn1: connection for client 1
+        :param conn2: connection for client 2 (None if local game)
+        """
+        if self.active + self.pending >= self.max_games + self.max_pending:
+            self.rejected += 1
+            Metrics.games_rejected.inc()
+            log.warning("Game #" + str(game_id) + ": Server busy (" + SessionPool.format_stats(self.stats()) +
+                        "). Refusing game.")
+            task = asyncio.get_running_loop().create_task(refuse_game(conn1, conn2))
+        else:
+            self.pending += 1
+            task = asyncio.get_running_loop().create_task(self.play_game(game_id, conn1, conn2))
+        self.games.add(task)
+        task.add_done_callback(self.games.discard)
+
+    async def play_game(self, game_id, conn1, conn2):
+        """
+        Plays game once one of the max_games slots is free, ending it if the server shuts down
+        :param game_id: unique game identifier
+        :param conn1: connection for client 1
+        :param conn2: connection for client 2 (None if local game)
+        """
+        try:
+            async with self.slots:
+                self.pending -= 1
+                self.active += 1
+                try:
+                    await run_game(game_id, conn1, conn2)
+                finally:
+                    self.active -= 1
+                    self.finished += 1
+        except asyncio.CancelledError:
+            log.info("Game #" + str(game_id) + ": " + GameSession.STOP_MESS + " Ending game.")
+            await stop_game(conn1, conn2)
+
+    def stats(self):
+        """
+        Gets game counts, in the same form as SessionPool.stats
+        :return: dict of stats
+        """
+        return {
+            "active": self.active,
+            "pending": self.pending,
+            "finished": self.finished,
+            "rejected": self.rejected,
+        }
+
+
+async def run_game(game_id, conn1, conn2, clock=None):
+    """
+    Coroutine to control one game
+    :param game_id: unique game identifier
+    :param conn1: connection for client 1
+    :param conn2: connection for client 2 (None if local game)
+    :param clock: Clock for this game, defaults to one set up by GameSession.set_clock
+    """
+    session = GameSession.GameSession(game_id, conn2 is not None, clock)
+    outcome = CONTINUE_GAME
+    for client_id, conn in ((P2, conn2), (P1, conn1)):
+        if conn is None:
+            continue
+        try:
+            await conn.send(session.init_message(client_id, conn.delta), session.board)
+        except OSError as err:
+            outcome, reply, delay = session.error(client_id, str(err))
+            await send_reply(session, conn1, conn2, reply, delay)
+            break
+
+    while outcome == CONTINUE_GAME:
+        conn = session.mover(conn1, conn2)
+        await pause(TIME_DELAY, (conn,))
+        msg = await get_move(session, conn)
+        client_id = session.current_player
+        outcome, reply, delay = session.play(msg)
+        err_str = await send_reply(session, conn1, conn2, reply, delay)
+        if err_str is not None and outcome == CONTINUE_GAME:
+            outcome, reply, delay = session.error(client_id, err_str)
+            await send_reply(session, conn1, conn2, reply, delay)
+    close_connections(conn1, conn2)
+
+
+async def get_move(session, conn):
+    """
+    Sends message to client requesting move, forfeiting the game for the
+    player as soon as their clock runs out
+    :param session: GameSession of the game
+    :param conn: connection of player to move
+    :return: client move if successful, error message otherwise
+    """
+    await pause(TIME_DELAY, (conn,))
+    session.start_turn()
+    msg = await send_request(session, conn, conn.delta)
+    if session.needs_resync(msg):
+        msg = await send_request(session, conn, False)
+    return session.end_turn(msg)
+
+
+async def send_request(session, conn, delta):
+    """
+    Sends move request to client and waits for the reply until the clock runs out
+    :param session: GameSession of the game, with the clock running for the player to move
+    :param conn: connection of player to move
+    :param delta: true to send position hash instead of full board
+    :return: client reply if successful, error message otherwise
+    """
+    sent = time.perf_counter()
+    try:
+        await conn.send(session.move_request(delta), session.board)
+    except OSError as err:
+        return [ERR_MESS, str(err)]
+    wait = session.time_left()
+    if wait is not None and wait <= 0:
+        return session.out_of_time()
+    try:
+        msg = await asyncio.wait_for(conn.recv(), wait)
+    except asyncio.TimeoutError:
+        return session.out_of_time()
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError) as err:
+        return [ERR_MESS, str(err)]
+    Metrics.round_trip_time.since(sent)
+    return msg
+
+
+async def send_reply(session, conn1, conn2, reply, delay):
+    """
+    Sends both clients what the game session decided they are sent
+    :param session: GameSession of the game
+    :param conn1: connection for client 1
+    :param conn2: connection for client 2 (None if local game)
+    :param reply: function of a client's delta flag giving its message, None to send nothing
+    :param delay: seconds to pause before sending
+    :return: None if sent, error string otherwise
+    """
+    if reply is None:
+        return None
+    await pause(delay, (conn1, conn2))
+    for conn in (conn1, conn2):
+        if conn is not None:
+            try:
+                await conn.send(reply(conn.delta), session.board)
+            except OSError as err:
+                return str(err)
+    return None
+
+
+async def refuse_game(conn1, conn2):
+    """
+    Tells clients the server is busy and closes connections
+    :param conn1: connection for client 1
+    :param conn2: connection for client 2 (None if local game)
+    """
+    try:
+        for conn in (conn1, conn2):
+            if conn is not None:
+                try:
+                    await conn.send([ERR_MESS, BUSY_MESS])
+                except OSError:
+                    pass
+    finally:
+        close_connections(conn1, conn2)
+
+
+async def stop_game(conn1, conn2):
+    """
+    Tells clients the server is shutting down and closes connections
+    :param conn1: connection for client 1
+    :param conn2: connection for client 2 (None if local game)
+    """
+    for conn in (conn1, conn2):
+        if conn is not None:
+            try:
+                await conn.send([QUIT_MESS, GameSession.STOP_MESS])
+            except OSError:
+                pass
+    close_connections(conn1, conn2)
+
+
+async def cancel_all(tasks):
+    """
+    Cancels tasks and waits for them to finish
+    :param tasks: set of tasks, which may change while they finish
+    """
+    tasks = list(tasks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def pause(seconds, conns=()):
+    """
+    Pauses between messages so human players can follow the game, as GameSession.paced decides
+    :param seconds: length of pause
+    :param conns: connections about to be sent to
+    """
+    if GameSession.paced(conns):
+        await asyncio.sleep(seconds)
+
+
+def close_connections(conn1, conn2):
+    """
+    Closes connections
+    :param conn1: connection for client 1
+    :param conn2: connection for client 2
+    """
+    conn1.close()
+    if conn2 is not None:
+        conn2.close()
+
+
+def main(host=None, port=SERVER_PORT, max_games=MAX_GAMES, max_pending=MAX_PENDING):
+    """
+    Runs asynchronous server until remotely shut down
+    :param host: host name to bind, defaults to this host's name
+    :param port: port to bind
+    :param max_games: games played at once
+    :param max_pending: games that may wait for a free slot before new games are refused
+    """
+    if host is None:
+        host = socket.gethostname()
+    asyncio.run(AsyncGameServer(max_games, max_pending).serve(host, port))
+
+
+if __name__ == '__main__':
+    main()
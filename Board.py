@@ -1,7 +1,22 @@
 """
 Lines of Action Board class
 Starbuck Beagley
+
+The position is stored as two bitboards, one per player, where
+cell (r, c) is bit r * cols + c. The list-of-lists grid returned by
+get_grid is a view built lazily from the bitboards.
+
+Piece counts for every row, column, diagonal and anti-diagonal, and
+each player's connected groups, are kept up to date as cells change.
+With DEBUG_COUNTS set, every update is checked against a full rescan.
+
+board.hash is a 64-bit Zobrist hash of the position and the side to
+move, updated with every change.
 """
+import Geometry
+
+EMPTY = ' '
+DEBUG_COUNTS = False
 
 
 class Board:
@@ -21,25 +36,84 @@ class Board:
         else:
             self.piece1 = p2.get_piece()
             self.piece2 = p1.get_piece()
-        self.grid = [[' ' for x in range(self.cols)] for y in range(self.rows)]
+        self.geometry = Geometry.get_geometry(r, c)
+        self.bits1 = 0
+        self.bits2 = 0
+        self.grid = None
+        self.debug = DEBUG_COUNTS
+        self.row_counts = [0] * r
+        self.col_counts = [0] * c
+        self.diag_counts = [0] * (r + c - 1)
+        self.anti_counts = [0] * (r + c - 1)
+        self.groups1 = []
+        self.groups2 = []
+        self.side = 1
+        self.hash = 0
 
     def reset_board(self):
         """ Sets board to initial state """
-        for r in range(0, self.rows):
-            for c in range(0, self.cols):
-                self.grid[r].append(' ')
+        bits1 = 0
+        bits2 = 0
         for rr in range(1, self.rows - 1):
-            self.grid[rr][0] = self.piece1
-            self.grid[rr][self.cols - 1] = self.piece1
+            bits1 |= 1 << self.geometry.index(rr, 0)
+            bits1 |= 1 << self.geometry.index(rr, self.cols - 1)
         for cc in range(1, self.cols - 1):
-            self.grid[0][cc] = self.piece2
-            self.grid[self.rows - 1][cc] = self.piece2
+            bits2 |= 1 << self.geometry.index(0, cc)
+            bits2 |= 1 << self.geometry.index(self.rows - 1, cc)
+        self.set_bits(bits1, bits2, 1)
+
+    def set_grid(self, grid, side):
+        """
+        Sets board to a position given as a grid, e.g. a full snapshot from the server
+        :param grid: list of lists of pieces
+        :param side: number of player to move
+        """
+        bits1 = 0
+        bits2 = 0
+        for r in range(0, self.rows):
+            for c in range(0, self.cols):
+                if grid[r][c] == self.piece1:
+                    bits1 |= 1 << self.geometry.index(r, c)
+                elif grid[r][c] == self.piece2:
+                    bits2 |= 1 << self.geometry.index(r, c)
+        self.set_bits(bits1, bits2, side)
+
+    def set_bits(self, bits1, bits2, side):
+        """
+        Sets board to a position given as bitboards, rebuilding counts, groups and hash
+        :param bits1: player 1 bitboard
+        :param bits2: player 2 bitboard
+        :param side: number of player to move
+        """
+        self.bits1 = bits1
+        self.bits2 = bits2
+        self.grid = None
+        self.col_counts, self.row_counts, self.diag_counts, self.anti_counts = self.count_lines()
+        self.groups1 = self.geometry.find_groups(self.bits1)
+        self.groups2 = self.geometry.find_groups(self.bits2)
+        self.side = side
+        self.hash = self.compute_hash()
 
     def get_grid(self):
         """
-        Gets grid
+        Gets grid, building it from the bitboards if needed
         :return: grid
         """
+        if self.grid is None:
+            grid = []
+            bit = 1
+            for r in range(0, self.rows):
+                row = []
+                for c in range(0, self.cols):
+                    if self.bits1 & bit:
+                        row.append(self.piece1)
+                    elif self.bits2 & bit:
+                        row.append(self.piece2)
+                    else:
+                        row.append(EMPTY)
+                    bit <<= 1
+                grid.append(row)
+            self.grid = grid
         return self.grid
 
     def get_cell(self, r, c):
@@ -49,7 +123,12 @@ class Board:
         :param c: column position
         :return: piece at grid[r][c]
         """
-        return self.grid[r][c]
+        bit = 1 << self.geometry.index(r, c)
+        if self.bits1 & bit:
+            return self.piece1
+        elif self.bits2 & bit:
+            return self.piece2
+        return EMPTY
 
     def get_rows(self):
         """
@@ -65,6 +144,139 @@ class Board:
         """
         return self.cols
 
+    def get_geometry(self):
+        """
+        Gets line masks shared by boards of this size
+        :return: Geometry object
+        """
+        return self.geometry
+
+    def get_bits(self, piece):
+        """
+        Gets bitboard of a player's pieces
+        :param piece: player's piece
+        :return: bitboard, 0 if piece is not on this board
+        """
+        if piece == self.piece1:
+            return self.bits1
+        elif piece == self.piece2:
+            return self.bits2
+        return 0
+
+    def get_occupied(self):
+        """
+        Gets bitboard of all occupied cells
+        :return: bitboard
+        """
+        return self.bits1 | self.bits2
+
+    def row_count(self, r):
+        """
+        Gets number of pieces in a row
+        :param r: row position
+        :return: piece count
+        """
+        return self.row_counts[r]
+
+    def col_count(self, c):
+        """
+        Gets number of pieces in a column
+        :param c: column position
+        :return: piece count
+        """
+        return self.col_counts[c]
+
+    def diag_count(self, r, c):
+        """
+        Gets number of pieces on the diagonal through a cell
+        :param r: row position
+        :param c: column position
+        :return: piece count
+        """
+        return self.diag_counts[self.geometry.diag_index(r, c)]
+
+    def anti_count(self, r, c):
+        """
+        Gets number of pieces on the anti-diagonal through a cell
+        :param r: row position
+        :param c: column position
+        :return: piece count
+        """
+        return self.anti_counts[self.geometry.anti_index(r, c)]
+
+    def get_side(self):
+        """
+        Gets number of player to move
+        :return: player number
+        """
+        return self.side
+
+    def switch_side(self):
+        """ Passes the move to the other player """
+        self.side = 3 - self.side
+        self.hash ^= self.geometry.zobrist_side
+
+    def get_hash(self):
+        """
+        Gets Zobrist hash of the position and side to move
+        :return: 64-bit hash
+        """
+        return self.hash
+
+    def compute_hash(self):
+        """
+        Computes Zobrist hash of the position from scratch
+        :return: 64-bit hash
+        """
+        h = 0
+        if self.side == 2:
+            h ^= self.geometry.zobrist_side
+        for i in range(0, self.geometry.size):
+            if (self.bits1 >> i) & 1:
+                h ^= self.geometry.zobrist1[i]
+            elif (self.bits2 >> i) & 1:
+                h ^= self.geometry.zobrist2[i]
+        return h
+
+    def group_count(self, piece):
+        """
+        Gets number of connected groups a player's pieces form
+        :param piece: player's piece
+        :return: group count
+        """
+        if piece == self.piece1:
+            return len(self.groups1)
+        elif piece == self.piece2:
+            return len(self.groups2)
+        return 0
+
+    def get_line_counts(self):
+        """
+        Gets running line counts, ordered by Geometry line type
+        :return: column, row, diagonal and anti-diagonal count lists
+        """
+        return self.col_counts, self.row_counts, self.diag_counts, self.anti_counts
+
+    def count_lines(self):
+        """
+        Counts pieces on every line by rescanning the bitboards, in the order of get_line_counts
+        :return: column, row, diagonal and anti-diagonal count lists
+        """
+        occupied = self.bits1 | self.bits2
+        return ([(occupied & m).bit_count() for m in self.geometry.col_masks],
+                [(occupied & m).bit_count() for m in self.geometry.row_masks],
+                [(occupied & m).bit_count() for m in self.geometry.diag_masks],
+                [(occupied & m).bit_count() for m in self.geometry.anti_masks])
+
+    def check_counts(self):
+        """
+        Checks running line counts and groups against a full rescan
+        :return: true if counts and groups are consistent
+        """
+        return self.count_lines() == self.get_line_counts() and \
+            sorted(self.geometry.find_groups(self.bits1)) == sorted(self.groups1) and \
+            sorted(self.geometry.find_groups(self.bits2)) == sorted(self.groups2)
+
     def change_cell(self, r, c, p):
         """
         Changes piece occupying particular cell
@@ -72,4 +284,101 @@ class Board:
         :param c: column position
         :param p: new piece
         """
-        self.grid[r][c] = p
+        i = self.geometry.index(r, c)
+        bit = 1 << i
+        old = self.get_cell(r, c)
+        if p != self.piece1 and p != self.piece2:
+            p = EMPTY
+        if old == p:
+            return
+        if old == self.piece1:
+            self.bits1 ^= bit
+            self.groups1 = self.remove_from_groups(self.groups1, i)
+            self.hash ^= self.geometry.zobrist1[i]
+        elif old == self.piece2:
+            self.bits2 ^= bit
+            self.groups2 = self.remove_from_groups(self.groups2, i)
+            self.hash ^= self.geometry.zobrist2[i]
+        if p == self.piece1:
+            self.bits1 |= bit
+            self.groups1 = self.add_to_groups(self.groups1, i)
+            self.hash ^= self.geometry.zobrist1[i]
+        elif p == self.piece2:
+            self.bits2 |= bit
+            self.groups2 = self.add_to_groups(self.groups2, i)
+            self.hash ^= self.geometry.zobrist2[i]
+        if old == EMPTY:
+            self.update_counts(r, c, 1)
+        elif p == EMPTY:
+            self.update_counts(r, c, -1)
+        if self.grid is not None:
+            self.grid[r][c] = p
+
+    def update_counts(self, r, c, delta):
+        """
+        Adjusts counts of every line through a cell
+        :param r: row position
+        :param c: column position
+        :param delta: change in piece count
+        """
+        self.row_counts[r] += delta
+        self.col_counts[c] += delta
+        self.diag_counts[self.geometry.diag_index(r, c)] += delta
+        self.anti_counts[self.geometry.anti_index(r, c)] += delta
+        if self.debug and not self.check_counts():
+            raise RuntimeError("Line counts out of step at " + str(r) + "," + str(c) + ".")
+
+    def add_to_groups(self, groups, i):
+        """
+        Merges a new piece with every group it touches
+        :param groups: list of group bitboards
+        :param i: bit index of new piece
+        :return: updated list of groups
+        """
+        neighbors = self.geometry.neighbor_masks[i]
+        merged = 1 << i
+        kept = []
+        for g in groups:
+            if g & neighbors:
+                merged |= g
+            else:
+                kept.append(g)
+        kept.append(merged)
+        return kept
+
+    def remove_from_groups(self, groups, i):
+        """
+        Removes a piece from its group, splitting the group if needed
+        :param groups: list of group bitboards
+        :param i: bit index of removed piece
+        :return: updated list of groups
+        """
+        bit = 1 << i
+        kept = []
+        for g in groups:
+            if not g & bit:
+                kept.append(g)
+                continue
+            rest = g ^ bit
+            if not rest:
+                continue
+            if (rest & self.geometry.neighbor_masks[i]).bit_count() == 1:
+                kept.append(rest)
+            else:
+                kept.extend(self.geometry.find_groups(rest))
+        return kept
+
+    def move_piece(self, r1, c1, r2, c2):
+        """
+        Moves piece, removing any piece at the target
+        :param r1: row position of piece
+        :param c1: column position of piece
+        :param r2: row position of target
+        :param c2: column position of target
+        :return: piece that was captured, EMPTY if none
+        """
+        piece = self.get_cell(r1, c1)
+        captured = self.get_cell(r2, c2)
+        self.change_cell(r1, c1, EMPTY)
+        self.change_cell(r2, c2, piece)
+        return captured
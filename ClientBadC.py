@@ -32,20 +32,16 @@ def get_computer_move(player, move):
     """
     Gets a random, legal move for computer player
     :param player: which player computer represents, for move legality
-    :param move: Move object, checks move legality
-    :return: computer's move if random move is legal, recursive call otherwise
+    :param move: Move object, generates legal moves
+    :return: computer's move, empty list if no move is legal
     """
-    r1 = random.randint(0, (ROWS - 1))
-    c1 = random.randint(0, (COLS - 1))
-    r2 = random.randint(0, (ROWS - 1))
-    c2 = random.randint(0, (COLS - 1))
-    while 1:
-        if move.legal_move(player, r1, c1, r2, c2) == "Legal":
-            a = [r1, c1, r2, c2]
-            untranslate(a)
-            return a
-        else:
-            return get_computer_move(player, move)
+    moves = list(move.generate_moves(player))
+    if not moves:
+        return []
+    a = list(random.choice(moves))
+    untranslate(a)
+    return a
+
 
 def untranslate(a):
     """
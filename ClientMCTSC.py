@@ -0,0 +1,101 @@
+"""
+Lines of Action computer client
+Extends SuperClient
+Searches with Monte Carlo tree search, always answering within its
+time budget. With more than one worker, each process of a
+ParallelSearch pool grows its own tree and their root visits are
+added up. Given an OpeningBook, plays the book move without
+searching while the position is in the book.
+
+Starbuck Beagley
+"""
+import random
+from SuperClient import SuperClient
+from Protocol import MAX_MOVE_TIME
+import MCTS
+import ParallelSearch
+import OpeningBook
+
+ORD_A = 65
+TIME_FRACTION = 0.8
+
+
+class ClientMCTSC(SuperClient):
+    def __init__(self, num, time_limit=MAX_MOVE_TIME, progressive_bias=True, show_stats=False, workers=1,
+                 book=None, book_random=False, seed=None):
+        """
+        Constructor
+        :param num: player number
+        :param time_limit: most seconds per move, less if the server's clock gives less
+        :param progressive_bias: true to steer the search with a heuristic move score
+        :param show_stats: true to print search stats after each move
+        :param workers: number of search processes, 1 to search in this process
+        :param book: opening book file to play from before searching, None for no book
+        :param book_random: true to pick book moves in proportion to their points, false for the most points
+        :param seed: seed for the random playouts, None for a random one
+        """
+        SuperClient.__init__(self, num)
+        self.time_limit = time_limit
+        self.show_stats = show_stats
+        if workers > 1:
+            self.pool = ParallelSearch.SearchPool(ParallelSearch.MCTS_TREES, workers,
+                                                  progressive_bias=progressive_bias, seed=seed)
+        else:
+            self.pool = None
+        self.search = MCTS.MCTS(self.board, progressive_bias, seed=seed)
+        self.book = OpeningBook.OpeningBook(book) if book is not None else None
+        self.book_random = book_random
+
+    def next_move(self):
+        """
+        Gets move from player
+        :return: player move as list, empty list if no move is legal
+        """
+        if self.book is not None:
+            m = self.book.lookup(self.board, self.move, self.player, random if self.book_random else None)
+            if m is not None:
+                a = list(m)
+                untranslate(a)
+                return a
+        budget = self.time_budget(self.time_limit) * TIME_FRACTION
+        if self.pool is None:
+            m = self.search.best_move(budget)
+        elif not any(True for move in self.move.generate_moves(self.player)):
+            m = None
+        else:
+            m = self.pool.best_move(self.board, self.player, budget)
+            if m is None:
+                m = self.search.best_move(0)
+        if self.show_stats:
+            print("Search: " + MCTS.format_stats(self.get_stats()))
+        if m is None:
+            return []
+        a = list(m)
+        untranslate(a)
+        return a
+
+    def get_stats(self):
+        """
+        Gets stats of the last search: playouts, playouts per second, tree size and memory
+        :return: dict of stats
+        """
+        if self.pool is not None:
+            return self.pool.get_stats()
+        return self.search.get_stats()
+
+    def close(self):
+        """ Stops search processes, if any, and unmaps the opening book """
+        if self.pool is not None:
+            self.pool.close()
+        if self.book is not None:
+            self.book.close()
+
+
+def untranslate(a):
+    """
+    Server expects ord-char-ord-char format
+    :param a: list of number-only coordinates
+    :return: coordinate string where rows are letters
+    """
+    a[1] = str(chr(ORD_A + a[1]))
+    a[3] = str(chr(ORD_A + a[3]))
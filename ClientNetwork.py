@@ -4,13 +4,30 @@ Starbuck Beagley
 
 Socket messages sent to the server are lists with two elements.
 The first element is a code. The second element is either a list
-of coordinates for a move or an empty string.
+of coordinates for a move or an empty string. The INIT message
+also carries the board size and the player's rating, which the
+server uses to pair remote players.
 
 Socket messages received from the server are lists with three
 elements. The first element is a code. The second element is
 a list of coordinates for a move, a message, or an empty string.
 The third element is the board state.
 
+Move requests may also carry the time the player has for the move
+and the time left on their clock, which computer players budget
+their search from.
+
+The client asks for delta updates in its INIT message, so move
+requests and move-was messages carry a hash of the position instead
+of the board state. The local boards are checked against the hash
+before each move; if they differ, the client sends RESYNC_MESS and
+the server repeats the request with the full board.
+
+Messages are length-prefixed by Transport.FramedSocket, so one
+read never has to hold exactly one message, and encoded with the
+binary protocol in Protocol.BinaryCodec. Received messages are
+decoded back into the lists described above.
+
 Socket codes:
     0: Initialize (gets remote player if needed)
     1: Player 1 move request
@@ -20,15 +37,19 @@ Socket codes:
     5: Player win
     6: Error
     7: Quit
+    10: Resync (local board does not match position hash)
 """
 
 import socket
 import argparse
-import pickle
 import time
+import Transport
+import Protocol
 import ClientH
 import ClientBadC
 import ClientOkayC
+import ClientSearchC
+import ClientMCTSC
 import ClientF
 import Display
 
@@ -42,6 +63,7 @@ ERR_MESS = 6
 QUIT_MESS = 7
 CONTINUE_GAME = 8
 END_GAME = 9
+RESYNC_MESS = 10
 
 P1 = 1
 P2 = 2
@@ -53,6 +75,7 @@ CONT_IT = 0
 NEXT_IT = 1
 ORD_A = 65
 PORT_NUM = 7667
+MAX_RATING = 65535
 TIME_DELAY = 0.1
 
 
@@ -61,9 +84,18 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("-c", "--bad_computer_opponent", help="bad computer opponent is desired", action="store_true")
     parser.add_argument("-o", "--okay_computer_opponent", help="okay computer opponent is desired", action="store_true")
+    parser.add_argument("-s", "--search_computer_opponent", help="alpha-beta search computer opponent is desired",
+                        action="store_true")
+    parser.add_argument("-m", "--mcts_computer_opponent", help="Monte Carlo tree search computer opponent is desired",
+                        action="store_true")
     parser.add_argument("-r", "--remote_opponent", help="remote opponent is desired", action="store_true")
     parser.add_argument("-f", "--forgiving", help="warnings for invalid moves", action="store_true")
     parser.add_argument("-a", "--ai_battle", help="computer plays against computer", action="store_true")
+    parser.add_argument("-e", "--rating", help="rating used to pair with a remote opponent",
+                        type=rating, default=0)
+    parser.add_argument("-w", "--workers", help="processes each search computer player searches with",
+                        type=positive, default=1)
+    parser.add_argument("-b", "--book", help="opening book file for search computer players")
     args = parser.parse_args()
 
     display = Display.Display(ROWS, COLS)
@@ -76,6 +108,9 @@ def main():
     except ConnectionRefusedError as err:
         print("Error: " + err.strerror)
         return 0
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock = Transport.FramedSocket(sock)
+    sock.codec = Protocol.BinaryCodec(ROWS, COLS)
 
     check_input_args = check_args(args, sock)
 
@@ -101,32 +136,71 @@ def main():
         game_id = set_user_clients[3]
         ai_battle = set_user_clients[4]
 
-    single_local_player_number = print_welcome(client1, opponent_is_remote, display, game_id, msg, ai_battle)
-
-    while 1:
-        msg = from_server(sock)
-        if msg[0] == P1_MOVE_REQ or msg[0] == P2_MOVE_REQ:
-            if player_move_req(sock, client1, client2, opponent_is_computer, ai_battle, msg) == NEXT_IT:
-                continue
-        elif msg[0] == P1_MOVE_WAS or msg[0] == P2_MOVE_WAS:
-            player_move_was(client1, client2, opponent_is_computer, opponent_is_remote,
-                            single_local_player_number, display, msg, ai_battle)
-        elif msg[0] == WIN_MESS or msg[0] == ERR_MESS or msg[0] == QUIT_MESS:
-            if msg[0] == WIN_MESS:
-                display.show_board(msg[2])
-                print("")
-                if ai_battle:
-                    print("Computer ", end="")
-            print(msg[1])
-            break
-        else:
-            print("Received unexpected message from server. Quitting.")
-            break
-
-    sock.close()
+    try:
+        if len(msg) > 4:
+            check_sync(sock, client1, client2, msg[4], P1)
+
+        single_local_player_number = print_welcome(client1, opponent_is_remote, display, game_id, msg, ai_battle)
+
+        while 1:
+            msg = from_server(sock)
+            if msg[0] == P1_MOVE_REQ or msg[0] == P2_MOVE_REQ:
+                if check_sync(sock, client1, client2, msg[2], msg[0]) == NEXT_IT:
+                    continue
+                if player_move_req(sock, client1, client2, opponent_is_computer, ai_battle, msg) == NEXT_IT:
+                    continue
+            elif msg[0] == P1_MOVE_WAS or msg[0] == P2_MOVE_WAS:
+                player_move_was(client1, client2, opponent_is_computer, opponent_is_remote,
+                                single_local_player_number, display, msg, ai_battle)
+            elif msg[0] == WIN_MESS or msg[0] == ERR_MESS or msg[0] == QUIT_MESS:
+                if msg[0] == WIN_MESS:
+                    display.show_board(msg[2])
+                    print("")
+                    if ai_battle:
+                        print("Computer ", end="")
+                print(msg[1])
+                break
+            else:
+                print("Received unexpected message from server. Quitting.")
+                break
+    finally:
+        for client in (client1, client2):
+            if client is not None:
+                client.close()
+        sock.close()
     return 0
 
 
+def rating(value):
+    """
+    Parses rating argument, which is sent as two bytes
+    :param value: argument string
+    :return: rating from 0 to MAX_RATING
+    """
+    try:
+        r = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid int value: '" + value + "'")
+    if r < 0 or r > MAX_RATING:
+        raise argparse.ArgumentTypeError("rating must be from 0 to " + str(MAX_RATING))
+    return r
+
+
+def positive(value):
+    """
+    Parses argument that must be at least 1
+    :param value: argument string
+    :return: int value
+    """
+    try:
+        n = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid int value: '" + value + "'")
+    if n < 1:
+        raise argparse.ArgumentTypeError("must be at least 1")
+    return n
+
+
 def to_server(sock, resp, pause):
     """
     Sends message to server
@@ -136,7 +210,7 @@ def to_server(sock, resp, pause):
     """
     time.sleep(pause)
     try:
-        sock.sendall(pickle.dumps(resp))
+        sock.send(sock.codec.encode(resp))
         return [CONTINUE_GAME, ""]
     except OSError as err:
         try:
@@ -153,7 +227,13 @@ def from_server(sock):
     :return: message from server
     """
     try:
-        return pickle.loads(sock.recv(BUFF_SIZE))
+        return sock.codec.decode(sock.recv())
+    except Protocol.ProtocolError as err:
+        try:
+            sock.close()
+        except OSError:
+            pass
+        return [ERR_MESS, "Error: " + str(err)]
     except OSError as err:
         try:
             sock.close()
@@ -162,6 +242,29 @@ def from_server(sock):
         return [ERR_MESS, "Error: " + err.strerror]
 
 
+def check_sync(sock, client1, client2, position, side):
+    """
+    Checks local boards against the position sent by the server,
+    asking for the full board if a position hash does not match
+    :param sock: server socket
+    :param client1: client 1
+    :param client2: client 2 (None if opponent is remote)
+    :param position: position hash from a delta update, or full board
+    :param side: number of player to move
+    :return: NEXT_IT if full board was requested, CONT_IT otherwise
+    """
+    for client in (client1, client2):
+        if client is None:
+            continue
+        if isinstance(position, int):
+            if not client.in_sync(position):
+                to_server(sock, [RESYNC_MESS], 0)
+                return NEXT_IT
+        elif client.board.get_grid() != position:
+            client.resync(position, side)
+    return CONT_IT
+
+
 def player_move_req(sock, client1, client2, opponent_is_computer, ai_battle, msg):
     """
     Handles requests for player moves from server
@@ -173,6 +276,9 @@ def player_move_req(sock, client1, client2, opponent_is_computer, ai_battle, msg
     :param msg: message from server
     :return: NEXT_IT if continue needed in main while loop, CONT_IT otherwise
     """
+    for client in (client1, client2):
+        if client is not None:
+            client.set_time(msg[3] if len(msg) > 3 else None, msg[4] if len(msg) > 4 else None)
     if msg[0] == P1_MOVE_REQ:
         print_move_req(P1, "x", ai_battle)
         l = client1.next_move()
@@ -254,10 +360,12 @@ def check_args(args, sock):
     """
     opponent_is_computer = False
     opponent_is_remote = False
-    if args.bad_computer_opponent and args.okay_computer_opponent:
+    computer_opponents = [args.bad_computer_opponent, args.okay_computer_opponent, args.search_computer_opponent,
+                          args.mcts_computer_opponent]
+    if computer_opponents.count(True) > 1:
         sock.close()
         return [ERR_MESS, "Can only have one type of computer opponent!"]
-    elif args.bad_computer_opponent or args.okay_computer_opponent:
+    elif True in computer_opponents:
         if not args.ai_battle:
             opponent_is_computer = True
         if args.remote_opponent:
@@ -265,13 +373,13 @@ def check_args(args, sock):
             return [ERR_MESS, "Cannot have both computer and remote opponents!"]
 
     if args.remote_opponent:
-        resp = [INIT, True]
+        resp = [INIT, True, True, ROWS, args.rating]
         if not args.ai_battle:
             opponent_is_remote = True
         print("Waiting for opponent...")
         print("")
     else:
-        resp = [INIT, False]
+        resp = [INIT, False, True, ROWS, args.rating]
 
     check = to_server(sock, resp, 0)
 
@@ -289,10 +397,17 @@ def set_clients(msg, args):
     :return: 
     """
     ai_battle = False
-    if msg[0] != 0:
+    if msg[0] == ERR_MESS:
+        return [ERR_MESS, msg[1]]
+    elif msg[0] != 0:
         return [ERR_MESS, "Received unexpected message from server. Quitting."]
     elif args.ai_battle:
-        client1 = ClientOkayC.ClientOkayC(1)
+        if args.search_computer_opponent:
+            client1 = ClientSearchC.ClientSearchC(1, workers=args.workers, book=args.book)
+        elif args.mcts_computer_opponent:
+            client1 = ClientMCTSC.ClientMCTSC(1, show_stats=True, workers=args.workers, book=args.book)
+        else:
+            client1 = ClientOkayC.ClientOkayC(1)
         ai_battle = True
     elif args.forgiving:
         client1 = ClientF.ClientF(msg[1])
@@ -303,7 +418,18 @@ def set_clients(msg, args):
     client1.initialize()
 
     if args.ai_battle:
-        client2 = ClientOkayC.ClientOkayC(2)
+        if args.search_computer_opponent:
+            client2 = ClientSearchC.ClientSearchC(2, workers=args.workers, book=args.book)
+        elif args.mcts_computer_opponent:
+            client2 = ClientMCTSC.ClientMCTSC(2, show_stats=True, workers=args.workers, book=args.book)
+        else:
+            client2 = ClientOkayC.ClientOkayC(2)
+        client2.initialize()
+    elif args.search_computer_opponent:
+        client2 = ClientSearchC.ClientSearchC(2, workers=args.workers, book=args.book)
+        client2.initialize()
+    elif args.mcts_computer_opponent:
+        client2 = ClientMCTSC.ClientMCTSC(2, show_stats=True, workers=args.workers, book=args.book)
         client2.initialize()
     elif args.okay_computer_opponent:
         client2 = ClientOkayC.ClientOkayC(2)
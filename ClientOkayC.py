@@ -32,50 +32,44 @@ class ClientOkayC(SuperClient):
 
 def get_computer_move(player, move):
     """
-    Tries moving a piece closer to the center of the board, tries random moves if this strategy fails
+    Tries moving a piece closer to the center of the board, then onto a center ring from anywhere,
+    picks a random move if both strategies fail
     :param player: which player computer represents, for move legality
-    :param move: Move object, checks move legality
-    :return: computer's move
+    :param move: Move object, generates legal moves
+    :return: computer's move, empty list if no move is legal
     """
-    row_list = []
-    col_list = []
-    for i in range(0, int((ROWS / 2))):
-        r = [i, (ROWS - i)]
-        random.shuffle(r)
-        for j in range(0, 2):
-            row_list.append(r[j])
-        random.shuffle(r)
-        for j in range(0, 2):
-            col_list.append(r[j])
-    for r1 in row_list:
-        for c1 in col_list:
-            for r2 in range(MID1, MID2 + 1):
-                for c2 in range(MID1, MID2 + 1):
-                    if move.legal_move(player, r1, c1, r2, c2) == "Legal":
-                        a = [r1, c1, r2, c2]
-                        untranslate(a)
-                        return a
-            for r2 in range(MID1 - 1, MID2 + 2, 3):
-                for c2 in range(MID1 - 1, MID2 + 2, 3):
-                    if move.legal_move(player, r1, c1, r2, c2) == "Legal":
-                        a = [r1, c1, r2, c2]
-                        untranslate(a)
-                        return a
-            for r2 in range(MID1 - 2, MID2 + 3, 5):
-                for c2 in range(MID1 - 2, MID2 + 3, 5):
-                    if move.legal_move(player, r1, c1, r2, c2) == "Legal":
-                        a = [r1, c1, r2, c2]
-                        untranslate(a)
-                        return a
-    while 1:
-        r1 = random.randint(0, (ROWS - 1))
-        c1 = random.randint(0, (COLS - 1))
-        r2 = random.randint(0, (ROWS - 1))
-        c2 = random.randint(0, (COLS - 1))
-        if move.legal_move(player, r1, c1, r2, c2) == "Legal":
-            a = [r1, c1, r2, c2]
-            untranslate(a)
-            return a
+    moves = list(move.generate_moves(player))
+    if not moves:
+        return []
+    random.shuffle(moves)
+    targets = [range(MID1, MID2 + 1), range(MID1 - 1, MID2 + 2, 3), range(MID1 - 2, MID2 + 3, 5)]
+    for closer in (True, False):
+        for t in targets:
+            best = None
+            for m in moves:
+                if m[2] not in t or m[3] not in t:
+                    continue
+                if closer and center_distance(m[2], m[3]) >= center_distance(m[0], m[1]):
+                    continue
+                if best is None or center_distance(m[0], m[1]) > center_distance(best[0], best[1]):
+                    best = m
+            if best is not None:
+                a = list(best)
+                untranslate(a)
+                return a
+    a = list(moves[0])
+    untranslate(a)
+    return a
+
+
+def center_distance(r, c):
+    """
+    Gets how many rings a cell is from the center of the board
+    :param r: row position
+    :param c: column position
+    :return: ring distance
+    """
+    return max(abs(2 * r - (ROWS - 1)), abs(2 * c - (COLS - 1))) // 2
 
 
 def untranslate(a):
@@ -0,0 +1,94 @@
+"""
+Lines of Action computer client
+Extends SuperClient
+Searches with alpha-beta and iterative deepening, always answering
+within its time budget. With more than one worker, the root moves
+are split across a ParallelSearch pool of processes. Given an
+OpeningBook, plays the book move without searching while the
+position is in the book.
+
+Starbuck Beagley
+"""
+import random
+from SuperClient import SuperClient
+from Protocol import MAX_MOVE_TIME
+import Search
+import TransTable
+import ParallelSearch
+import OpeningBook
+
+ORD_A = 65
+TIME_FRACTION = 0.8
+
+
+class ClientSearchC(SuperClient):
+    def __init__(self, num, time_limit=MAX_MOVE_TIME, table_mb=TransTable.DEFAULT_MB,
+                 table_policy=TransTable.DEPTH_PREFERRED, workers=1, book=None, book_random=False):
+        """
+        Constructor
+        :param num: player number
+        :param time_limit: most seconds per move, less if the server's clock gives less
+        :param table_mb: transposition table memory cap in megabytes (per worker), 0 for no table
+        :param table_policy: transposition table replacement policy
+        :param workers: number of search processes, 1 to search in this process
+        :param book: opening book file to play from before searching, None for no book
+        :param book_random: true to pick book moves in proportion to their points, false for the most points
+        """
+        SuperClient.__init__(self, num)
+        self.time_limit = time_limit
+        if workers > 1:
+            self.pool = ParallelSearch.SearchPool(ParallelSearch.ALPHA_BETA, workers, table_mb, table_policy)
+            table = None
+        else:
+            self.pool = None
+            if table_mb > 0:
+                table = TransTable.TransTable(table_mb, table_policy)
+            else:
+                table = None
+        self.search = Search.Search(self.move, table)
+        self.book = OpeningBook.OpeningBook(book) if book is not None else None
+        self.book_random = book_random
+
+    def next_move(self):
+        """
+        Gets move from player
+        :return: player move as list, empty list if no move is legal
+        """
+        if self.book is not None:
+            m = self.book.lookup(self.board, self.move, self.player, random if self.book_random else None)
+            if m is not None:
+                a = list(m)
+                untranslate(a)
+                return a
+        budget = self.time_budget(self.time_limit) * TIME_FRACTION
+        if self.pool is None:
+            m = self.search.best_move(self.player, budget)
+        else:
+            moves = self.search.order_moves(self.player, list(self.move.generate_moves(self.player)), None)
+            if not moves:
+                return []
+            m = self.pool.best_move(self.board, self.player, budget, moves)
+            if m is None:
+                m = moves[0]
+        if m is None:
+            return []
+        a = list(m)
+        untranslate(a)
+        return a
+
+    def close(self):
+        """ Stops search processes, if any, and unmaps the opening book """
+        if self.pool is not None:
+            self.pool.close()
+        if self.book is not None:
+            self.book.close()
+
+
+def untranslate(a):
+    """
+    Server expects ord-char-ord-char format
+    :param a: list of number-only coordinates
+    :return: coordinate string where rows are letters
+    """
+    a[1] = str(chr(ORD_A + a[1]))
+    a[3] = str(chr(ORD_A + a[3]))
@@ -0,0 +1,105 @@
+"""
+Game clock
+
+Each player has a bank of time that runs down while the server
+waits for their move, plus an optional Fischer increment added
+after every move made in time. A per-move limit can be set as well;
+with no bank, the per-move limit alone applies, which is how the
+server has always timed moves.
+
+The server uses time_left to set the deadline on the wait for a
+move, so a player who never answers loses exactly when their time
+runs out rather than whenever they next send something.
+
+Starbuck Beagley
+"""
+import time
+
+NO_LIMIT = None
+
+
+class Clock:
+    def __init__(self, initial=NO_LIMIT, increment=0, move_limit=NO_LIMIT):
+        """
+        Constructor
+        :param initial: seconds in each player's bank, NO_LIMIT for no bank
+        :param increment: seconds added to the bank after each move made in time
+        :param move_limit: most seconds any one move may take, NO_LIMIT for none
+        """
+        self.initial = initial
+        self.increment = increment
+        self.move_limit = move_limit
+        self.remaining = {1: initial, 2: initial}
+        self.started = None
+        self.deadline = None
+
+    def start(self, player):
+        """
+        Starts player's clock
+        :param player: player number
+        """
+        self.started = time.monotonic()
+        allowed = self.allowed(player)
+        self.deadline = None if allowed is NO_LIMIT else self.started + allowed
+
+    def allowed(self, player):
+        """
+        Gets time player may take for the next move
+        :param player: player number
+        :return: seconds, NO_LIMIT if unlimited
+        """
+        bank = self.remaining[player]
+        if bank is NO_LIMIT:
+            return self.move_limit
+        elif self.move_limit is NO_LIMIT:
+            return bank
+        return min(bank, self.move_limit)
+
+    def time_left(self):
+        """
+        Gets time left before the running clock's deadline
+        :return: seconds, never negative, NO_LIMIT if unlimited
+        """
+        if self.deadline is None:
+            return NO_LIMIT
+        return max(self.deadline - time.monotonic(), 0.0)
+
+    def stop(self, player):
+        """
+        Stops player's clock, charging the time used to their bank
+        :param player: player number
+        :return: true if move was made in time, false otherwise
+        """
+        now = time.monotonic()
+        in_time = self.deadline is None or now <= self.deadline
+        if self.remaining[player] is not NO_LIMIT:
+            self.remaining[player] -= now - self.started
+            if in_time:
+                self.remaining[player] += self.increment
+        self.started = None
+        self.deadline = None
+        return in_time
+
+    def get_remaining(self, player):
+        """
+        Gets player's bank
+        :param player: player number
+        :return: seconds, NO_LIMIT if no bank
+        """
+        return self.remaining[player]
+
+
+def describe(initial, increment, move_limit):
+    """
+    Describes clock settings for the server log
+    :param initial: seconds in each player's bank, NO_LIMIT for no bank
+    :param increment: seconds added after each move
+    :param move_limit: most seconds per move, NO_LIMIT for none
+    :return: description
+    """
+    parts = []
+    if initial is not NO_LIMIT:
+        parts.append("%g s + %g s per move" % (initial, increment))
+    if move_limit is not NO_LIMIT:
+        parts.append("at most %g s per move" % move_limit)
+    return ", ".join(parts) if parts else "untimed"
@@ -0,0 +1,220 @@
+"""
+One game of Lines of Action, as played by the servers
+
+A GameSession holds a game's LOAServer, Clock and player to move,
+and decides what the clients are sent after each reply. It reads
+and writes no sockets, so ThreadedServer.py and AsyncServer.py
+share the rules, clock and metrics of a game. Settings for new
+games, pacing and the clock, are kept here as well.
+
+Starbuck Beagley
+"""
+import time
+import LOAServer
+import Clock
+import Metrics
+import Protocol
+
+P1_MOVE_REQ = 1
+P2_MOVE_REQ = 2
+P1_MOVE_WAS = 3
+P2_MOVE_WAS = 4
+ERR_MESS = 6
+QUIT_MESS = 7
+CONTINUE_GAME = 8
+END_GAME = 9
+RESYNC_MESS = 10
+
+P1 = 1
+P2 = 2
+
+TIME_DELAY = 0.5
+SHORT_DELAY = 0.1
+STOP_MESS = "Server shutting down."
+
+DEFAULT_CLOCK = (Clock.NO_LIMIT, 0, Protocol.MAX_MOVE_TIME)
+
+pacing = True
+clock_settings = DEFAULT_CLOCK
+log = Metrics.log
+
+
+class GameSession:
+    def __init__(self, game_id, remote_player, clock=None):
+        """
+        Constructor, starts game
+        :param game_id: unique game identifier
+        :param remote_player: true if players are on separate connections, false otherwise
+        :param clock: Clock for this game, defaults to one set up by set_clock
+        """
+        Metrics.games_started.inc()
+        log.info("Starting game #" + str(game_id))
+        self.game_id = game_id
+        self.remote_player = remote_player
+        self.game_server = LOAServer.LOAServer()
+        self.board = self.game_server.board
+        self.current_player = P1
+        if clock is None:
+            clock = Clock.Clock(*clock_settings)
+        self.clock = clock
+
+    def init_message(self, client_id, delta):
+        """
+        Gets INIT message for a client
+        :param client_id: which client will receive message
+        :param delta: true if client gets delta updates
+        :return: INIT message
+        """
+        return self.game_server.initialize_client(client_id, self.game_id, delta)
+
+    def mover(self, conn1, conn2):
+        """
+        Gets connection of player to move
+        :param conn1: connection for client 1
+        :param conn2: connection for client 2 (None if local game)
+        :return: conn1 or conn2
+        """
+        if self.current_player == P2 and self.remote_player:
+            return conn2
+        return conn1
+
+    def start_turn(self):
+        """ Starts clock of player to move """
+        log.debug("Game #" + str(self.game_id) + ": Current player is Player " + str(self.current_player) +
+                  ". Sending request for move.")
+        self.clock.start(self.current_player)
+
+    def move_request(self, delta):
+        """
+        Gets move request for player to move, with the time they have for the move and on their clock
+        :param delta: true to send position hash instead of full board
+        :return: move-request message
+        """
+        log.debug("Game #" + str(self.game_id) + ": Sending request to Player " + str(self.current_player) + ".")
+        return self.game_server.request_move(self.current_player, delta, self.clock.time_left(),
+                                             self.clock.get_remaining(self.current_player))
+
+    def time_left(self):
+        """
+        Gets seconds player to move has left to reply
+        :return: seconds, None if unlimited
+        """
+        return self.clock.time_left()
+
+    def out_of_time(self):
+        """
+        Gets error for player to move running out of time
+        :return: error message
+        """
+        return [ERR_MESS, "Player " + str(self.current_player) + " ran out of time"]
+
+    def needs_resync(self, msg):
+        """
+        Checks whether player to move asked for the full board
+        :param msg: player's reply to a move request
+        :return: true if the request should be sent again with the full board
+        """
+        if msg[0] != RESYNC_MESS:
+            return False
+        log.info("Game #" + str(self.game_id) + ": Player " + str(self.current_player) +
+                 " is out of sync. Sending full board.")
+        return True
+
+    def end_turn(self, msg):
+        """
+        Stops clock of player to move
+        :param msg: player's reply to the last move request
+        :return: reply, or error message if player could not resync or ran out of time
+        """
+        if msg[0] == RESYNC_MESS:
+            msg = [ERR_MESS, "Player " + str(self.current_player) + " could not resync"]
+        if not self.clock.stop(self.current_player) and msg[0] != ERR_MESS:
+            return self.out_of_time()
+        return msg
+
+    def play(self, msg):
+        """
+        Plays reply of player to move and decides what both clients are sent
+        :param msg: player's reply, or error message from the move request
+        :return: (CONTINUE_GAME or END_GAME,
+                  function of a client's delta flag giving its message, None to send nothing,
+                  seconds to pause before sending if pacing is on)
+        """
+        client_id = self.current_player
+        if msg[0] == QUIT_MESS:
+            log.info("Game #" + str(self.game_id) + ": Player " + str(client_id) + " quit.")
+            quit_msg = self.game_server.send_quit(client_id)
+            return END_GAME, lambda delta: quit_msg, SHORT_DELAY
+        elif msg[0] == ERR_MESS:
+            return self.error(client_id, msg[1])
+        elif msg[0] != client_id:
+            log.warning("Game #" + str(self.game_id) + ": Got unexpected message from player " + str(client_id) +
+                        ". Disconnecting.")
+            return END_GAME, None, 0
+
+        start = time.perf_counter()
+        try_move = self.game_server.evaluate_move(client_id, msg)
+        Metrics.evaluate_time.since(start)
+        if try_move[0] == ERR_MESS:
+            log.info("Game #" + str(self.game_id) + ": Illegal move from player " + str(client_id) +
+                     ". Disconnecting.")
+            err_msg = self.game_server.send_error(client_id, try_move[1])
+            return END_GAME, lambda delta: err_msg, TIME_DELAY
+
+        Metrics.moves.inc()
+        start = time.perf_counter()
+        player_won = self.game_server.check_win()
+        Metrics.check_win_time.since(start)
+        if player_won:
+            log.info("Game #" + str(self.game_id) + ": " + "Player " + str(player_won) + " wins!")
+            win_msg = self.game_server.send_win(player_won)
+            return END_GAME, lambda delta: win_msg, TIME_DELAY
+
+        if client_id == P1:
+            move_was = P1_MOVE_WAS
+        else:
+            move_was = P2_MOVE_WAS
+        self.current_player = 3 - client_id
+        return CONTINUE_GAME, lambda delta: self.game_server.send_move(move_was, msg, delta), TIME_DELAY
+
+    def error(self, client_num, err_str):
+        """
+        Ends game on an error, e.g. a lost connection
+        :param client_num: client who caused the error
+        :param err_str: error string
+        :return: (END_GAME, function giving the error message, SHORT_DELAY), as from play
+        """
+        log.warning("Game #" + str(self.game_id) + ": Error - " + str(err_str) + ". Disconnecting.")
+        err_msg = self.game_server.send_error(client_num, err_str)
+        return END_GAME, lambda delta: err_msg, SHORT_DELAY
+
+
+def paced(conns):
+    """
+    Checks whether to pause before sending to clients: always if one sends bare pickles,
+    since such a client cannot tell where one message ends and the next begins,
+    otherwise only if pacing is on
+    :param conns: connections about to be sent to, None for no connection
+    :return: true to pause
+    """
+    return pacing or any(conn is not None and conn.framed is False for conn in conns)
+
+
+def set_pacing(on):
+    """
+    Turns pauses between server messages on or off
+    :param on: true to pause, false to send as fast as possible
+    """
+    global pacing
+    pacing = on
+
+
+def set_clock(initial, increment, move_limit):
+    """
+    Sets clock used for new games
+    :param initial: seconds in each player's bank, Clock.NO_LIMIT for no bank
+    :param increment: seconds added to the bank after each move
+    :param move_limit: most seconds per move, Clock.NO_LIMIT for none
+    """
+    global clock_settings
+    clock_settings = (initial, increment, move_limit)
@@ -0,0 +1,179 @@
+"""
+Lines of Action board geometry
+
+Bit masks describing the lines of a board of a given size, and ray
+tables for walking them. Cell (r, c) maps to bit r * cols + c.
+Tables are built once per board size and shared by every board of
+that size.
+
+Tables indexed by a pair of cells use i1 * size + i2.
+
+Zobrist keys come from a fixed seed so that a position hashes to the
+same value in every process.
+
+Starbuck Beagley
+"""
+import random
+
+_geometries = {}
+ZOBRIST_SEED = 7667
+
+DIRECTIONS = [(-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (1, 1), (-1, 1), (1, -1)]
+NO_DIRECTION = -1
+COL_LINE = 0
+ROW_LINE = 1
+DIAG_LINE = 2
+ANTI_LINE = 3
+
+
+class Geometry:
+    def __init__(self, r, c):
+        """
+        Constructor
+        :param r: total rows
+        :param c: total columns
+        """
+        self.rows = r
+        self.cols = c
+        self.size = r * c
+        self.full = (1 << self.size) - 1
+        self.row_masks = [0] * r
+        self.col_masks = [0] * c
+        self.diag_masks = [0] * (r + c - 1)
+        self.anti_masks = [0] * (r + c - 1)
+        for rr in range(0, r):
+            for cc in range(0, c):
+                bit = 1 << (rr * c + cc)
+                self.row_masks[rr] |= bit
+                self.col_masks[cc] |= bit
+                self.diag_masks[self.diag_index(rr, cc)] |= bit
+                self.anti_masks[self.anti_index(rr, cc)] |= bit
+        self.not_first_col = self.full & ~self.col_masks[0]
+        self.not_last_col = self.full & ~self.col_masks[c - 1]
+        self.neighbor_masks = [self.dilate(1 << i) & ~(1 << i) for i in range(0, self.size)]
+        rng = random.Random(ZOBRIST_SEED * 1000003 + self.size)
+        self.zobrist1 = [rng.getrandbits(64) for i in range(0, self.size)]
+        self.zobrist2 = [rng.getrandbits(64) for i in range(0, self.size)]
+        self.zobrist_side = rng.getrandbits(64)
+        self.line_types = [COL_LINE, COL_LINE, ROW_LINE, ROW_LINE,
+                           DIAG_LINE, DIAG_LINE, ANTI_LINE, ANTI_LINE]
+        self.rays = []
+        self.directions = [NO_DIRECTION] * (self.size * self.size)
+        self.between_masks = [0] * (self.size * self.size)
+        for i in range(0, self.size):
+            rr = i // c
+            cc = i % c
+            cell_rays = []
+            for d in range(0, len(DIRECTIONS)):
+                dr, dc = DIRECTIONS[d]
+                ray = []
+                r2 = rr + dr
+                c2 = cc + dc
+                while 0 <= r2 < r and 0 <= c2 < c:
+                    j = r2 * c + c2
+                    self.directions[i * self.size + j] = d
+                    mask = 0
+                    for k in ray:
+                        mask |= 1 << k
+                    self.between_masks[i * self.size + j] = mask
+                    ray.append(j)
+                    r2 += dr
+                    c2 += dc
+                cell_rays.append(tuple(ray))
+            self.rays.append(cell_rays)
+
+    def index(self, r, c):
+        """
+        Gets bit index of cell
+        :param r: row position
+        :param c: column position
+        :return: bit index
+        """
+        return r * self.cols + c
+
+    def diag_index(self, r, c):
+        """
+        Gets index of the diagonal (top-left to bottom-right) through a cell
+        :param r: row position
+        :param c: column position
+        :return: diagonal index
+        """
+        return r - c + self.cols - 1
+
+    @staticmethod
+    def anti_index(r, c):
+        """
+        Gets index of the anti-diagonal (bottom-left to top-right) through a cell
+        :param r: row position
+        :param c: column position
+        :return: anti-diagonal index
+        """
+        return r + c
+
+    def line_count_index(self, d, r, c):
+        """
+        Gets index into the count list of the line a direction follows
+        :param d: direction index
+        :param r: row position
+        :param c: column position
+        :return: row, column, diagonal or anti-diagonal index
+        """
+        line_type = self.line_types[d]
+        if line_type == COL_LINE:
+            return c
+        elif line_type == ROW_LINE:
+            return r
+        elif line_type == DIAG_LINE:
+            return self.diag_index(r, c)
+        return self.anti_index(r, c)
+
+    def dilate(self, bits):
+        """
+        Grows a set of cells by one step in all 8 directions
+        :param bits: bitboard of cells
+        :return: bitboard of cells and their neighbors
+        """
+        horiz = bits | ((bits & self.not_last_col) << 1) | ((bits & self.not_first_col) >> 1)
+        return (horiz | (horiz << self.cols) | (horiz >> self.cols)) & self.full
+
+    def flood(self, seed, bits):
+        """
+        Finds every cell in bits connected to seed
+        :param seed: bitboard of starting cells
+        :param bits: bitboard of cells that may be filled
+        :return: bitboard of connected cells
+        """
+        region = seed & bits
+        while 1:
+            grown = self.dilate(region) & bits
+            if grown == region:
+                return region
+            region = grown
+
+    def find_groups(self, bits):
+        """
+        Splits a set of cells into connected groups
+        :param bits: bitboard of cells
+        :return: list of group bitboards
+        """
+        groups = []
+        while bits:
+            group = self.flood(bits & -bits, bits)
+            groups.append(group)
+            bits ^= group
+        return groups
+
+
+def get_geometry(r, c):
+    """
+    Gets shared geometry for board size, building it on first use
+    :param r: total rows
+    :param c: total columns
+    :return: Geometry object
+    """
+    key = (r, c)
+    geometry = _geometries.get(key)
+    if geometry is None:
+        geometry = Geometry(r, c)
+        _geometries[key] = geometry
+    return geometry
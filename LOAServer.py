@@ -2,6 +2,13 @@
 Lines of Action Server
 
 Creates messages for server to send to clients
+
+Clients that apply moves to their own board can ask for delta
+updates. Move requests and move-was messages to those clients carry
+the Zobrist hash of the position instead of the full grid; a client
+whose board does not match answers with RESYNC_MESS and gets the
+request again with the full grid. The INIT message and the
+end-of-game messages always carry the full grid.
     
 Starbuck Beagley
 """
@@ -18,6 +25,7 @@ P2_MOVE_WAS = 4
 WIN_MESS = 5
 ERR_MESS = 6
 QUIT_MESS = 7
+RESYNC_MESS = 10
 ROWS = 8
 COLS = 8
 
@@ -40,22 +48,34 @@ class LOAServer(AbstractServer):
         self.current_player = self.player1
         self.board.reset_board()
 
-    def initialize_client(self, client_id, game_id):
+    def initialize_client(self, client_id, game_id, delta=False):
         """
         Generates initial message to send to client
         :param client_id: which client will receive message
         :param game_id: unique game id
+        :param delta: true if client gets delta updates, so starts from a full snapshot
         :return: initial message for client
         """
+        if delta:
+            return [INIT, client_id, game_id, client_id, self.board.get_grid()]
         return [INIT, client_id, game_id, client_id]
 
-    def request_move(self, client_id):
+    def request_move(self, client_id, delta=False, move_time=None, bank=None):
         """
         Generates move-request message to send to client
         :param client_id: which client will receive message
+        :param delta: true to send position hash instead of full grid
+        :param move_time: seconds client has for the move, None if unlimited
+        :param bank: seconds left on client's clock, None if no clock
         :return: move-request message for client
         """
-        return [client_id, "", self.board.get_grid()]
+        if delta:
+            msg = [client_id, "", self.board.get_hash()]
+        else:
+            msg = [client_id, "", self.board.get_grid()]
+        if move_time is not None:
+            msg += [move_time, bank]
+        return msg
 
     def evaluate_move(self, client_id, msg):
         """
@@ -73,19 +93,24 @@ class LOAServer(AbstractServer):
                     return self.move.make_move(self.player2, a[0], a[1], a[2], a[3])
         return [ERR_MESS, "Incorrect move format."]
 
-    def send_move(self, client_id, msg):
+    def send_move(self, client_id, msg, delta=False):
         """
         Generates message informing client of most recent move
         :param client_id: who moved
         :param msg: the most recent move
+        :param delta: true to send position hash instead of full grid
         :return: recent-move message for client
         """
         a = []
         translate(msg[1], a, COLS)
+        if delta:
+            position = self.board.get_hash()
+        else:
+            position = self.board.get_grid()
         if client_id == P1_MOVE_WAS:
-            return [P1_MOVE_WAS, a, self.board.get_grid()]
+            return [P1_MOVE_WAS, a, position]
         else:
-            return [P2_MOVE_WAS, a, self.board.get_grid()]
+            return [P2_MOVE_WAS, a, position]
 
     def send_error(self, client_id, err_type):
         """
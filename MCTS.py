@@ -0,0 +1,429 @@
+"""
+Lines of Action Monte Carlo tree search
+
+UCT search over a tree of Nodes, with optional progressive bias: a
+heuristic score for each move, centralization plus a bonus for
+captures, that steers selection while a child has few visits and
+fades as its visits grow.
+
+Playouts run on a PlayoutBoard rather than Board. It keeps only the
+two bitboards and the line counts, and a move is a pair of bit
+indices, so there are no Player objects, groups, hash or message
+strings to maintain. Random playout moves are found by picking a
+random piece and direction and checking that one move, falling back
+to generating every move only when that keeps failing. A playout is
+cut off after PLAYOUT_DEPTH moves and the position is scored by
+centralization and group count instead of being played out.
+
+Values are kept from player 1's point of view during a playout and
+turned into wins for the player who made each node's move.
+
+Starbuck Beagley
+"""
+import math
+import random
+import sys
+import time
+
+EXPLORATION = 1.4
+BIAS_WEIGHT = 2.0
+CAPTURE_BONUS = 2
+PLAYOUT_DEPTH = 24
+RANDOM_TRIES = 16
+CENTRE_WEIGHT = 1.0
+GROUP_WEIGHT = 1.5
+DRAW = 0.5
+
+
+class PlayoutBoard:
+    def __init__(self, geometry):
+        """
+        Constructor
+        :param geometry: Geometry of the board size played
+        """
+        self.geometry = geometry
+        self.bits = [0, 0, 0]
+        self.counts = [[], [], [], []]
+        self.side = 1
+        cols = geometry.cols
+        rows = geometry.rows
+        self.cell_lines = [(i % cols, i // cols, geometry.diag_index(i // cols, i % cols),
+                            geometry.anti_index(i // cols, i % cols)) for i in range(0, geometry.size)]
+        self.centre_distance = [max(abs(2 * (i // cols) - (rows - 1)), abs(2 * (i % cols) - (cols - 1))) // 2
+                                for i in range(0, geometry.size)]
+
+    def set_board(self, board):
+        """
+        Copies position from a Board
+        :param board: Board to copy
+        """
+        self.bits = [0, board.bits1, board.bits2]
+        self.counts = [list(line) for line in board.get_line_counts()]
+        self.side = board.get_side()
+
+    def copy_from(self, other):
+        """
+        Copies position from another PlayoutBoard
+        :param other: PlayoutBoard to copy
+        """
+        self.bits = list(other.bits)
+        self.counts = [list(line) for line in other.counts]
+        self.side = other.side
+
+    def play(self, i, j):
+        """
+        Moves a piece of the side to move, taking any opponent's piece at the target
+        :param i: bit index of piece
+        :param j: bit index of target
+        """
+        side = self.side
+        other = 3 - side
+        bits = self.bits
+        counts = self.counts
+        bits[side] ^= (1 << i) | (1 << j)
+        lines = self.cell_lines[i]
+        counts[0][lines[0]] -= 1
+        counts[1][lines[1]] -= 1
+        counts[2][lines[2]] -= 1
+        counts[3][lines[3]] -= 1
+        if (bits[other] >> j) & 1:
+            bits[other] ^= 1 << j
+        else:
+            lines = self.cell_lines[j]
+            counts[0][lines[0]] += 1
+            counts[1][lines[1]] += 1
+            counts[2][lines[2]] += 1
+            counts[3][lines[3]] += 1
+        self.side = other
+
+    def moves(self):
+        """
+        Generates every legal move for the side to move, as in Move.generate_moves
+        :return: list of (i, j) bit index pairs
+        """
+        geometry = self.geometry
+        size = geometry.size
+        line_types = geometry.line_types
+        between_masks = geometry.between_masks
+        counts = self.counts
+        own = self.bits[self.side]
+        opp = self.bits[3 - self.side]
+        moves = []
+        bits = own
+        while bits:
+            low = bits & -bits
+            bits ^= low
+            i = low.bit_length() - 1
+            lines = self.cell_lines[i]
+            rays = geometry.rays[i]
+            for d in range(0, 8):
+                line_type = line_types[d]
+                distance = counts[line_type][lines[line_type]]
+                ray = rays[d]
+                if distance <= len(ray):
+                    j = ray[distance - 1]
+                    if not (own >> j) & 1 and not opp & between_masks[i * size + j]:
+                        moves.append((i, j))
+        return moves
+
+    def random_move(self, rng):
+        """
+        Picks a random legal move for the side to move
+        :param rng: random.Random
+        :return: (i, j) bit index pair, None if side to move has no legal move
+        """
+        geometry = self.geometry
+        own = self.bits[self.side]
+        opp = self.bits[3 - self.side]
+        pieces = []
+        bits = own
+        while bits:
+            low = bits & -bits
+            bits ^= low
+            pieces.append(low.bit_length() - 1)
+        n = len(pieces)
+        for t in range(0, RANDOM_TRIES):
+            i = pieces[int(rng.random() * n)]
+            d = int(rng.random() * 8)
+            line_type = geometry.line_types[d]
+            distance = self.counts[line_type][self.cell_lines[i][line_type]]
+            ray = geometry.rays[i][d]
+            if distance <= len(ray):
+                j = ray[distance - 1]
+                if not (own >> j) & 1 and not opp & geometry.between_masks[i * geometry.size + j]:
+                    return i, j
+        moves = self.moves()
+        if not moves:
+            return None
+        return moves[int(rng.random() * len(moves))]
+
+    def connected(self, player):
+        """
+        Checks if a player's pieces form one group
+        :param player: player number
+        :return: true if connected
+        """
+        bits = self.bits[player]
+        return self.geometry.flood(bits & -bits, bits) == bits
+
+    def winner(self):
+        """
+        Checks for a win after a move; player 1 wins if both sides are connected, as in LOAServer.check_win
+        :return: winning player number, 0 if nobody has won
+        """
+        if self.connected(1):
+            return 1
+        elif self.connected(2):
+            return 2
+        return 0
+
+    def side_score(self, player):
+        """
+        Scores how far a player is from connecting, lower is better
+        :param player: player number
+        :return: score
+        """
+        bits = self.bits[player]
+        count = bits.bit_count()
+        centre = 0
+        b = bits
+        while b:
+            low = b & -b
+            b ^= low
+            centre += self.centre_distance[low.bit_length() - 1]
+        return CENTRE_WEIGHT * centre / count + GROUP_WEIGHT * len(self.geometry.find_groups(bits))
+
+    def estimate(self):
+        """
+        Estimates player 1's chance of winning from the current position
+        :return: value between 0 and 1
+        """
+        return 1 / (1 + math.exp(self.side_score(1) - self.side_score(2)))
+
+
+class Node:
+    __slots__ = ("move", "parent", "mover", "children", "untried", "visits", "wins", "bias", "winner")
+
+    def __init__(self, move, parent, mover, bias=0.0, winner=0):
+        """
+        Constructor
+        :param move: (i, j) move that led here, None at the root
+        :param parent: parent Node, None at the root
+        :param mover: number of player who made move
+        :param bias: heuristic score of move, for progressive bias
+        :param winner: player who has won at this node, 0 if nobody
+        """
+        self.move = move
+        self.parent = parent
+        self.mover = mover
+        self.children = []
+        self.untried = None
+        self.visits = 0
+        self.wins = 0.0
+        self.bias = bias
+        self.winner = winner
+
+
+NODE_BYTES = sys.getsizeof(Node(None, None, 1)) + sys.getsizeof([])
+MOVE_BYTES = sys.getsizeof((0, 0))
+
+
+class MCTS:
+    def __init__(self, board, progressive_bias=False, exploration=EXPLORATION, seed=None):
+        """
+        Constructor
+        :param board: Board to search from
+        :param progressive_bias: true to steer selection with a heuristic move score
+        :param exploration: UCT exploration constant
+        :param seed: random seed, None for a random one
+        """
+        self.board = board
+        self.geometry = board.get_geometry()
+        self.bias_weight = BIAS_WEIGHT if progressive_bias else 0.0
+        self.exploration = exploration
+        self.rng = random.Random(seed)
+        self.root_board = PlayoutBoard(self.geometry)
+        self.scratch = PlayoutBoard(self.geometry)
+        self.root = None
+        self.playouts = 0
+        self.elapsed = 0.0
+        self.nodes = 0
+        self.bytes = 0
+
+    def best_move(self, time_limit):
+        """
+        Runs playouts from the board's position until time runs out
+        :param time_limit: seconds the search may use
+        :return: most visited (r1, c1, r2, c2), None if side to move has no legal move
+        """
+        start = time.time()
+        deadline = start + time_limit
+        self.root_board.set_board(self.board)
+        self.root = Node(None, None, 3 - self.root_board.side)
+        self.nodes = 1
+        self.bytes = NODE_BYTES
+        self.playouts = 0
+        self.expand(self.root, self.root_board)
+        if not self.root.untried:
+            self.elapsed = time.time() - start
+            return None
+        while 1:
+            self.iterate()
+            self.playouts += 1
+            if time.time() >= deadline:
+                break
+        self.elapsed = time.time() - start
+        best = max(self.root.children, key=lambda n: n.visits)
+        cols = self.geometry.cols
+        return best.move[0] // cols, best.move[0] % cols, best.move[1] // cols, best.move[1] % cols
+
+    def iterate(self):
+        """ Selects a leaf, expands it, plays out from it and backs the result up """
+        board = self.scratch
+        board.copy_from(self.root_board)
+        node = self.root
+        while not node.winner:
+            if node.untried is None:
+                self.expand(node, board)
+            if node.untried:
+                node = self.add_child(node, board)
+                break
+            elif not node.children:
+                break
+            node = self.select(node)
+            board.play(*node.move)
+        if node.winner:
+            value = 1.0 if node.winner == 1 else 0.0
+        else:
+            value = self.playout(board)
+        while node is not None:
+            node.visits += 1
+            node.wins += value if node.mover == 1 else 1.0 - value
+            node = node.parent
+
+    def select(self, node):
+        """
+        Picks child with the best UCT value, plus progressive bias
+        :param node: fully expanded node
+        :return: child Node
+        """
+        log_visits = math.log(node.visits)
+        exploration = self.exploration
+        bias_weight = self.bias_weight
+        best = None
+        best_value = -1.0
+        for child in node.children:
+            value = child.wins / child.visits + exploration * math.sqrt(log_visits / child.visits)
+            if bias_weight:
+                value += bias_weight * child.bias / (child.visits + 1)
+            if value > best_value:
+                best_value = value
+                best = child
+        return best
+
+    def expand(self, node, board):
+        """
+        Lists node's moves, on its second visit so leaves hold no move list,
+        best first by heuristic if progressive bias is on
+        :param node: Node whose position is on board
+        :param board: PlayoutBoard
+        """
+        moves = board.moves()
+        if self.bias_weight:
+            moves.sort(key=lambda m: self.move_bias(board, m))
+        else:
+            self.rng.shuffle(moves)
+        node.untried = moves
+        self.bytes += 2 * sys.getsizeof(moves) + len(moves) * MOVE_BYTES
+
+    def add_child(self, node, board):
+        """
+        Plays one of node's untried moves on board and adds its child
+        :param node: Node whose position is on board
+        :param board: PlayoutBoard, left at the child's position
+        :return: child Node
+        """
+        move = node.untried.pop()
+        bias = self.move_bias(board, move) if self.bias_weight else 0.0
+        mover = board.side
+        board.play(*move)
+        child = Node(move, node, mover, bias, board.winner())
+        node.children.append(child)
+        self.nodes += 1
+        self.bytes += NODE_BYTES
+        return child
+
+    def move_bias(self, board, move):
+        """
+        Scores move by centralization and capture
+        :param board: PlayoutBoard before the move
+        :param move: (i, j) bit index pair
+        :return: heuristic score, higher is better
+        """
+        i, j = move
+        centre = board.centre_distance
+        score = centre[i] - centre[j]
+        if (board.bits[3 - board.side] >> j) & 1:
+            score += CAPTURE_BONUS
+        return score
+
+    def playout(self, board):
+        """
+        Plays random moves from board's position
+        :param board: PlayoutBoard, changed by the playout
+        :return: player 1's result, 1 for a win, 0 for a loss, between for an estimate
+        """
+        rng = self.rng
+        for ply in range(0, PLAYOUT_DEPTH):
+            move = board.random_move(rng)
+            if move is None:
+                return DRAW
+            board.play(move[0], move[1])
+            winner = board.winner()
+            if winner:
+                return 1.0 if winner == 1 else 0.0
+        return board.estimate()
+
+    def root_visits(self):
+        """
+        Gets visits and wins of every root move in the last search, for combining trees
+        :return: dict of (r1, c1, r2, c2) to (visits, wins)
+        """
+        cols = self.geometry.cols
+        visits = {}
+        if self.root is not None:
+            for child in self.root.children:
+                i, j = child.move
+                visits[(i // cols, i % cols, j // cols, j % cols)] = (child.visits, child.wins)
+        return visits
+
+    def tree_bytes(self):
+        """
+        Gets memory held by the tree, counted as nodes and move lists are made
+        :return: bytes used by nodes, their child lists and their moves
+        """
+        return self.bytes
+
+    def get_stats(self):
+        """
+        Gets stats of the last search
+        :return: dict of stats
+        """
+        return {
+            "playouts": self.playouts,
+            "seconds": self.elapsed,
+            "playouts_per_second": self.playouts / self.elapsed if self.elapsed else 0.0,
+            "tree_nodes": self.nodes,
+            "tree_bytes": self.tree_bytes(),
+        }
+
+
+def format_stats(stats):
+    """
+    Formats stats for display
+    :param stats: dict from MCTS.get_stats
+    :return: one-line summary
+    """
+    return ("%d playouts in %.2f s (%d/s), tree %d nodes, %.1f KB"
+            % (stats["playouts"], stats["seconds"], stats["playouts_per_second"], stats["tree_nodes"],
+               stats["tree_bytes"] / 1024))
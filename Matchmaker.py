@@ -0,0 +1,184 @@
+"""
+Matchmaking queue for remote games
+
+Players waiting for a remote opponent are kept in one deque per
+pairing key, so pairing and queueing are O(1). The key is the board
+size the player asked for and a rating band; players who give no
+rating are only paired with each other. A player is paired from
+their own band first, then from the bands on either side, and
+otherwise waits.
+
+The queue is shared by the threads that handle new connections, so
+every operation takes a lock.
+
+A player may disconnect while they wait. Connections must have an
+is_alive method that checks without blocking; dead ones are dropped
+and closed when pairing reaches them, and prune drops every dead one
+so the queue depth stays accurate. Servers call prune while idle.
+
+Starbuck Beagley
+"""
+from collections import deque
+import threading
+import time
+
+RATING_BAND = 200
+UNRATED = 0
+
+
+class Matchmaker:
+    def __init__(self, rating_band=RATING_BAND):
+        """
+        Constructor
+        :param rating_band: width of each rating band
+        """
+        self.rating_band = rating_band
+        self.queues = {}
+        self.lock = threading.Lock()
+        self.depth = 0
+        self.paired = 0
+        self.dropped = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def pair_key(self, size, rating):
+        """
+        Gets key of queue a player waits in
+        :param size: board size the player asked for
+        :param rating: player's rating, UNRATED if none
+        :return: (size, rating band), band None if unrated
+        """
+        if rating == UNRATED:
+            return size, None
+        return size, rating // self.rating_band
+
+    def candidate_keys(self, size, rating):
+        """
+        Gets keys of queues to take an opponent from, best first
+        :param size: board size the player asked for
+        :param rating: player's rating, UNRATED if none
+        :return: list of keys
+        """
+        key = self.pair_key(size, rating)
+        if key[1] is None:
+            return [key]
+        return [key, (size, key[1] - 1), (size, key[1] + 1)]
+
+    def pair(self, conn, game_ids, size, rating=UNRATED, since=None):
+        """
+        Pairs player with a waiting opponent, or queues player if there is none
+        :param conn: player's connection
+        :param game_ids: iterator of new game ids, used if player is queued
+        :param size: board size the player asked for
+        :param rating: player's rating, UNRATED if none
+        :param since: time.monotonic() when player's wait began, e.g. when accepted; defaults to now
+        :return: (game id, opponent's connection, seconds opponent waited) if paired,
+                 (new game id, None, 0) if queued
+        """
+        now = time.monotonic()
+        if since is None:
+            since = now
+        dead = []
+        try:
+            with self.lock:
+                for key in self.candidate_keys(size, rating):
+                    queue = self.queues.get(key)
+                    while queue:
+                        game_id, opp, opp_since = queue.popleft()
+                        self.depth -= 1
+                        if not queue:
+                            del self.queues[key]
+                        if not opp.is_alive():
+                            dead.append(opp)
+                            continue
+                        wait = now - opp_since
+                        self.paired += 1
+                        self.total_wait += wait
+                        self.max_wait = max(self.max_wait, wait)
+                        return game_id, opp, wait
+                game_id = next(game_ids)
+                self.queues.setdefault(self.pair_key(size, rating), deque()).append((game_id, conn, since))
+                self.depth += 1
+                return game_id, None, 0
+        finally:
+            self.drop(dead)
+
+    def prune(self):
+        """
+        Drops every waiting player whose connection has closed
+        :return: number of players dropped
+        """
+        dead = []
+        with self.lock:
+            for key in list(self.queues):
+                alive = deque()
+                for entry in self.queues[key]:
+                    if entry[1].is_alive():
+                        alive.append(entry)
+                    else:
+                        dead.append(entry[1])
+                if alive:
+                    self.queues[key] = alive
+                else:
+                    del self.queues[key]
+            self.depth -= len(dead)
+        self.drop(dead)
+        return len(dead)
+
+    def drop(self, dead):
+        """
+        Counts and closes connections of players who left the queue
+        :param dead: list of connections
+        """
+        if not dead:
+            return
+        with self.lock:
+            self.dropped += len(dead)
+        for conn in dead:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+    def queue_depth(self):
+        """
+        Gets number of players waiting
+        :return: queue depth
+        """
+        return self.depth
+
+    def waiting(self):
+        """
+        Removes every waiting player, e.g. when the server shuts down
+        :return: list of (game id, connection)
+        """
+        with self.lock:
+            players = [(entry[0], entry[1]) for queue in self.queues.values() for entry in queue]
+            self.queues = {}
+            self.depth = 0
+        return players
+
+    def stats(self):
+        """
+        Gets queue depth and wait-time stats
+        :return: dict of stats
+        """
+        with self.lock:
+            return {
+                "queue_depth": self.depth,
+                "queues": {key: len(queue) for key, queue in self.queues.items()},
+                "paired": self.paired,
+                "dropped": self.dropped,
+                "mean_wait": self.total_wait / self.paired if self.paired else 0.0,
+                "max_wait": self.max_wait,
+            }
+
+
+def format_stats(stats):
+    """
+    Formats stats for the server log
+    :param stats: dict from Matchmaker.stats
+    :return: one-line summary
+    """
+    return ("%d paired, mean wait %.2f s, max wait %.2f s, %d waiting, %d dropped"
+            % (stats["paired"], stats["mean_wait"], stats["max_wait"], stats["queue_depth"], stats["dropped"]))
@@ -0,0 +1,364 @@
+"""
+Server metrics and logging
+
+Counters, gauges and histograms for the game servers, kept in one
+registry and rendered in the Prometheus text format. serve_http
+exposes them on a local HTTP port (GET /metrics), so load can be
+watched while the server runs without parsing its log.
+
+Histograms use fixed buckets that double from 1 microsecond to
+about a minute, so an observation is one bisect and one increment.
+
+The logger replaces the servers' per-step print calls. Lines below
+the chosen level are dropped, and the rest are buffered and written
+in batches by a background thread, or at once for errors.
+
+Starbuck Beagley
+"""
+import atexit
+import bisect
+import http.server
+import os
+import sys
+import threading
+import time
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR}
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+BUFFER_LINES = 256
+FLUSH_INTERVAL = 0.5
+BUCKETS = [1e-6 * 2 ** i for i in range(0, 27)]
+METRICS_PATH = "/metrics"
+
+
+class Counter:
+    def __init__(self, name, description):
+        """
+        Constructor
+        :param name: metric name
+        :param description: help text
+        """
+        self.name = name
+        self.description = description
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, n=1):
+        """
+        Adds to counter
+        :param n: amount to add
+        """
+        with self.lock:
+            self.value += n
+
+    def render(self):
+        """
+        Renders counter
+        :return: list of text lines
+        """
+        return ["# HELP " + self.name + " " + self.description, "# TYPE " + self.name + " counter",
+                self.name + " " + str(self.value)]
+
+
+class Gauge:
+    def __init__(self, name, description):
+        """
+        Constructor
+        :param name: metric name
+        :param description: help text
+        """
+        self.name = name
+        self.description = description
+        self.value = 0
+        self.function = None
+
+    def set(self, value):
+        """
+        Sets gauge
+        :param value: new value
+        """
+        self.value = value
+
+    def set_function(self, function):
+        """
+        Reads gauge from a function each time it is rendered
+        :param function: function of no arguments returning the value
+        """
+        self.function = function
+
+    def render(self):
+        """
+        Renders gauge
+        :return: list of text lines
+        """
+        value = self.function() if self.function is not None else self.value
+        return ["# HELP " + self.name + " " + self.description, "# TYPE " + self.name + " gauge",
+                self.name + " " + str(value)]
+
+
+class Histogram:
+    def __init__(self, name, description, buckets=BUCKETS):
+        """
+        Constructor
+        :param name: metric name
+        :param description: help text
+        :param buckets: sorted upper bounds of buckets
+        """
+        self.name = name
+        self.description = description
+        self.bounds = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        """
+        Records one observation
+        :param value: observed value, e.g. seconds
+        """
+        i = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def since(self, start):
+        """
+        Records time elapsed since start
+        :param start: time.perf_counter() value
+        """
+        self.observe(time.perf_counter() - start)
+
+    def render(self):
+        """
+        Renders histogram with cumulative buckets
+        :return: list of text lines
+        """
+        with self.lock:
+            counts = list(self.counts)
+            total = self.sum
+            count = self.count
+        lines = ["# HELP " + self.name + " " + self.description, "# TYPE " + self.name + " histogram"]
+        cumulative = 0
+        for bound, n in zip(self.bounds, counts):
+            cumulative += n
+            lines.append(self.name + '_bucket{le="%g"} %d' % (bound, cumulative))
+        lines.append(self.name + '_bucket{le="+Inf"} %d' % count)
+        lines.append(self.name + "_sum %g" % total)
+        lines.append(self.name + "_count %d" % count)
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        """
+        Constructor
+        """
+        self.metrics = []
+
+    def counter(self, name, description):
+        """
+        Adds counter
+        :param name: metric name
+        :param description: help text
+        :return: Counter
+        """
+        return self.add(Counter(name, description))
+
+    def gauge(self, name, description):
+        """
+        Adds gauge
+        :param name: metric name
+        :param description: help text
+        :return: Gauge
+        """
+        return self.add(Gauge(name, description))
+
+    def histogram(self, name, description):
+        """
+        Adds histogram
+        :param name: metric name
+        :param description: help text
+        :return: Histogram
+        """
+        return self.add(Histogram(name, description))
+
+    def add(self, metric):
+        """
+        Adds metric
+        :param metric: Counter, Gauge or Histogram
+        :return: metric
+        """
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        Renders every metric
+        :return: text in Prometheus exposition format
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class Logger:
+    def __init__(self, level=INFO, buffer_lines=BUFFER_LINES, flush_interval=FLUSH_INTERVAL):
+        """
+        Constructor
+        :param level: lowest level written
+        :param buffer_lines: lines buffered before a write
+        :param flush_interval: most seconds a line waits in the buffer
+        """
+        self.level = level
+        self.buffer_lines = buffer_lines
+        self.flush_interval = flush_interval
+        self.lines = []
+        self.lock = threading.Lock()
+        self.pid = None
+
+    def set_level(self, level):
+        """
+        Sets lowest level written
+        :param level: DEBUG, INFO, WARNING or ERROR
+        """
+        self.level = level
+
+    def enabled(self, level):
+        """
+        Checks if lines at a level are written, to skip building them otherwise
+        :param level: DEBUG, INFO, WARNING or ERROR
+        :return: true if written
+        """
+        return level >= self.level
+
+    def write(self, level, msg):
+        """
+        Buffers line if its level is enabled
+        :param level: DEBUG, INFO, WARNING or ERROR
+        :param msg: message
+        """
+        if level < self.level:
+            return
+        line = time.strftime("%H:%M:%S") + " " + LEVEL_NAMES[level] + " " + msg
+        with self.lock:
+            if self.pid != os.getpid():
+                self.start_flusher()
+            self.lines.append(line)
+            full = len(self.lines) >= self.buffer_lines
+        if full or level >= ERROR:
+            self.flush()
+
+    def start_flusher(self):
+        """ Starts background flushing in this process; called with lock held """
+        self.pid = os.getpid()
+        self.lines = []
+        threading.Thread(target=self.flush_loop, args=(self.pid,), daemon=True).start()
+
+    def flush_loop(self, pid):
+        """
+        Flushes buffer every flush_interval seconds
+        :param pid: process the thread belongs to
+        """
+        while self.pid == pid:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """ Writes buffered lines """
+        with self.lock:
+            lines = self.lines
+            self.lines = []
+        if lines:
+            sys.stdout.write("\n".join(lines) + "\n")
+            sys.stdout.flush()
+
+    def debug(self, msg):
+        """
+        Logs per-step detail
+        :param msg: message
+        """
+        self.write(DEBUG, msg)
+
+    def info(self, msg):
+        """
+        Logs game and server events
+        :param msg: message
+        """
+        self.write(INFO, msg)
+
+    def warning(self, msg):
+        """
+        Logs client errors and refused connections
+        :param msg: message
+        """
+        self.write(WARNING, msg)
+
+    def error(self, msg):
+        """
+        Logs server errors, written at once
+        :param msg: message
+        """
+        self.write(ERROR, msg)
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    registry = None
+
+    def do_GET(self):
+        """ Serves rendered metrics """
+        if self.path != METRICS_PATH and self.path != "/":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """ Keeps requests out of the server log """
+        pass
+
+
+def serve_http(port, host="127.0.0.1", reg=None):
+    """
+    Serves metrics over HTTP on a background thread
+    :param port: port to listen on
+    :param host: address to bind, local only by default
+    :param reg: registry to serve, defaults to the servers' registry
+    :return: HTTP server
+    """
+    handler = type("Handler", (MetricsHandler,), {"registry": reg if reg is not None else registry})
+    server = http.server.ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    log.info("Serving metrics on http://" + host + ":" + str(port) + METRICS_PATH)
+    return server
+
+
+registry = Registry()
+connections = registry.counter("loa_connections_total", "Connections accepted")
+games_started = registry.counter("loa_games_started_total", "Games started")
+games_rejected = registry.counter("loa_games_rejected_total", "Games refused because the server was busy")
+moves = registry.counter("loa_moves_total", "Legal moves played")
+active_games = registry.gauge("loa_active_games", "Games being played")
+queue_depth = registry.gauge("loa_queue_depth", "Players waiting for a remote opponent")
+pairing_time = registry.histogram("loa_accept_to_pairing_seconds", "Time from accepting a client to starting its game")
+round_trip_time = registry.histogram("loa_move_round_trip_seconds",
+                                     "Time from sending a move request to receiving the reply")
+evaluate_time = registry.histogram("loa_evaluate_move_seconds", "Time spent in evaluate_move")
+check_win_time = registry.histogram("loa_check_win_seconds", "Time spent in check_win")
+encode_time = registry.histogram("loa_encode_seconds", "Time spent encoding messages")
+decode_time = registry.histogram("loa_decode_seconds", "Time spent decoding messages")
+
+log = Logger()
+atexit.register(log.flush)
@@ -2,6 +2,8 @@
 Lines of Action Move class
 Starbuck Beagley
 """
+import Geometry
+
 ERR_MESS = 6
 
 
@@ -18,6 +20,7 @@ class Move:
         self.player2 = p2
         self.rows = self.board.get_rows()
         self.cols = self.board.get_cols()
+        self.undo_stack = []
 
     def make_move(self, p, r1, c1, r2, c2):
         """
@@ -34,25 +37,53 @@ class Move:
         r2 = int(r2)
         c2 = int(c2)
         message = self.legal_move(p, r1, c1, r2, c2)
-        player_piece = p.get_piece()
         if message != "Legal":
             tup = [ERR_MESS, message]
             return tup
         else:
             lost_piece = ""
-            if p == self.player1 and self.board.get_grid()[r2][c2] == self.player2.get_piece():
-                self.player2.lose_piece()
+            if self.apply((r1, c1, r2, c2)):
                 lost_piece = ", taking opponent's piece"
-            elif p == self.player2 and self.board.get_grid()[r2][c2] == self.player1.get_piece():
-                self.player1.lose_piece()
-                lost_piece = ", taking opponent's piece"
-            self.board.get_grid()[r1][c1] = ' '
-            self.board.get_grid()[r2][c2] = player_piece
             m = "Moved " + str(p) + "'s piece from " + str(r1) + self.num_to_let(c1) \
                 + " to " + str(r2) + self.num_to_let(c2) + lost_piece
             tup = [1, m]
             return tup
 
+    def apply(self, move):
+        """
+        Performs a move already known to be legal and records it for undo
+        :param move: (r1, c1, r2, c2) tuple
+        :return: true if an opponent's piece was taken
+        """
+        r1, c1, r2, c2 = move
+        captured = self.board.move_piece(r1, c1, r2, c2)
+        if captured == self.player1.get_piece():
+            loser = self.player1
+        elif captured == self.player2.get_piece():
+            loser = self.player2
+        else:
+            loser = None
+        if loser is not None:
+            loser.lose_piece()
+        self.board.switch_side()
+        self.undo_stack.append((r1, c1, r2, c2, captured, loser))
+        return loser is not None
+
+    def undo(self):
+        """
+        Takes back the most recent move made with apply or make_move
+        :return: the move taken back, false if there is nothing to undo
+        """
+        if not self.undo_stack:
+            return False
+        r1, c1, r2, c2, captured, loser = self.undo_stack.pop()
+        self.board.switch_side()
+        self.board.move_piece(r2, c2, r1, c1)
+        if loser is not None:
+            self.board.change_cell(r2, c2, captured)
+            loser.restore_piece()
+        return r1, c1, r2, c2
+
     @staticmethod
     def num_to_let(num):
         """
@@ -70,73 +101,7 @@ class Move:
         """
         if player.get_pieces_left() == 1:
             return True
-        piece = player.get_piece()
-        start = self.get_first_piece(piece)
-        if not start:
-            return False
-        visited = [start]
-        self.win_recur(start, visited, piece)
-        return player.get_pieces_left() == len(visited)
-
-    def get_first_piece(self, piece):
-        for r in range(0, self.rows):
-            for c in range(0, self.cols):
-                if self.board.get_grid()[r][c] == piece:
-                    tup = (r, c)
-                    return tup
-        return False
-
-    def win_recur(self, tup, visited, piece):
-        """
-        Recursively checks if a player's pieces are all adjacent
-        :param tup: tuple containing the current coordinate
-        :param visited: list of visited coordinates
-        :param piece: player's piece to check
-        :return: true if all pieces are adjacent
-        """
-        row = tup[0]
-        col = tup[1]
-        if row - 1 > -1:
-            tup_n = (row - 1, col)
-            if self.board.get_grid()[row - 1][col] == piece and not tup_n in visited:
-                visited.append(tup_n)
-                self.win_recur(tup_n, visited, piece)
-            if col - 1 > -1:
-                tup_nw = (row - 1, col - 1)
-                if self.board.get_grid()[row - 1][col - 1] == piece and not tup_nw in visited:
-                    visited.append(tup_nw)
-                    self.win_recur(tup_nw, visited, piece)
-            if col + 1 < self.cols:
-                tup_ne = (row - 1, col + 1)
-                if self.board.get_grid()[row - 1][col + 1] == piece and not tup_ne in visited:
-                    visited.append(tup_ne)
-                    self.win_recur(tup_ne, visited, piece)
-        if row + 1 < self.rows:
-            tup_s = (row + 1, col)
-            if self.board.get_grid()[row + 1][col] == piece and not tup_s in visited:
-                visited.append(tup_s)
-                self.win_recur(tup_s, visited, piece)
-            if col - 1 > -1:
-                tup_sw = (row + 1, col - 1)
-                if self.board.get_grid()[row + 1][col - 1] == piece and not tup_sw in visited:
-                    visited.append(tup_sw)
-                    self.win_recur(tup_sw, visited, piece)
-            if col + 1 < self.cols:
-                tup_se = (row + 1, col + 1)
-                if self.board.get_grid()[row + 1][col + 1] == piece and not tup_se in visited:
-                    visited.append(tup_se)
-                    self.win_recur(tup_se, visited, piece)
-        if col - 1 > -1:
-            tup_w = (row, col - 1)
-            if self.board.get_grid()[row][col - 1] == piece and not tup_w in visited:
-                visited.append(tup_w)
-                self.win_recur(tup_w, visited, piece)
-        if col + 1 < self.cols:
-            tup_e = (row, col + 1)
-            if self.board.get_grid()[row][col + 1] == piece and not tup_e in visited:
-                visited.append(tup_e)
-                self.win_recur(tup_e, visited, piece)
-        return visited
+        return self.board.group_count(player.get_piece()) == 1
 
     def legal_move(self, p, r1, c1, r2, c2):
         """
@@ -157,7 +122,7 @@ class Move:
             return "Piece and destination coordinates must be different."
         elif not self.legal_coords(r1, c1, r2, c2):
             return "Coordinates outside board boundaries."
-        elif self.board.get_grid()[r1][c1] != p.get_piece():
+        elif self.board.get_cell(r1, c1) != p.get_piece():
             return str(p) + "'s piece not at location " + str(r1) + self.num_to_let(c1) + "."
         elif not self.legal_distance(r1, c1, r2, c2):
             return "Can't move that many spaces from " + str(r1) + self.num_to_let(c1) + "."
@@ -165,11 +130,80 @@ class Move:
             return "Illegal direction."
         elif self.check_opp_piece(r1, c1, r2, c2, opp_piece):
             return "Cannot jump opponent's piece."
-        elif self.board.get_grid()[r2][c2] == player_piece:
+        elif self.board.get_cell(r2, c2) == player_piece:
             return "Cannot move to space occupied by own piece."
         else:
             return "Legal"
 
+    def is_legal_move(self, p, r1, c1, r2, c2):
+        """
+        Checks legality of proposed move without building an error message
+        :param p: current player
+        :param r1: row coordinate of piece
+        :param c1: column coordinate of piece
+        :param r2: row coordinate of target
+        :param c2: column coordinate of target
+        :return: true if legal
+        """
+        if not self.legal_coords(r1, c1, r2, c2):
+            return False
+        geometry = self.board.get_geometry()
+        i1 = geometry.index(r1, c1)
+        i2 = geometry.index(r2, c2)
+        own = self.board.get_bits(p.get_piece())
+        if not (own >> i1) & 1 or (own >> i2) & 1:
+            return False
+        pair = i1 * geometry.size + i2
+        d = geometry.directions[pair]
+        if d == Geometry.NO_DIRECTION:
+            return False
+        count = self.board.get_line_counts()[geometry.line_types[d]][geometry.line_count_index(d, r1, c1)]
+        if max(abs(r1 - r2), abs(c1 - c2)) != count:
+            return False
+        return not self.board.get_bits(self.opponent(p).get_piece()) & geometry.between_masks[pair]
+
+    def generate_moves(self, p):
+        """
+        Generates every legal move for a player from piece positions and line counts
+        :param p: current player
+        :return: iterator of (r1, c1, r2, c2) tuples
+        """
+        geometry = self.board.get_geometry()
+        cols = self.cols
+        size = geometry.size
+        line_types = geometry.line_types
+        between_masks = geometry.between_masks
+        counts = self.board.get_line_counts()
+        own = self.board.get_bits(p.get_piece())
+        opp = self.board.get_bits(self.opponent(p).get_piece())
+        bits = own
+        while bits:
+            low = bits & -bits
+            bits ^= low
+            i = low.bit_length() - 1
+            r1 = i // cols
+            c1 = i % cols
+            lines = (c1, r1, geometry.diag_index(r1, c1), geometry.anti_index(r1, c1))
+            rays = geometry.rays[i]
+            for d in range(0, 8):
+                line_type = line_types[d]
+                distance = counts[line_type][lines[line_type]]
+                ray = rays[d]
+                if distance <= len(ray):
+                    j = ray[distance - 1]
+                    if not (own >> j) & 1 and not opp & between_masks[i * size + j]:
+                        yield r1, c1, j // cols, j % cols
+
+    def opponent(self, p):
+        """
+        Gets opponent of player
+        :param p: current player
+        :return: other player
+        """
+        if p.get_number() == 1:
+            return self.player2
+        return self.player1
+
     def legal_coords(self, r1, c1, r2, c2):
         """
         Checks all move coordinates for legality
@@ -186,8 +220,7 @@ class Move:
             return False
         return True
 
-    @staticmethod
-    def legal_direction(r1, c1, r2, c2):
+    def legal_direction(self, r1, c1, r2, c2):
         """
         Checks if move direction is legal
         :param r1: row position of piece
@@ -196,14 +229,9 @@ class Move:
         :param c2: column position of target
         :return: true if direction is legal
         """
-        if r1 == r2:
-            return True
-        elif c1 == c2:
-            return True
-        if abs(r1 - r2) == abs(c1 - c2):
-            return True
-        else:
-            return False
+        geometry = self.board.get_geometry()
+        pair = geometry.index(r1, c1) * geometry.size + geometry.index(r2, c2)
+        return geometry.directions[pair] != Geometry.NO_DIRECTION
 
     def legal_distance(self, r1, c1, r2, c2):
         if r1 == r2:
@@ -221,49 +249,14 @@ class Move:
         :param c2: column position of target
         :return: piece count
         """
-        count = 0
-
         if r1 == r2:
-            for c in range(0, self.cols):
-                if self.board.get_grid()[r1][c] != ' ':
-                    count += 1
+            return self.board.row_count(r1)
         elif c1 == c2:
-            for r in range(0, self.rows):
-                if self.board.get_grid()[r][c1] != ' ':
-                    count += 1
+            return self.board.col_count(c1)
+        elif (r1 - r2) // (c1 - c2) > 0:
+            return self.board.diag_count(r1, c1)
         else:
-            slope = (r1 - r2) // (c1 - c2)
-            if slope > 0:
-                r_check = r1
-                c_check = c1
-                while r_check < self.rows and c_check < self.cols:
-                    if self.board.get_grid()[r_check][c_check] != ' ':
-                        count += 1
-                    r_check += 1
-                    c_check += 1
-                r_check = r1 - 1
-                c_check = c1 - 1
-                while r_check > -1 and c_check > -1:
-                    if self.board.get_grid()[r_check][c_check] != ' ':
-                        count += 1
-                    r_check -= 1
-                    c_check -= 1
-            else:
-                r_check = r1
-                c_check = c1
-                while r_check > -1 and c_check < self.cols:
-                    if self.board.get_grid()[r_check][c_check] != ' ':
-                        count += 1
-                    r_check -= 1
-                    c_check += 1
-                r_check = r1 + 1
-                c_check = c1 - 1
-                while r_check < self.rows and c_check > -1:
-                    if self.board.get_grid()[r_check][c_check] != ' ':
-                        count += 1
-                    r_check += 1
-                    c_check -= 1
-        return count
+            return self.board.anti_count(r1, c1)
 
     def check_opp_piece(self, r1, c1, r2, c2, piece):
         """
@@ -275,62 +268,6 @@ class Move:
         :param piece: opponent piece type
         :return: true if opponent piece found
         """
-        if r1 == r2:
-            if c1 > c2:
-                c_start = c2 + 1
-                c_end = c1
-            else:
-                c_start = c1 + 1
-                c_end = c2
-            for c in range(c_start, c_end):
-                if self.board.get_grid()[r1][c] == piece:
-                    return True
-        elif c1 == c2:
-            if r1 > r2:
-                r_start = r2 + 1
-                r_end = r1
-            else:
-                r_start = r1 + 1
-                r_end = r2
-            for r in range(r_start, r_end):
-                if self.board.get_grid()[r][c1] == piece:
-                    return True
-        else:
-            slope = (r1 - r2) // (c1 - c2)
-            if slope > 0:
-                if r1 > r2:
-                    r_start = r2 + 1
-                    c_start = c2 + 1
-                    r_end = r1 - 1
-                    c_end = c1 - 1
-                else:
-                    r_start = r1 + 1
-                    c_start = c1 + 1
-                    r_end = r2 - 1
-                    c_end = c2 - 1
-                r = r_start
-                c = c_start
-                while r <= r_end and c <= c_end:
-                    if self.board.get_grid()[r][c] == piece:
-                        return True
-                    r += 1
-                    c += 1
-            else:
-                if r1 > r2:
-                    r_start = r1 - 1
-                    c_start = c1 + 1
-                    r_end = r2 + 1
-                    c_end = c2 - 1
-                else:
-                    r_start = r2 - 1
-                    c_start = c2 + 1
-                    r_end = r1 + 1
-                    c_end = c1 - 1
-                r = r_start
-                c = c_start
-                while r >= r_end and c <= c_end:
-                    if self.board.get_grid()[r][c] == piece:
-                        return True
-                    r -= 1
-                    c += 1
-        return False
+        geometry = self.board.get_geometry()
+        pair = geometry.index(r1, c1) * geometry.size + geometry.index(r2, c2)
+        return (self.board.get_bits(piece) & geometry.between_masks[pair]) != 0
@@ -0,0 +1,348 @@
+"""
+Lines of Action opening book
+
+Book moves for positions near the start, kept in a binary file of
+fixed-size records sorted by Board.hash:
+
+    header: magic, version, record size, record count
+    record: position hash, packed move, games, points
+
+A move is packed as from-cell * CELLS + to-cell. Points are counted
+in half points (2 for a win, 1 for a draw) from the mover's side.
+
+The file is memory-mapped and searched in place by bisection, so
+opening a book reads only the header and a lookup touches about
+log2(n) records. Zobrist keys come from a fixed seed, so a book
+built in one process is valid in any other.
+
+Books are built from SelfPlay results written with --record_moves,
+or by searching every position up to a depth with Search. Search
+clients given a book play its move while the position is in it,
+after checking the move with Move.legal_move, as the server does, in
+case of a hash collision or a stale book; otherwise they search.
+
+Usage: python OpeningBook.py BOOK [-g RESULTS [RESULTS ...]] [-s SECONDS] [-d DEPTH] [-p PLIES] [-n MIN_GAMES]
+
+With no games or search time, prints the book's moves for the start
+position.
+
+Starbuck Beagley
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+from SuperClient import SuperClient
+import Search
+
+ROWS = 8
+COLS = 8
+CELLS = ROWS * COLS
+ORD_A = 65
+
+MAGIC = b"LOAB"
+VERSION = 1
+HEADER = struct.Struct("<4sHHI")
+RECORD = struct.Struct("<QHHH")
+KEY = struct.Struct("<Q")
+MAX_COUNT = 0xFFFF
+
+BOOK_PLIES = 12
+MIN_GAMES = 2
+SEARCH_DEPTH = 1
+NO_WIN = 0
+
+
+class OpeningBook:
+    def __init__(self, path):
+        """
+        Constructor, maps book file; an empty file is an empty book
+        :param path: book file name
+        """
+        self.map = None
+        self.count = 0
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < HEADER.size:
+            self.map.close()
+            raise ValueError(path + " is not an opening book")
+        magic, version, record_size, self.count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size or \
+                len(self.map) != HEADER.size + self.count * RECORD.size:
+            self.map.close()
+            raise ValueError(path + " is not an opening book")
+
+    def __len__(self):
+        """
+        Gets number of book moves
+        :return: record count
+        """
+        return self.count
+
+    def find(self, key):
+        """
+        Finds first record of a position by bisection
+        :param key: position hash
+        :return: record index, count if every record's hash is lower
+        """
+        lo = 0
+        hi = self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if KEY.unpack_from(self.map, HEADER.size + mid * RECORD.size)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def entries(self, key):
+        """
+        Gets book moves for a position, most points first
+        :param key: position hash
+        :return: list of ((r1, c1, r2, c2), games, points)
+        """
+        result = []
+        for i in range(self.find(key), self.count):
+            h, packed, games, points = RECORD.unpack_from(self.map, HEADER.size + i * RECORD.size)
+            if h != key:
+                break
+            result.append((unpack_move(packed), games, points))
+        return result
+
+    def lookup(self, board, move, player, rng=None):
+        """
+        Picks book move for the position on a board
+        :param board: Board holding the position
+        :param move: Move for the board, to check legality
+        :param player: player to move
+        :param rng: random.Random, or the random module, to pick in proportion to points; None for the most points
+        :return: (r1, c1, r2, c2), None if the position has no legal book move
+        """
+        candidates = [(m, points) for m, games, points in self.entries(board.get_hash())
+                      if move.legal_move(player, m[0], m[1], m[2], m[3]) == "Legal"]
+        if not candidates:
+            return None
+        if rng is None:
+            return candidates[0][0]
+        pick = rng.random() * sum(points for m, points in candidates)
+        for m, points in candidates:
+            pick -= points
+            if pick < 0:
+                return m
+        return candidates[-1][0]
+
+    def close(self):
+        """ Unmaps book file """
+        if self.map is not None:
+            self.map.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("book", help="book file to build or show")
+    parser.add_argument("-g", "--games", help="SelfPlay results files written with --record_moves", nargs="+",
+                        default=[])
+    parser.add_argument("-s", "--search_time", help="seconds to search each position for a search-built book",
+                        type=float, default=0.0)
+    parser.add_argument("-d", "--depth", help="book moves per side for a search-built book", type=int,
+                        default=SEARCH_DEPTH)
+    parser.add_argument("-p", "--plies", help="moves of each game to take into the book", type=int,
+                        default=BOOK_PLIES)
+    parser.add_argument("-n", "--min_games", help="games a move needs to be taken into the book", type=int,
+                        default=MIN_GAMES)
+    args = parser.parse_args()
+
+    if not args.games and args.search_time <= 0:
+        try:
+            book = OpeningBook(args.book)
+        except (OSError, ValueError) as err:
+            print("Error: " + str(err))
+            sys.exit(1)
+        client = SuperClient(1)
+        client.initialize()
+        print(str(len(book)) + " book moves")
+        for m, games, points in book.entries(client.board.get_hash()):
+            print("  " + format_move(m) + ": " + str(games) + " games, " + str(points / 2) + " points")
+        book.close()
+        return
+
+    stats = {}
+    if args.games:
+        games_stats(args.games, args.plies, args.min_games, stats)
+    if args.search_time > 0:
+        search_stats(args.search_time, args.depth, stats)
+    write_book(args.book, stats)
+    print(str(len(stats)) + " book moves written to " + args.book)
+
+
+def pack_move(m):
+    """
+    Packs move into a record field
+    :param m: (r1, c1, r2, c2)
+    :return: from-cell * CELLS + to-cell
+    """
+    return (m[0] * COLS + m[1]) * CELLS + m[2] * COLS + m[3]
+
+
+def unpack_move(packed):
+    """
+    Unpacks move from a record field
+    :param packed: packed move
+    :return: (r1, c1, r2, c2)
+    """
+    i1, i2 = divmod(packed, CELLS)
+    return i1 // COLS, i1 % COLS, i2 // COLS, i2 % COLS
+
+
+def parse_move(text):
+    """
+    Parses move as written by SelfPlay, e.g. 3A1C
+    :param text: move text
+    :return: (r1, c1, r2, c2)
+    """
+    return int(text[0]), ord(text[1]) - ORD_A, int(text[2]), ord(text[3]) - ORD_A
+
+
+def format_move(m):
+    """
+    Formats move as SelfPlay writes it
+    :param m: (r1, c1, r2, c2)
+    :return: move text
+    """
+    return str(m[0]) + chr(ORD_A + m[1]) + str(m[2]) + chr(ORD_A + m[3])
+
+
+def add_result(stats, key, m, games, points):
+    """
+    Adds games and points to a book move
+    :param stats: dict of (position hash, packed move) to [games, points]
+    :param key: position hash
+    :param m: (r1, c1, r2, c2)
+    :param games: games to add
+    :param points: half points to add
+    """
+    entry = stats.setdefault((key, pack_move(m)), [0, 0])
+    entry[0] += games
+    entry[1] += points
+
+
+def games_stats(paths, plies=BOOK_PLIES, min_games=MIN_GAMES, stats=None):
+    """
+    Counts games and points of the opening moves of recorded games, up to any move that is not legal
+    :param paths: SelfPlay JSON lines results files with moves
+    :param plies: moves of each game to count
+    :param min_games: games a move needs to be kept
+    :param stats: dict to add to, as for add_result
+    :return: stats
+    """
+    if stats is None:
+        stats = {}
+    counted = {}
+    client = SuperClient(1)
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    continue
+                if "moves" not in result:
+                    continue
+                client.initialize()
+                client.position_replaced()
+                for m in [parse_move(text) for text in result["moves"][:plies]]:
+                    side = client.board.get_side()
+                    player = client.player if side == 1 else client.opponent
+                    if client.move.legal_move(player, m[0], m[1], m[2], m[3]) != "Legal":
+                        break
+                    if result["winner"] == NO_WIN:
+                        points = 1
+                    elif result["winner"] == side:
+                        points = 2
+                    else:
+                        points = 0
+                    add_result(counted, client.board.get_hash(), m, 1, points)
+                    client.move.apply(m)
+    for (key, packed), (games, points) in counted.items():
+        if games >= min_games and points > 0:
+            entry = stats.setdefault((key, packed), [0, 0])
+            entry[0] += games
+            entry[1] += points
+    return stats
+
+
+def search_stats(time_limit, depth=SEARCH_DEPTH, stats=None):
+    """
+    Searches every position where either side has a book move to make in its first depth moves,
+    taking the best move of each into the book as one won game
+    :param time_limit: seconds to search each position
+    :param depth: book moves per side
+    :param stats: dict to add to, as for add_result
+    :return: stats
+    """
+    if stats is None:
+        stats = {}
+    client = SuperClient(1)
+    client.initialize()
+    search = Search.Search(client.move)
+    players = {1: client.player, 2: client.opponent}
+    for book_side in (1, 2):
+        search_positions(client, search, players, book_side, 2 * depth, time_limit, stats)
+    return stats
+
+
+def search_positions(client, search, players, book_side, plies, time_limit, stats):
+    """
+    Searches book side's moves and tries every reply, down to a number of plies
+    :param client: SuperClient whose board holds the position
+    :param search: Search on the client's Move
+    :param players: dict of player number to Player
+    :param book_side: player number the book moves are for
+    :param plies: plies left to cover
+    :param time_limit: seconds to search each position
+    :param stats: dict to add to, as for add_result
+    """
+    if plies <= 0:
+        return
+    side = client.board.get_side()
+    player = players[side]
+    if side == book_side:
+        m = search.best_move(player, time_limit)
+        if m is None:
+            return
+        add_result(stats, client.board.get_hash(), m, 1, 2)
+        moves = [m]
+    else:
+        moves = list(client.move.generate_moves(player))
+    for m in moves:
+        client.move.apply(m)
+        if not client.move.check_for_win(players[1]) and not client.move.check_for_win(players[2]):
+            search_positions(client, search, players, book_side, plies - 1, time_limit, stats)
+        client.move.undo()
+
+
+def write_book(path, stats):
+    """
+    Writes book file, replacing any old one in a single rename
+    :param path: book file name
+    :param stats: dict of (position hash, packed move) to [games, points]
+    """
+    records = sorted(stats.items(), key=lambda item: (item[0][0], -item[1][1], -item[1][0]))
+    data = bytearray(HEADER.size + len(records) * RECORD.size)
+    HEADER.pack_into(data, 0, MAGIC, VERSION, RECORD.size, len(records))
+    offset = HEADER.size
+    for (key, packed), (games, points) in records:
+        RECORD.pack_into(data, offset, key, packed, min(games, MAX_COUNT), min(points, MAX_COUNT))
+        offset += RECORD.size
+    temp = path + ".tmp"
+    with open(temp, "wb") as f:
+        f.write(data)
+    os.replace(temp, path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+"""
+Lines of Action parallel search
+
+A pool of worker processes that search one position together, so a
+computer player is not held to one core by the GIL. Workers are
+started once and kept between moves, each with its own board and
+search state, so a move costs one message to each worker and one
+reply back rather than a fork.
+
+With ALPHA_BETA, the root moves are dealt out to the workers in
+turn, best guess first, and each worker runs iterative deepening on
+its share. The results are compared at the deepest iteration every
+worker finished, since scores from different depths do not compare.
+
+With MCTS_TREES, every worker grows its own tree from the whole
+position with its own random playouts, and the root visit counts of
+all trees are added up (root parallelization).
+
+The pool sends each worker the deadline, which the worker stops
+DEADLINE_MARGIN short of however late it got the request, and takes
+whatever replies have arrived by the deadline. A late reply is
+dropped when it turns up, recognized by its request id. A worker
+found dead when a search starts is replaced by a new one, which
+joins the search if it is ready in time.
+
+Starbuck Beagley
+"""
+import itertools
+import multiprocessing
+import multiprocessing.connection
+import time
+from SuperClient import SuperClient
+import Search
+import MCTS
+import TransTable
+
+ALPHA_BETA = 0
+MCTS_TREES = 1
+
+DEADLINE_MARGIN = 0.05
+CLOSE_TIMEOUT = 1.0
+READY = 0
+
+
+class SearchPool:
+    def __init__(self, kind, workers=None, table_mb=TransTable.DEFAULT_MB, table_policy=TransTable.DEPTH_PREFERRED,
+                 progressive_bias=True, seed=None):
+        """
+        Constructor, starts worker processes and waits until they are ready
+        :param kind: ALPHA_BETA or MCTS_TREES
+        :param workers: number of worker processes, defaults to one per core
+        :param table_mb: transposition table megabytes per alpha-beta worker, 0 for no table
+        :param table_policy: transposition table replacement policy
+        :param progressive_bias: true to steer MCTS workers with a heuristic move score
+        :param seed: seed for MCTS workers' playouts, worker i using seed + i; None for random ones
+        """
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        self.kind = kind
+        self.worker_args = (kind, table_mb, table_policy, progressive_bias)
+        self.seed = seed
+        self.request_ids = itertools.count(READY + 1)
+        self.conns = [None] * workers
+        self.processes = [None] * workers
+        self.stats = {}
+        for i in range(0, workers):
+            self.start_worker(i)
+        for conn in self.conns:
+            conn.recv()
+
+    def start_worker(self, i):
+        """
+        Starts worker process, replacing any old one, without waiting for it to be ready
+        :param i: worker index
+        """
+        parent, child = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=worker_main, name="search-" + str(i),
+                                          args=(child,) + self.worker_args +
+                                               (self.seed + i if self.seed is not None else None,),
+                                          daemon=True)
+        process.start()
+        child.close()
+        if self.conns[i] is not None:
+            self.conns[i].close()
+            self.processes[i].terminate()
+            self.processes[i].join()
+        self.conns[i] = parent
+        self.processes[i] = process
+
+    def send(self, i, request):
+        """
+        Sends request to a worker, first replacing the worker if it has died
+        :param i: worker index
+        :param request: request tuple
+        """
+        if not self.processes[i].is_alive():
+            self.start_worker(i)
+        try:
+            self.conns[i].send(request)
+        except OSError:
+            self.start_worker(i)
+            self.conns[i].send(request)
+
+    def best_move(self, board, player, time_limit, root_moves=None):
+        """
+        Searches position on every worker until time runs out
+        :param board: Board holding the position
+        :param player: player to move
+        :param time_limit: seconds the search may use
+        :param root_moves: root moves, best guess first; required for ALPHA_BETA
+        :return: best (r1, c1, r2, c2) found, None if no worker answered in time
+        """
+        deadline = time.time() + time_limit
+        request_id = next(self.request_ids)
+        position = (board.bits1, board.bits2, player.get_number())
+        asked = []
+        for i in range(0, len(self.conns)):
+            if self.kind == ALPHA_BETA:
+                share = root_moves[i::len(self.conns)]
+                if not share:
+                    continue
+            else:
+                share = None
+            self.send(i, (request_id, position, share, deadline))
+            asked.append(self.conns[i])
+        replies = self.collect(request_id, asked, deadline)
+        if self.kind == ALPHA_BETA:
+            return self.combine_alpha_beta(replies)
+        return self.combine_trees(replies)
+
+    def collect(self, request_id, conns, deadline):
+        """
+        Gathers replies to a request until every worker has answered or the deadline passes
+        :param request_id: id sent with the request
+        :param conns: pipes to workers that were asked
+        :param deadline: time.time() to stop waiting at
+        :return: list of (result, stats) replies
+        """
+        replies = []
+        waiting = list(conns)
+        while waiting:
+            left = deadline - time.time()
+            if left <= 0:
+                break
+            for conn in multiprocessing.connection.wait(waiting, left):
+                try:
+                    reply = conn.recv()
+                except EOFError:
+                    waiting.remove(conn)
+                    continue
+                if reply != READY and reply[0] == request_id:
+                    replies.append(reply[1:])
+                    waiting.remove(conn)
+        return replies
+
+    def combine_alpha_beta(self, replies):
+        """
+        Picks best move across workers' shares at the deepest iteration all of them finished
+        :param replies: list of (history, stats), history as in Search.history
+        :return: (r1, c1, r2, c2), None if no worker finished an iteration
+        """
+        histories = [history for history, stats in replies if history]
+        self.stats = {
+            "workers": len(replies),
+            "nodes": sum(stats["nodes"] for history, stats in replies),
+            "depth": min(history[-1][0] for history in histories) if histories else 0,
+        }
+        if not histories:
+            return None
+        for history in histories:
+            depth, score, move = history[-1]
+            if score >= Search.WIN_SCORE - Search.MAX_DEPTH:
+                return move
+        results = [history[self.stats["depth"] - 1] for history in histories]
+        return max(results, key=lambda result: result[1])[2]
+
+    def combine_trees(self, replies):
+        """
+        Adds up root visits of every worker's tree and picks the most visited move
+        :param replies: list of (root visits, stats) from MCTS.root_visits and MCTS.get_stats
+        :return: (r1, c1, r2, c2), None if no worker answered
+        """
+        visits = {}
+        for root_visits, stats in replies:
+            for move, (n, wins) in root_visits.items():
+                visits[move] = visits.get(move, 0) + n
+        seconds = max([stats["seconds"] for root_visits, stats in replies] or [0.0])
+        playouts = sum(stats["playouts"] for root_visits, stats in replies)
+        self.stats = {
+            "workers": len(replies),
+            "playouts": playouts,
+            "seconds": seconds,
+            "playouts_per_second": playouts / seconds if seconds else 0.0,
+            "tree_nodes": sum(stats["tree_nodes"] for root_visits, stats in replies),
+            "tree_bytes": sum(stats["tree_bytes"] for root_visits, stats in replies),
+        }
+        if not visits:
+            return None
+        return max(visits, key=visits.get)
+
+    def get_stats(self):
+        """
+        Gets stats of the last search, summed over workers
+        :return: dict of stats
+        """
+        return self.stats
+
+    def close(self):
+        """ Stops worker processes, terminating any still busy after CLOSE_TIMEOUT """
+        for conn in self.conns:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+            conn.close()
+        for process in self.processes:
+            process.join(CLOSE_TIMEOUT)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+
+
+def worker_main(conn, kind, table_mb, table_policy, progressive_bias, seed=None):
+    """
+    Searches positions sent by the pool until told to stop
+    :param conn: pipe to the pool
+    :param kind: ALPHA_BETA or MCTS_TREES
+    :param table_mb: transposition table megabytes, 0 for no table
+    :param table_policy: transposition table replacement policy
+    :param progressive_bias: true to steer MCTS with a heuristic move score
+    :param seed: seed for MCTS playouts, None for a random one
+    """
+    client = SuperClient(1)
+    client.initialize()
+    if kind == ALPHA_BETA:
+        if table_mb > 0:
+            table = TransTable.TransTable(table_mb, table_policy)
+        else:
+            table = None
+        engine = Search.Search(client.move, table)
+    else:
+        engine = MCTS.MCTS(client.board, progressive_bias, seed=seed)
+    conn.send(READY)
+    while 1:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        request_id, (bits1, bits2, side), share, deadline = request
+        time_limit = max(deadline - DEADLINE_MARGIN - time.time(), 0)
+        client.set_position(bits1, bits2, side)
+        if side == client.get_num():
+            player = client.player
+        else:
+            player = client.opponent
+        if kind == ALPHA_BETA:
+            engine.best_move(player, time_limit, root_moves=share)
+            conn.send((request_id, engine.history, {"nodes": engine.nodes, "depth": engine.depth_reached}))
+        else:
+            engine.best_move(time_limit)
+            conn.send((request_id, engine.root_visits(), engine.get_stats()))
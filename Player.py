@@ -39,6 +39,19 @@ class Player:
         """
         self.pieces_left -= 1
 
+    def restore_piece(self):
+        """
+        Increases pieces_left by 1, undoing a capture
+        """
+        self.pieces_left += 1
+
+    def set_pieces_left(self, n):
+        """
+        Sets pieces_left, e.g. after the board is resynchronized
+        :param n: pieces on the board
+        """
+        self.pieces_left = n
+
     def get_pieces_left(self):
         """
         Gets pieces_left
@@ -0,0 +1,435 @@
+"""
+Lines of Action wire protocol
+
+Messages inside the game are the same lists they have always been;
+a codec turns them into bytes for Transport and back.
+
+BinaryCodec (version 1) packs every message as a fixed header
+
+    magic 'LA' | version | opcode | flags
+
+followed by the parts named in flags, in this order:
+
+    FLAG_IDS       client number (1 byte) and game id (4 bytes)
+    FLAG_MOVE      move, 4 bytes: coordinate characters from a
+                   client, row/column numbers from the server
+    FLAG_POSITION  two bitboards, one per player (16 bytes on 8x8)
+    FLAG_HASH      8-byte position hash, sent instead of the
+                   position to clients that asked for delta updates
+    FLAG_TEXT      2-byte length and UTF-8 text
+    FLAG_MATCH     board size (1 byte) and rating (2 bytes) a
+                   client wants to be paired by
+
+FLAG_REMOTE and FLAG_DELTA carry no data; they mark a client's INIT
+as wanting a remote opponent and delta updates.
+
+A move request from the server may end with the player's clock,
+which has no flag, so decoders that predate it ignore it:
+
+    TIME           milliseconds for this move and milliseconds in
+                   the player's bank (NO_TIME if none), 4 bytes each
+
+The opcode is the message code (INIT, P1_MOVE_REQ, ...). Parts are
+packed with struct into a buffer allocated once per codec.
+
+PickleCodec keeps the original pickled lists for clients that
+predate the binary protocol. It refuses to load any pickle that
+names a class or function, so a remote client cannot make the
+server run code by sending a crafted pickle.
+
+The server picks a codec from the first message a client sends:
+binary messages start with the magic bytes, pickles never do. A
+client sends its INIT at the highest version it knows, and the
+server answers at the highest version both know; the version in the
+header of the server's INIT reply is the agreed one, and the
+client's codec switches down to it on decoding the reply. INIT is
+laid out the same in every version, so either end can read the
+other's INIT before they agree. Other messages must carry the
+agreed version.
+
+MAX_MOVE_TIME, the servers' default limit per move, is kept here so
+clients can budget their moves without importing a server.
+
+Starbuck Beagley
+"""
+
+import io
+import pickle
+import struct
+
+INIT = 0
+P1_MOVE_REQ = 1
+P2_MOVE_REQ = 2
+P1_MOVE_WAS = 3
+P2_MOVE_WAS = 4
+WIN_MESS = 5
+ERR_MESS = 6
+QUIT_MESS = 7
+RESYNC_MESS = 10
+
+MAX_MOVE_TIME = 30
+
+ROWS = 8
+COLS = 8
+PIECE1 = 'x'
+PIECE2 = 'o'
+EMPTY = ' '
+
+MAGIC = b'LA'
+VERSION = 1
+MIN_VERSION = 1
+HEADER = struct.Struct('!2sBBB')
+IDS = struct.Struct('!BI')
+MOVE = struct.Struct('!4B')
+HASH = struct.Struct('!Q')
+MATCH = struct.Struct('!BH')
+TIME = struct.Struct('!II')
+NO_TIME = 0xFFFFFFFF
+TEXT_LEN = struct.Struct('!H')
+MAX_TEXT = 0xFFFF
+
+FLAG_IDS = 1
+FLAG_MOVE = 2
+FLAG_POSITION = 4
+FLAG_TEXT = 8
+FLAG_REMOTE = 16
+FLAG_DELTA = 32
+FLAG_HASH = 64
+FLAG_MATCH = 128
+
+
+class ProtocolError(ValueError):
+    """ Raised when a message cannot be decoded """
+    pass
+
+
+class SafeUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        """
+        Refuses every global, so only plain lists, strings and numbers load
+        :param module: module name requested by the pickle
+        :param name: global name requested by the pickle
+        """
+        raise pickle.UnpicklingError("Refusing to load " + module + "." + name)
+
+
+class PickleCodec:
+    version = 0
+
+    @staticmethod
+    def encode(msg, board=None):
+        """
+        Encodes message as a pickle
+        :param msg: message list
+        :param board: unused, kept for the same signature as BinaryCodec
+        :return: message bytes
+        """
+        return pickle.dumps(msg)
+
+    @staticmethod
+    def decode(payload):
+        """
+        Decodes pickled message, refusing anything but plain data
+        :param payload: message bytes
+        :return: message list
+        """
+        return SafeUnpickler(io.BytesIO(payload)).load()
+
+
+class BinaryCodec:
+    def __init__(self, rows=ROWS, cols=COLS, piece1=PIECE1, piece2=PIECE2, version=VERSION):
+        """
+        Constructor
+        :param rows: board rows
+        :param cols: board columns
+        :param piece1: player 1's piece
+        :param piece2: player 2's piece
+        :param version: protocol version agreed with the other end
+        """
+        self.rows = rows
+        self.cols = cols
+        self.piece1 = piece1
+        self.piece2 = piece2
+        self.version = version
+        self.bits_size = (rows * cols + 7) // 8
+        self.out = bytearray(HEADER.size + IDS.size + MOVE.size + 2 * self.bits_size + HASH.size +
+                             TEXT_LEN.size + MAX_TEXT + MATCH.size)
+
+    def encode(self, msg, board=None):
+        """
+        Encodes message
+        :param msg: message list
+        :param board: Board the message's grid came from, to read its bitboards directly
+        :return: memoryview of message bytes, valid until the next encode
+        """
+        code = msg[0]
+        flags = 0
+        ids = None
+        move = None
+        grid = None
+        position_hash = None
+        text = None
+        match = None
+        clock = None
+        if code == INIT:
+            if len(msg) >= 2 and isinstance(msg[1], bool):
+                if msg[1]:
+                    flags |= FLAG_REMOTE
+                if len(msg) >= 3 and msg[2]:
+                    flags |= FLAG_DELTA
+                if len(msg) >= 5:
+                    flags |= FLAG_MATCH
+                    match = (msg[3], msg[4])
+            elif len(msg) >= 4:
+                flags |= FLAG_IDS
+                ids = (msg[1], msg[2])
+                if len(msg) >= 5:
+                    flags |= FLAG_POSITION
+                    grid = msg[4]
+        elif code == P1_MOVE_REQ or code == P2_MOVE_REQ:
+            if len(msg) >= 3:
+                if isinstance(msg[2], int):
+                    flags |= FLAG_HASH
+                    position_hash = msg[2]
+                else:
+                    flags |= FLAG_POSITION
+                    grid = msg[2]
+                if len(msg) >= 5 and msg[3] is not None:
+                    clock = (to_ms(msg[3]), to_ms(msg[4]))
+            else:
+                flags |= FLAG_MOVE
+                move = client_move_bytes(msg[1])
+        elif code == P1_MOVE_WAS or code == P2_MOVE_WAS:
+            flags |= FLAG_MOVE
+            move = bytes(msg[1])
+            if isinstance(msg[2], int):
+                flags |= FLAG_HASH
+                position_hash = msg[2]
+            else:
+                flags |= FLAG_POSITION
+                grid = msg[2]
+        else:
+            if len(msg) >= 2 and msg[1]:
+                flags |= FLAG_TEXT
+                text = str(msg[1]).encode('utf-8')[:MAX_TEXT]
+            if len(msg) >= 3:
+                flags |= FLAG_POSITION
+                grid = msg[2]
+
+        out = self.out
+        HEADER.pack_into(out, 0, MAGIC, self.version, code, flags)
+        n = HEADER.size
+        if ids is not None:
+            IDS.pack_into(out, n, ids[0], ids[1])
+            n += IDS.size
+        if move is not None:
+            out[n:n + MOVE.size] = move
+            n += MOVE.size
+        if flags & FLAG_POSITION:
+            if board is not None:
+                bits1 = board.bits1
+                bits2 = board.bits2
+            else:
+                bits1, bits2 = self.grid_to_bits(grid)
+            out[n:n + self.bits_size] = bits1.to_bytes(self.bits_size, 'big')
+            n += self.bits_size
+            out[n:n + self.bits_size] = bits2.to_bytes(self.bits_size, 'big')
+            n += self.bits_size
+        if position_hash is not None:
+            HASH.pack_into(out, n, position_hash)
+            n += HASH.size
+        if text is not None:
+            TEXT_LEN.pack_into(out, n, len(text))
+            n += TEXT_LEN.size
+            out[n:n + len(text)] = text
+            n += len(text)
+        if match is not None:
+            MATCH.pack_into(out, n, match[0], match[1])
+            n += MATCH.size
+        if clock is not None:
+            TIME.pack_into(out, n, clock[0], clock[1])
+            n += TIME.size
+        return memoryview(out)[:n]
+
+    def decode(self, payload):
+        """
+        Decodes message, switching to a lower version agreed in an INIT reply
+        :param payload: message bytes
+        :return: message list
+        """
+        try:
+            magic, version, code, flags = HEADER.unpack_from(payload, 0)
+            if magic != MAGIC:
+                raise ProtocolError("Not a binary protocol message")
+            if version != self.version:
+                if code != INIT or version < MIN_VERSION:
+                    raise ProtocolError("Unsupported protocol version " + str(version))
+                if version < self.version:
+                    self.version = version
+            n = HEADER.size
+            ids = None
+            move = None
+            grid = None
+            position_hash = None
+            text = ""
+            match = None
+            clock = None
+            if flags & FLAG_IDS:
+                ids = IDS.unpack_from(payload, n)
+                n += IDS.size
+            if flags & FLAG_MOVE:
+                move = MOVE.unpack_from(payload, n)
+                n += MOVE.size
+            if flags & FLAG_POSITION:
+                bits1 = int.from_bytes(payload[n:n + self.bits_size], 'big')
+                n += self.bits_size
+                bits2 = int.from_bytes(payload[n:n + self.bits_size], 'big')
+                n += self.bits_size
+                grid = self.bits_to_grid(bits1, bits2)
+            if flags & FLAG_HASH:
+                position_hash = HASH.unpack_from(payload, n)[0]
+                n += HASH.size
+            if flags & FLAG_TEXT:
+                length = TEXT_LEN.unpack_from(payload, n)[0]
+                n += TEXT_LEN.size
+                text = bytes(payload[n:n + length]).decode('utf-8', 'replace')
+                n += length
+            if flags & FLAG_MATCH:
+                match = MATCH.unpack_from(payload, n)
+                n += MATCH.size
+            if (code == P1_MOVE_REQ or code == P2_MOVE_REQ) and len(payload) >= n + TIME.size:
+                clock = TIME.unpack_from(payload, n)
+                n += TIME.size
+        except struct.error:
+            raise ProtocolError("Truncated message")
+
+        if code == INIT:
+            if ids is not None and grid is not None:
+                return [INIT, ids[0], ids[1], ids[0], grid]
+            elif ids is not None:
+                return [INIT, ids[0], ids[1], ids[0]]
+            elif match is not None:
+                return [INIT, bool(flags & FLAG_REMOTE), bool(flags & FLAG_DELTA), match[0], match[1]]
+            return [INIT, bool(flags & FLAG_REMOTE), bool(flags & FLAG_DELTA)]
+        elif code == P1_MOVE_REQ or code == P2_MOVE_REQ:
+            if move is not None:
+                return [code, [chr(b) for b in move]]
+            msg = [code, "", position_hash if position_hash is not None else grid]
+            if clock is not None:
+                msg += [from_ms(clock[0]), from_ms(clock[1])]
+            return msg
+        elif code == P1_MOVE_WAS or code == P2_MOVE_WAS:
+            if position_hash is not None:
+                return [code, list(move), position_hash]
+            return [code, list(move), grid]
+        elif grid is not None:
+            return [code, text, grid]
+        elif code == QUIT_MESS and not text:
+            return [QUIT_MESS]
+        return [code, text]
+
+    def grid_to_bits(self, grid):
+        """
+        Builds bitboards from a grid
+        :param grid: list of lists of pieces
+        :return: (player 1 bitboard, player 2 bitboard)
+        """
+        bits1 = 0
+        bits2 = 0
+        bit = 1
+        for r in range(0, self.rows):
+            for c in range(0, self.cols):
+                if grid[r][c] == self.piece1:
+                    bits1 |= bit
+                elif grid[r][c] == self.piece2:
+                    bits2 |= bit
+                bit <<= 1
+        return bits1, bits2
+
+    def bits_to_grid(self, bits1, bits2):
+        """
+        Builds grid from bitboards
+        :param bits1: player 1 bitboard
+        :param bits2: player 2 bitboard
+        :return: list of lists of pieces
+        """
+        grid = []
+        bit = 1
+        for r in range(0, self.rows):
+            row = []
+            for c in range(0, self.cols):
+                if bits1 & bit:
+                    row.append(self.piece1)
+                elif bits2 & bit:
+                    row.append(self.piece2)
+                else:
+                    row.append(EMPTY)
+                bit <<= 1
+            grid.append(row)
+        return grid
+
+
+def to_ms(seconds):
+    """
+    Converts clock time for the TIME part
+    :param seconds: seconds, None for no limit
+    :return: milliseconds, NO_TIME for no limit
+    """
+    if seconds is None:
+        return NO_TIME
+    return max(0, min(int(seconds * 1000), NO_TIME - 1))
+
+
+def from_ms(ms):
+    """
+    Converts clock time from the TIME part
+    :param ms: milliseconds, NO_TIME for no limit
+    :return: seconds, None for no limit
+    """
+    if ms == NO_TIME:
+        return None
+    return ms / 1000
+
+
+def client_move_bytes(l):
+    """
+    Packs a client's move as its four coordinate characters
+    :param l: move as entered, e.g. ['3', 'a', '5', 'c'] or [3, 'A', 5, 'C']
+    :return: 4 bytes, all zero if the move is not four single ASCII characters
+    """
+    chars = [str(x) for x in l] if isinstance(l, (list, tuple)) else list(str(l))
+    if len(chars) != 4 or any(len(ch) != 1 or ord(ch) > 127 for ch in chars):
+        return bytes(MOVE.size)
+    return bytes(ord(ch) for ch in chars)
+
+
+def negotiate(payload, rows=ROWS, cols=COLS, piece1=PIECE1, piece2=PIECE2):
+    """
+    Chooses codec for a client from the first message it sends
+    :param payload: first message bytes
+    :param rows: board rows
+    :param cols: board columns
+    :param piece1: player 1's piece
+    :param piece2: player 2's piece
+    :return: BinaryCodec at the highest version both ends know, PickleCodec for old clients
+    """
+    if bytes(payload[:len(MAGIC)]) == MAGIC and len(payload) > len(MAGIC):
+        version = min(payload[len(MAGIC)], VERSION)
+        if version < MIN_VERSION:
+            raise ProtocolError("Unsupported protocol version " + str(version))
+        return BinaryCodec(rows, cols, piece1, piece2, version)
+    return PickleCodec()
+
+
+def check_first_message(msg):
+    """
+    Checks that a client's first message is a message list: INIT with at least the
+    remote player flag, or any other message code
+    :param msg: decoded first message
+    :return: msg
+    """
+    if not isinstance(msg, (list, tuple)) or not msg:
+        raise ProtocolError("First message is not a message list")
+    if msg[0] == INIT and len(msg) < 2:
+        raise ProtocolError("INIT message has no remote player flag")
+    return msg
@@ -0,0 +1,292 @@
+"""
+Lines of Action alpha-beta search
+
+Negamax with alpha-beta pruning and iterative deepening. Moves are
+made and taken back on a single board with Move.apply and Move.undo.
+Scores are from the point of view of the player to move. Results are
+kept in a TransTable keyed on Board.hash when one is given. A move
+that connects both sides is a win for player 1, as LOAServer.check_win
+decides it.
+
+Starbuck Beagley
+"""
+import time
+import TransTable
+
+WIN_SCORE = 100000
+MAX_DEPTH = 64
+CHECK_EVERY = 16
+
+CENTRE_WEIGHT = 4
+CONCENTRATION_WEIGHT = 6
+GROUP_WEIGHT = 12
+MOBILITY_WEIGHT = 1
+
+
+class SearchTimeout(Exception):
+    """ Raised inside the search when the deadline passes """
+    pass
+
+
+class Search:
+    def __init__(self, move, table=None):
+        """
+        Constructor
+        :param move: Move object for the board to search
+        :param table: TransTable to share between searches, None for no table
+        """
+        self.move = move
+        self.table = table
+        self.board = move.board
+        self.geometry = self.board.get_geometry()
+        self.deadline = 0
+        self.nodes = 0
+        self.depth_reached = 0
+        self.history = []
+        rows = self.geometry.rows
+        cols = self.geometry.cols
+        self.centre_distance = [max(abs(2 * (i // cols) - (rows - 1)), abs(2 * (i % cols) - (cols - 1))) // 2
+                                for i in range(0, self.geometry.size)]
+
+    def best_move(self, player, time_limit, max_depth=MAX_DEPTH, root_moves=None):
+        """
+        Searches deeper and deeper until time runs out
+        :param player: player to move
+        :param time_limit: seconds the search may use
+        :param max_depth: deepest iteration to try
+        :param root_moves: root moves to search, e.g. one worker's share; None for every legal move
+        :return: best (r1, c1, r2, c2) found, None if player has no legal move
+        """
+        start = time.time()
+        self.deadline = start + time_limit
+        self.nodes = 0
+        self.depth_reached = 0
+        self.history = []
+        if self.table is not None:
+            self.table.new_search()
+        if root_moves is None:
+            root_moves = self.move.generate_moves(player)
+        moves = self.order_moves(player, list(root_moves), None)
+        if not moves:
+            return None
+        best = moves[0]
+        for depth in range(1, max_depth + 1):
+            try:
+                score, move = self.search_root(player, moves, depth)
+            except SearchTimeout:
+                break
+            best = move
+            self.depth_reached = depth
+            self.history.append((depth, score, move))
+            moves.remove(move)
+            moves.insert(0, move)
+            if abs(score) >= WIN_SCORE - MAX_DEPTH:
+                break
+            if time.time() - start > (self.deadline - start) / 2:
+                break
+        return best
+
+    def search_root(self, player, moves, depth):
+        """
+        Searches every root move to a fixed depth
+        :param player: player to move
+        :param moves: root moves, best guess first
+        :param depth: search depth
+        :return: (score, move) of the best root move
+        """
+        alpha = -WIN_SCORE - 1
+        beta = WIN_SCORE + 1
+        best = moves[0]
+        opponent = self.move.opponent(player)
+        for m in moves:
+            self.move.apply(m)
+            try:
+                score = -self.negamax(opponent, player, depth - 1, -beta, -alpha, 1)
+            finally:
+                self.move.undo()
+            if score > alpha:
+                alpha = score
+                best = m
+        return alpha, best
+
+    def negamax(self, player, opponent, depth, alpha, beta, ply):
+        """
+        Searches position with player to move
+        :param player: player to move
+        :param opponent: player who just moved
+        :param depth: remaining depth
+        :param alpha: lower bound
+        :param beta: upper bound
+        :param ply: distance from root
+        :return: score for player
+        """
+        self.nodes += 1
+        if self.nodes % CHECK_EVERY == 0 and time.time() > self.deadline:
+            raise SearchTimeout()
+        opponent_won = self.move.check_for_win(opponent)
+        if opponent_won and opponent.get_number() == 1:
+            return -WIN_SCORE + ply
+        if self.move.check_for_win(player):
+            return WIN_SCORE - ply
+        if opponent_won:
+            return -WIN_SCORE + ply
+        if depth <= 0:
+            return self.evaluate(player, opponent)
+        key = self.board.hash
+        table_move = None
+        if self.table is not None:
+            entry = self.table.probe(key)
+            if entry is not None:
+                table_move = self.unpack_move(entry[3])
+                if entry[0] >= depth:
+                    score = from_table(entry[1], ply)
+                    if entry[2] == TransTable.EXACT:
+                        return score
+                    elif entry[2] == TransTable.LOWER and score >= beta:
+                        return score
+                    elif entry[2] == TransTable.UPPER and score <= alpha:
+                        return score
+        moves = self.order_moves(player, list(self.move.generate_moves(player)), table_move)
+        if not moves:
+            return self.evaluate(player, opponent)
+        alpha_start = alpha
+        best = -WIN_SCORE - 1
+        best_move = None
+        for m in moves:
+            self.move.apply(m)
+            try:
+                score = -self.negamax(opponent, player, depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                self.move.undo()
+            if score > best:
+                best = score
+                best_move = m
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        if self.table is not None:
+            if best >= beta:
+                flag = TransTable.LOWER
+            elif best <= alpha_start:
+                flag = TransTable.UPPER
+            else:
+                flag = TransTable.EXACT
+            self.table.store(key, depth, to_table(best, ply), flag, self.pack_move(best_move))
+        return best
+
+    def pack_move(self, m):
+        """
+        Packs move into a single int for the transposition table
+        :param m: (r1, c1, r2, c2) tuple, None for no move
+        :return: packed move
+        """
+        if m is None:
+            return TransTable.NO_MOVE
+        cols = self.geometry.cols
+        return (m[0] * cols + m[1]) * self.geometry.size + m[2] * cols + m[3] + 1
+
+    def unpack_move(self, packed):
+        """
+        Unpacks move stored in the transposition table
+        :param packed: packed move
+        :return: (r1, c1, r2, c2) tuple, None for no move
+        """
+        if packed == TransTable.NO_MOVE:
+            return None
+        cols = self.geometry.cols
+        i1, i2 = divmod(packed - 1, self.geometry.size)
+        return i1 // cols, i1 % cols, i2 // cols, i2 % cols
+
+    def order_moves(self, player, moves, first):
+        """
+        Orders moves so captures and centralizing moves are searched first
+        :param player: player to move
+        :param moves: list of (r1, c1, r2, c2) tuples
+        :param first: move to search before all others, if any
+        :return: ordered list
+        """
+        opp = self.board.get_bits(self.move.opponent(player).get_piece())
+        cols = self.geometry.cols
+        centre = self.centre_distance
+
+        def key(m):
+            i1 = m[0] * cols + m[1]
+            i2 = m[2] * cols + m[3]
+            return (m != first, not (opp >> i2) & 1, centre[i2] - centre[i1])
+
+        moves.sort(key=key)
+        return moves
+
+    def evaluate(self, player, opponent):
+        """
+        Scores position for player
+        :param player: player to move
+        :param opponent: other player
+        :return: score
+        """
+        return int(round(self.side_score(player) - self.side_score(opponent)))
+
+    def side_score(self, player):
+        """
+        Scores one side by centralization, concentration, connected groups and mobility
+        :param player: player to score
+        :return: score
+        """
+        piece = player.get_piece()
+        bits = self.board.get_bits(piece)
+        count = bits.bit_count()
+        if count == 0:
+            return 0
+        cols = self.geometry.cols
+        centre = 0
+        row_sum = 0
+        col_sum = 0
+        cells = []
+        b = bits
+        while b:
+            low = b & -b
+            b ^= low
+            i = low.bit_length() - 1
+            centre += self.centre_distance[i]
+            row_sum += i // cols
+            col_sum += i % cols
+            cells.append(i)
+        mean_r = row_sum / count
+        mean_c = col_sum / count
+        spread = 0
+        for i in cells:
+            spread += max(abs(i // cols - mean_r), abs(i % cols - mean_c))
+        mobility = sum(1 for m in self.move.generate_moves(player))
+        return -CENTRE_WEIGHT * centre / count \
+            - CONCENTRATION_WEIGHT * spread / count \
+            - GROUP_WEIGHT * self.board.group_count(piece) \
+            + MOBILITY_WEIGHT * mobility
+
+
+def to_table(score, ply):
+    """
+    Makes win scores relative to the stored position instead of the root
+    :param score: score relative to root
+    :param ply: distance from root
+    :return: score to store
+    """
+    if score >= WIN_SCORE - MAX_DEPTH * 2:
+        return score + ply
+    elif score <= -WIN_SCORE + MAX_DEPTH * 2:
+        return score - ply
+    return score
+
+
+def from_table(score, ply):
+    """
+    Makes stored win scores relative to the root again
+    :param score: stored score
+    :param ply: distance from root
+    :return: score relative to root
+    """
+    if score >= WIN_SCORE - MAX_DEPTH * 2:
+        return score - ply
+    elif score <= -WIN_SCORE + MAX_DEPTH * 2:
+        return score + ply
+    return score
@@ -0,0 +1,296 @@
+"""
+Headless self-play
+
+Plays computer clients against each other in this process, with no
+server, sockets, pacing or display. A referee board checks each move
+with Move.is_legal_move and applies it with Move.apply, then both
+clients are told the move with move_was, as they would be by the
+server. Wins are decided as LOAServer.check_win decides them.
+
+Games are spread over a pool of processes and each result is written
+as soon as the game ends, as one JSON line or CSV row, so a long run
+can be watched or cut short without losing finished games.
+
+Players are given as client class names, optionally followed by
+constructor arguments:
+
+    ClientOkayC
+    ClientSearchC:time_limit=0.5,table_mb=4
+    ClientMCTSC:time_limit=0.2,progressive_bias=False
+
+A client given workers > 1 starts its own search processes, which a
+pool process cannot do, so its games must be played with -j 1.
+
+Every game is seeded, and the seed is written with its result. The
+seed seeds the random module in the game's process, and each client
+whose constructor takes a seed is given one made from it. Games
+between clients whose moves depend only on those random choices,
+such as ClientBadC and ClientOkayC, play out the same again from the
+seed. Time-limited searches (ClientSearchC, ClientMCTSC) also depend
+on how far they get in the time, so their games may not.
+
+Usage: python SelfPlay.py PLAYER1 PLAYER2 [-g GAMES] [-j JOBS] [-o FILE] [-t SECONDS] [-s] [-r]
+
+Starbuck Beagley
+"""
+import argparse
+import ast
+import csv
+import importlib
+import inspect
+import json
+import multiprocessing
+import random
+import sys
+import time
+from SuperClient import SuperClient
+import LOAServer
+
+COLS = 8
+MAX_PLIES = 300
+DEFAULT_TIME = 0.1
+SEED_BITS = 32
+
+NO_WIN = 0
+CSV_FIELDS = ["game", "player1", "player2", "winner", "reason", "plies", "seconds", "seed", "moves"]
+
+
+class ResultWriter:
+    def __init__(self, path, append=False):
+        """
+        Constructor, opens results file
+        :param path: file name, .csv for CSV, otherwise JSON lines
+        :param append: true to add to an existing file
+        """
+        self.csv = path.endswith(".csv")
+        self.file = open(path, "a" if append else "w", newline="" if self.csv else None)
+        self.writer = None
+        if self.csv:
+            self.writer = csv.DictWriter(self.file, CSV_FIELDS, extrasaction="ignore")
+            if self.file.tell() == 0:
+                self.writer.writeheader()
+
+    def write(self, result):
+        """
+        Writes one result and flushes it to disk
+        :param result: result dict from play_game
+        """
+        if self.csv:
+            row = dict(result)
+            if "moves" in row:
+                row["moves"] = " ".join(row["moves"])
+            self.writer.writerow(row)
+        else:
+            self.file.write(json.dumps(result) + "\n")
+        self.file.flush()
+
+    def close(self):
+        """ Closes results file """
+        self.file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("player1", help="client playing first, e.g. ClientOkayC or ClientSearchC:time_limit=0.5")
+    parser.add_argument("player2", help="client playing second")
+    parser.add_argument("-g", "--games", help="games to play", type=int, default=100)
+    parser.add_argument("-j", "--jobs", help="processes to play games on (default: one per core)", type=int)
+    parser.add_argument("-o", "--output", help="file to write results to, .csv for CSV, otherwise JSON lines",
+                        default="selfplay.jsonl")
+    parser.add_argument("-t", "--time_limit", help="seconds per move for clients that take a time limit",
+                        type=float, default=DEFAULT_TIME)
+    parser.add_argument("-m", "--max_plies", help="moves before a game is called a draw", type=int,
+                        default=MAX_PLIES)
+    parser.add_argument("-s", "--swap", help="swap sides every other game", action="store_true")
+    parser.add_argument("-r", "--record_moves", help="write each game's moves", action="store_true")
+    parser.add_argument("-S", "--seed", help="seed for the games' seeds", type=int)
+    args = parser.parse_args()
+
+    for spec in (args.player1, args.player2):
+        try:
+            check_jobs(spec, args.jobs)
+        except (ImportError, AttributeError, ValueError) as err:
+            print("Error: " + str(err))
+            sys.exit(1)
+
+    rng = random.Random(args.seed)
+    tasks = []
+    for game in range(0, args.games):
+        players = (args.player1, args.player2)
+        if args.swap and game % 2 == 1:
+            players = (args.player2, args.player1)
+        tasks.append((game + 1, players[0], players[1], rng.getrandbits(SEED_BITS), args.time_limit,
+                      args.max_plies, args.record_moves))
+
+    start = time.time()
+    wins = {args.player1: 0, args.player2: 0}
+    side_wins = {1: 0, 2: 0}
+    draws = 0
+    writer = ResultWriter(args.output)
+    try:
+        for result in play_games(tasks, args.jobs):
+            writer.write(result)
+            if result["winner"] == NO_WIN:
+                draws += 1
+            else:
+                wins[result["player" + str(result["winner"])]] += 1
+                side_wins[result["winner"]] += 1
+    finally:
+        writer.close()
+    elapsed = time.time() - start
+    print("%d games in %.1f s (%.1f games/s), results in %s"
+          % (args.games, elapsed, args.games / elapsed if elapsed else 0.0, args.output))
+    for spec in wins:
+        print(spec + ": " + str(wins[spec]) + " wins")
+    print("Player 1 won " + str(side_wins[1]) + ", player 2 won " + str(side_wins[2]) + ", draws: " + str(draws))
+
+
+def load_player(spec):
+    """
+    Finds client class and constructor arguments named by a player spec
+    :param spec: class name, optionally followed by ":name=value,name=value"
+    :return: (client class, dict of keyword arguments)
+    """
+    name, sep, options = spec.partition(":")
+    client_class = getattr(importlib.import_module(name), name)
+    if not (isinstance(client_class, type) and issubclass(client_class, SuperClient)):
+        raise ValueError(name + " is not a SuperClient subclass")
+    kwargs = {}
+    for option in options.split(","):
+        if not option:
+            continue
+        key, sep, value = option.partition("=")
+        try:
+            kwargs[key.strip()] = ast.literal_eval(value.strip())
+        except (ValueError, SyntaxError):
+            kwargs[key.strip()] = value.strip()
+    return client_class, kwargs
+
+
+def check_jobs(spec, jobs):
+    """
+    Checks that a player can play on the given number of processes: pool processes are daemonic and
+    cannot start the search processes of a client given workers > 1, so such a client must play in this process
+    :param spec: player spec, as for load_player
+    :param jobs: number of processes, as for play_games
+    """
+    client_class, kwargs = load_player(spec)
+    if kwargs.get("workers", 1) > 1 and jobs != 1:
+        raise ValueError(spec + " starts its own search processes, so its games must be played with -j 1")
+
+
+def make_client(spec, num, time_limit=DEFAULT_TIME, seed=None):
+    """
+    Creates and initializes client for a player spec
+    :param spec: player spec, as for load_player
+    :param num: player number
+    :param time_limit: seconds per move, used if the client takes a time limit and the spec gives none
+    :param seed: game seed, from which a client seed is made if the client takes one and the spec gives none
+    :return: client
+    """
+    client_class, kwargs = load_player(spec)
+    parameters = inspect.signature(client_class).parameters
+    if "time_limit" not in kwargs and "time_limit" in parameters:
+        kwargs["time_limit"] = time_limit
+    if seed is not None and "seed" not in kwargs and "seed" in parameters:
+        kwargs["seed"] = random.Random("%d:%d" % (seed, num)).getrandbits(SEED_BITS)
+    client = client_class(num, **kwargs)
+    client.initialize()
+    return client
+
+
+def play_game(spec1, spec2, time_limit=DEFAULT_TIME, max_plies=MAX_PLIES, record_moves=False, seed=None):
+    """
+    Plays one game between two clients
+    :param spec1: player spec of player 1
+    :param spec2: player spec of player 2
+    :param time_limit: seconds per move for clients that take a time limit
+    :param max_plies: moves before the game is called a draw
+    :param record_moves: true to include the game's moves in the result
+    :param seed: game seed for clients that take a seed, None for unseeded clients
+    :return: dict of player specs, winner (NO_WIN for a draw), reason, plies, seconds and moves
+    """
+    start = time.time()
+    clients = {1: make_client(spec1, 1, time_limit, seed), 2: make_client(spec2, 2, time_limit, seed)}
+    referee = SuperClient(1)
+    referee.initialize()
+    players = {1: referee.player, 2: referee.opponent}
+    moves = []
+    winner = NO_WIN
+    reason = "move limit"
+    side = 1
+    try:
+        for ply in range(0, max_plies):
+            m = clients[side].next_move()
+            a = []
+            if not m:
+                winner = 3 - side
+                reason = "no legal move for player " + str(side)
+                break
+            elif len(m) != 4 or not LOAServer.translate(m, a, COLS) or \
+                    not referee.move.is_legal_move(players[side], a[0], a[1], a[2], a[3]):
+                winner = 3 - side
+                reason = "illegal move " + "".join(str(x) for x in m) + " by player " + str(side)
+                break
+            referee.move.apply(tuple(a))
+            for client in clients.values():
+                client.move_was(side, a)
+            moves.append(str(a[0]) + chr(ord("A") + a[1]) + str(a[2]) + chr(ord("A") + a[3]))
+            if referee.move.check_for_win(players[1]):
+                winner = 1
+            elif referee.move.check_for_win(players[2]):
+                winner = 2
+            if winner != NO_WIN:
+                reason = "connected"
+                break
+            side = 3 - side
+    finally:
+        for client in clients.values():
+            client.close()
+    result = {
+        "player1": spec1,
+        "player2": spec2,
+        "winner": winner,
+        "reason": reason,
+        "plies": len(moves),
+        "seconds": round(time.time() - start, 3),
+    }
+    if record_moves:
+        result["moves"] = moves
+    return result
+
+
+def play_task(task):
+    """
+    Plays one game of a batch, seeding the random moves of this process and of the clients first
+    :param task: (game number, player 1 spec, player 2 spec, seed, time limit, max plies, record moves)
+    :return: result dict from play_game, with game number and seed
+    """
+    game, spec1, spec2, seed, time_limit, max_plies, record_moves = task
+    random.seed(seed)
+    result = play_game(spec1, spec2, time_limit, max_plies, record_moves, seed)
+    result["game"] = game
+    result["seed"] = seed
+    return result
+
+
+def play_games(tasks, jobs=None):
+    """
+    Plays games on a pool of processes, yielding each result as its game ends
+    :param tasks: list of task tuples, as for play_task
+    :param jobs: number of processes, defaults to one per core; 1 plays in this process
+    :return: iterator of result dicts, in the order games end
+    """
+    if jobs == 1:
+        for task in tasks:
+            yield play_task(task)
+        return
+    for spec in set(task[1] for task in tasks) | set(task[2] for task in tasks):
+        check_jobs(spec, jobs)
+    with multiprocessing.Pool(jobs) as pool:
+        for result in pool.imap_unordered(play_task, tasks):
+            yield result
+
+
+if __name__ == '__main__':
+    main()
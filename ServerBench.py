@@ -0,0 +1,133 @@
+"""
+Server throughput benchmark
+
+Starts a server in this process, connects a number of headless
+computer-vs-computer games to it and counts the moves played in a
+fixed time, once with pacing and once without.
+
+Usage: python ServerBench.py [-g GAMES] [-d SECONDS] [-a | -s SHARDS]
+
+Starbuck Beagley
+"""
+
+import argparse
+import socket
+import threading
+import time
+import Transport
+import Protocol
+import AsyncServer
+import ClientOkayC
+import ThreadedServer
+import Shard
+import GameSession
+
+INIT = 0
+P1_MOVE_REQ = 1
+P2_MOVE_REQ = 2
+P1_MOVE_WAS = 3
+P2_MOVE_WAS = 4
+QUIT_MESS = 7
+
+BENCH_PORT = 7668
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-g", "--games", help="concurrent games", type=int, default=8)
+    parser.add_argument("-d", "--duration", help="seconds to measure each mode", type=float, default=10)
+    parser.add_argument("-a", "--async_mode", help="benchmark the asyncio server", action="store_true")
+    parser.add_argument("-s", "--shards", help="benchmark the multi-process server with this many workers",
+                        type=int, default=0)
+    args = parser.parse_args()
+
+    for on in (True, False):
+        moves = run(args.games, args.duration, args.async_mode, on, BENCH_PORT + (0 if on else 1), args.shards)
+        print("Pacing " + ("on: " if on else "off:") + " %d moves in %.1f s, %.1f moves/s"
+              % (moves, args.duration, moves / args.duration))
+
+
+def run(games, duration, async_mode, on, port, shards=0):
+    """
+    Measures moves played by concurrent games in a fixed time
+    :param games: number of concurrent games
+    :param duration: seconds to measure
+    :param async_mode: true to benchmark AsyncServer, false for threaded Server
+    :param on: true to run with pacing
+    :param port: port for the server
+    :param shards: number of worker processes for Shard, 0 to run the server in this process
+    :return: total moves played
+    """
+    GameSession.set_pacing(on)
+    host = socket.gethostname()
+    if shards:
+        server_thread = threading.Thread(target=Shard.main, args=(host, port, shards), kwargs={"pacing": on},
+                                         daemon=True)
+    elif async_mode:
+        server_thread = threading.Thread(target=AsyncServer.main, args=(host, port), daemon=True)
+    else:
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server_socket.bind((host, port))
+        server_socket.listen(ThreadedServer.MAX_CLIENTS)
+        server_thread = threading.Thread(target=ThreadedServer.serve, args=(server_socket,), daemon=True)
+    server_thread.start()
+    time.sleep(0.5)
+
+    counts = [0] * games
+    stop = threading.Event()
+    clients = [threading.Thread(target=play, args=(host, port, counts, i, stop), daemon=True)
+               for i in range(games)]
+    for c in clients:
+        c.start()
+    time.sleep(duration)
+    stop.set()
+    total = sum(counts)
+    for c in clients:
+        c.join(1)
+
+    sock = Transport.FramedSocket(socket.create_connection((host, port)))
+    sock.send(Protocol.BinaryCodec().encode([QUIT_MESS, ""]))
+    sock.close()
+    server_thread.join(5)
+    return total
+
+
+def play(host, port, counts, slot, stop):
+    """
+    Plays computer-vs-computer games back to back until stopped
+    :param host: server host
+    :param port: server port
+    :param counts: list of move counts, one per slot
+    :param slot: index into counts for this player
+    :param stop: event set when measuring is over
+    """
+    while not stop.is_set():
+        sock = socket.create_connection((host, port))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = Transport.FramedSocket(sock)
+        codec = Protocol.BinaryCodec()
+        try:
+            conn.send(codec.encode([INIT, False]))
+            codec.decode(conn.recv())
+            clients = {1: ClientOkayC.ClientOkayC(1), 2: ClientOkayC.ClientOkayC(2)}
+            for c in clients.values():
+                c.initialize()
+            while not stop.is_set():
+                msg = codec.decode(conn.recv())
+                if msg[0] == P1_MOVE_REQ or msg[0] == P2_MOVE_REQ:
+                    conn.send(codec.encode([msg[0], clients[msg[0]].next_move()]))
+                elif msg[0] == P1_MOVE_WAS or msg[0] == P2_MOVE_WAS:
+                    for c in clients.values():
+                        c.move_was(msg[0] - 2, msg[1])
+                    counts[slot] += 1
+                else:
+                    break
+        except (OSError, EOFError):
+            pass
+        finally:
+            conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -5,7 +5,8 @@ Starbuck Beagley
 """
 
 import socket
-import pickle
+import Transport
+import Protocol
 
 PORT_NUM = 7667
 QUIT_MESS = 7
@@ -16,7 +17,7 @@ def main():
     host = socket.gethostname()
     port = PORT_NUM
     sock.connect((host, port))
-    sock.sendall(pickle.dumps([QUIT_MESS, ""]))
+    Transport.FramedSocket(sock).send(Protocol.BinaryCodec().encode([QUIT_MESS, ""]))
     return 0
 
 
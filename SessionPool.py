@@ -0,0 +1,108 @@
+"""
+Bounded pool of game sessions
+
+A fixed number of worker threads run game sessions taken from a
+queue. At most max_pending sessions wait for a worker; when every
+worker is busy and that many are waiting, new sessions are refused
+rather than queued, so the server answers "busy" instead of growing
+without limit. With max_pending 0 a session is only taken if a
+worker is free. Workers keep no reference
+to a session once it ends, so memory stays flat however long the
+server runs.
+
+Games spend most of their time waiting on client sockets, which
+threads do well; sockets are not handed between processes here.
+
+Starbuck Beagley
+"""
+import queue
+import threading
+import Metrics
+
+DEFAULT_WORKERS = 100
+DEFAULT_PENDING = 100
+
+
+class SessionPool:
+    def __init__(self, run, workers=DEFAULT_WORKERS, max_pending=DEFAULT_PENDING):
+        """
+        Constructor
+        :param run: function that plays one session, called with the arguments given to submit
+        :param workers: number of sessions run at once
+        :param max_pending: number of sessions that may wait for a free worker
+        """
+        if workers < 1 or max_pending < 0:
+            raise ValueError("SessionPool needs at least one worker and no negative pending limit")
+        self.run = run
+        self.capacity = workers + max_pending
+        self.pending = queue.Queue()
+        self.lock = threading.Lock()
+        self.sessions = 0
+        self.active = 0
+        self.finished = 0
+        self.rejected = 0
+        self.workers = []
+        for i in range(0, workers):
+            worker = threading.Thread(target=self.work, name="session-" + str(i))
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self, *args):
+        """
+        Queues session for the next free worker
+        :param args: arguments for run
+        :return: true if session was queued, false if pool is saturated
+        """
+        with self.lock:
+            if self.sessions >= self.capacity:
+                self.rejected += 1
+                return False
+            self.sessions += 1
+        self.pending.put(args)
+        return True
+
+    def work(self):
+        """ Runs sessions until shut down """
+        while 1:
+            args = self.pending.get()
+            if args is None:
+                break
+            with self.lock:
+                self.active += 1
+            try:
+                self.run(*args)
+            except Exception as err:
+                Metrics.log.error("Session ended with error: " + repr(err))
+            with self.lock:
+                self.sessions -= 1
+                self.active -= 1
+                self.finished += 1
+            args = None
+
+    def shutdown(self):
+        """ Lets workers exit once queued sessions have been played """
+        for i in range(0, len(self.workers)):
+            self.pending.put(None)
+
+    def stats(self):
+        """
+        Gets session counts
+        :return: dict of stats
+        """
+        with self.lock:
+            return {
+                "active": self.active,
+                "pending": self.sessions - self.active,
+                "finished": self.finished,
+                "rejected": self.rejected,
+            }
+
+
+def format_stats(stats):
+    """
+    Formats stats for the server log
+    :param stats: dict from SessionPool.stats
+    :return: one-line summary
+    """
+    return ("%d active, %d pending, %d finished, %d rejected"
+            % (stats["active"], stats["pending"], stats["finished"], stats["rejected"]))
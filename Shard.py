@@ -0,0 +1,196 @@
+"""
+Multi-process game server
+
+Game logic is pure Python, so one server process uses one core
+however many games it hosts. This server starts a number of worker
+processes, each with its own SessionPool of game threads, and a
+front process that owns the listening socket.
+
+The front process accepts clients and reads their first message
+exactly as ThreadedServer.py does, and pairs remote players with a single
+Matchmaker, so players are paired across all workers. Once a game
+has its players, the front process hands the client sockets to a
+worker over a Unix socket (SCM_RIGHTS), along with what the worker
+needs to carry on: the game id, each client's framing, codec and
+delta-update choice, and any bytes already read. Workers are chosen
+in turn. The front process closes its copy of the sockets and plays
+no part in the game. On shutdown it sends each worker a stop message
+and waits for their games to finish.
+
+Each process keeps its own metrics. With a metrics port, the front
+process serves pairing metrics on it and worker i serves its game
+metrics on the port i + 1 above it.
+
+Requires Unix (socket.send_fds).
+
+Starbuck Beagley
+"""
+import itertools
+import multiprocessing
+import pickle
+import socket
+import ThreadedServer
+import SessionPool
+import GameSession
+import Transport
+import Protocol
+import Metrics
+
+ERR_MESS = 6
+
+SERVER_PORT = 7667
+MAX_CLIENTS = 100
+HANDOFF_SIZE = 65536
+MAX_FDS = 2
+BUSY_MESS = "Server busy. Try again later."
+
+log = Metrics.log
+
+
+class Front:
+    def __init__(self, shards, workers, max_pending, pacing=True, clock_settings=GameSession.DEFAULT_CLOCK,
+                 metrics_port=None):
+        """
+        Constructor, starts worker processes
+        :param shards: number of worker processes
+        :param workers: games played at once by each worker process
+        :param max_pending: games that may wait for a free thread in each worker process
+        :param pacing: true to pause between server messages
+        :param clock_settings: (initial, increment, move limit) for each game's Clock
+        :param metrics_port: port the front process's metrics are served on, None for no metrics;
+                             worker i serves its own on metrics_port + 1 + i
+        """
+        self.channels = []
+        self.processes = []
+        log.flush()
+        for i in range(0, shards):
+            parent, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+            process = multiprocessing.Process(target=worker_main, name="shard-" + str(i),
+                                              args=(child, workers, max_pending, pacing, clock_settings, log.level,
+                                                    metrics_port and metrics_port + 1 + i))
+            process.start()
+            child.close()
+            self.channels.append(parent)
+            self.processes.append(process)
+        self.next_channel = itertools.cycle(range(0, shards))
+
+    def start_game(self, game_id, client_socket1, client_socket2):
+        """
+        Hands game to the next worker process
+        :param game_id: unique game identifier
+        :param client_socket1: FramedSocket for client 1
+        :param client_socket2: FramedSocket for client 2 (None if local game)
+        """
+        clients = [c for c in (client_socket1, client_socket2) if c is not None]
+        state = (game_id, [(c.framed, c.codec.version, c.delta, c.get_unread()) for c in clients])
+        channel = self.channels[next(self.next_channel)]
+        try:
+            socket.send_fds(channel, [pickle.dumps(state)], [c.sock.fileno() for c in clients])
+        except OSError as err:
+            Metrics.games_rejected.inc()
+            log.warning("Game #" + str(game_id) + ": Could not hand game to worker: " + str(err))
+            for c in clients:
+                try:
+                    ThreadedServer.send_msg(c, [ERR_MESS, BUSY_MESS])
+                except OSError:
+                    pass
+        ThreadedServer.close_sockets(client_socket1, client_socket2)
+
+    def shutdown(self):
+        """ Tells workers to exit once their games are over, and waits for them """
+        for channel in self.channels:
+            try:
+                channel.send(pickle.dumps(None))
+            except OSError:
+                pass
+            channel.close()
+        for process in self.processes:
+            process.join()
+
+
+def main(host=None, port=SERVER_PORT, shards=None, workers=SessionPool.DEFAULT_WORKERS,
+         max_pending=SessionPool.DEFAULT_PENDING, metrics_port=None, pacing=True,
+         clock_settings=GameSession.DEFAULT_CLOCK):
+    """
+    Runs front process and worker processes until remotely shut down
+    :param host: host name to bind, defaults to this host's name
+    :param port: port to bind
+    :param shards: number of worker processes, defaults to one per core
+    :param workers: games played at once by each worker process
+    :param max_pending: games that may wait for a free thread in each worker process
+    :param metrics_port: port the front process's metrics are served on, None for no metrics;
+                         worker i serves its own on metrics_port + 1 + i
+    :param pacing: true to pause between server messages
+    :param clock_settings: (initial, increment, move limit) for each game's Clock
+    """
+    if shards is None:
+        shards = multiprocessing.cpu_count()
+    if host is None:
+        host = socket.gethostname()
+    front = Front(shards, workers, max_pending, pacing, clock_settings, metrics_port)
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server_socket.bind((host, port))
+    server_socket.listen(MAX_CLIENTS)
+    log.info("Playing games on " + str(shards) + " worker processes")
+    try:
+        ThreadedServer.accept_clients(server_socket, front.start_game)
+    finally:
+        server_socket.close()
+        front.shutdown()
+
+
+def worker_main(channel, workers, max_pending, pacing, clock_settings, log_level=Metrics.INFO, metrics_port=None):
+    """
+    Plays games handed over by the front process until told to stop
+    :param channel: Unix socket from the front process
+    :param workers: games played at once
+    :param max_pending: games that may wait for a free thread
+    :param pacing: true to pause between server messages
+    :param clock_settings: (initial, increment, move limit) for GameSession.set_clock
+    :param log_level: lowest level of messages logged
+    :param metrics_port: port to serve this worker's metrics on, None for no metrics
+    """
+    GameSession.set_pacing(pacing)
+    GameSession.set_clock(*clock_settings)
+    log.set_level(log_level)
+    pool = SessionPool.SessionPool(ThreadedServer.run_game, workers, max_pending)
+    Metrics.active_games.set_function(lambda: pool.stats()["active"])
+    if metrics_port:
+        Metrics.serve_http(metrics_port)
+    while 1:
+        try:
+            data, fds, flags, addr = socket.recv_fds(channel, HANDOFF_SIZE, MAX_FDS)
+        except OSError:
+            break
+        if not data:
+            break
+        handoff = pickle.loads(data)
+        if handoff is None:
+            break
+        game_id, states = handoff
+        clients = [take_socket(fd, state) for fd, state in zip(fds, states)]
+        if len(clients) == 1:
+            clients.append(None)
+        ThreadedServer.start_game(pool, game_id, clients[0], clients[1])
+    log.info("Worker games: " + SessionPool.format_stats(pool.stats()))
+    pool.shutdown()
+    log.flush()
+
+
+def take_socket(fd, state):
+    """
+    Rebuilds a client's FramedSocket from a handed-over file descriptor
+    :param fd: file descriptor received from the front process
+    :param state: (framed, codec version, delta, unread bytes)
+    :return: FramedSocket
+    """
+    framed, version, delta, unread = state
+    client_socket = Transport.FramedSocket(socket.socket(fileno=fd), framed)
+    if version == Protocol.PickleCodec.version:
+        client_socket.codec = Protocol.PickleCodec()
+    else:
+        client_socket.codec = Protocol.BinaryCodec(version=version)
+    client_socket.delta = delta
+    client_socket.set_unread(unread)
+    return client_socket
@@ -10,6 +10,7 @@ import Move
 
 ROWS = 8
 COLS = 8
+BANK_MOVES = 20
 
 
 class SuperClient:
@@ -27,6 +28,8 @@ class SuperClient:
             self.opponent = Player.Player(1)
             self.board = Board.Board(ROWS, COLS, self.opponent, self.player)
             self.move = Move.Move(self.board, self.opponent, self.player)
+        self.move_time = None
+        self.bank = None
 
     def initialize(self):
         """
@@ -48,6 +51,28 @@ class SuperClient:
         """
         pass
 
+    def set_time(self, move_time, bank):
+        """
+        Sets time the server gives player for the next move
+        :param move_time: seconds for the move, None if unlimited
+        :param bank: seconds left on player's clock, None if no clock
+        """
+        self.move_time = move_time
+        self.bank = bank
+
+    def time_budget(self, time_limit):
+        """
+        Gets seconds to spend on the next move: the time limit, cut to the time the server
+        gives for the move and to a share of the player's clock
+        :param time_limit: most seconds player wants to spend
+        :return: seconds
+        """
+        if self.move_time is not None:
+            time_limit = min(time_limit, self.move_time)
+        if self.bank is not None:
+            time_limit = min(time_limit, self.bank / BANK_MOVES)
+        return time_limit
+
     def move_was(self, p, move):
         """
         Applies last move to local board object
@@ -58,3 +83,44 @@ class SuperClient:
             self.move.make_move(self.player, move[0], move[1], move[2], move[3])
         else:
             self.move.make_move(self.opponent, move[0], move[1], move[2], move[3])
+
+    def resync(self, grid, side):
+        """
+        Replaces local board with a full snapshot from the server
+        :param grid: board state
+        :param side: number of player to move
+        """
+        self.board.set_grid(grid, side)
+        self.position_replaced()
+
+    def set_position(self, bits1, bits2, side):
+        """
+        Replaces local board with a position given as bitboards, e.g. in a search worker
+        :param bits1: player 1 bitboard
+        :param bits2: player 2 bitboard
+        :param side: number of player to move
+        """
+        self.board.set_bits(bits1, bits2, side)
+        self.position_replaced()
+
+    def position_replaced(self):
+        """
+        Clears undo history and recounts pieces after the board is replaced
+        """
+        self.move.undo_stack = []
+        self.player.set_pieces_left(self.board.get_bits(self.player.get_piece()).bit_count())
+        self.opponent.set_pieces_left(self.board.get_bits(self.opponent.get_piece()).bit_count())
+
+    def in_sync(self, position_hash):
+        """
+        Checks local board against the server's position hash
+        :param position_hash: hash sent with a delta update
+        :return: true if local board matches, false otherwise
+        """
+        return self.board.get_hash() == position_hash
+
+    def close(self):
+        """
+        Frees resources held by the client; clients with search processes or a book override this
+        """
+        pass
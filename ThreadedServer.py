@@ -0,0 +1,391 @@
+"""
+Threaded game server
+
+Plays games with two players on threads and sockets, for Server.py's
+default mode and for Shard.py's processes. Each client's first
+message is read on a thread of its own, up to MAX_HANDSHAKES at once
+with further connections refused, remote players are paired by
+Matchmaker, and games are GameSessions played on a fixed SessionPool
+of worker threads; when it is saturated, new games are refused with
+a busy message.
+
+Starbuck Beagley
+"""
+
+import socket
+import pickle
+import time
+import threading
+import itertools
+import functools
+import LOAServer
+import Transport
+import Protocol
+import Matchmaker
+import SessionPool
+import GameSession
+import Metrics
+
+INIT = 0
+P1_MOVE_REQ = 1
+P2_MOVE_REQ = 2
+P1_MOVE_WAS = 3
+P2_MOVE_WAS = 4
+WIN_MESS = 5
+ERR_MESS = 6
+QUIT_MESS = 7
+CONTINUE_GAME = 8
+END_GAME = 9
+RESYNC_MESS = 10
+
+P1 = 1
+P2 = 2
+
+BUFF_SIZE = 1024
+SERVER_PORT = 7667
+MAX_CLIENTS = 100
+FIRST_GAME_ID = 1
+TIME_DELAY = 0.5
+HANDSHAKE_TIMEOUT = 10
+MAX_HANDSHAKES = 100
+ACCEPT_POLL = 0.5
+BUSY_MESS = "Server busy. Try again later."
+
+log = Metrics.log
+
+
+def main(host=None, port=SERVER_PORT, workers=SessionPool.DEFAULT_WORKERS, max_pending=SessionPool.DEFAULT_PENDING):
+    """
+    Runs threaded server until remotely shut down
+    :param host: host name to bind, defaults to this host's name
+    :param port: port to bind
+    :param workers: games played at once
+    :param max_pending: games that may wait for a free worker before new games are refused
+    """
+    if host is None:
+        host = socket.gethostname()
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.bind((host, port))
+    server_socket.listen(MAX_CLIENTS)
+    serve(server_socket, workers, max_pending)
+
+
+def pause(seconds, client_sockets=()):
+    """
+    Pauses between messages so human players can follow the game, as GameSession.paced decides
+    :param seconds: length of pause
+    :param client_sockets: sockets about to be sent to
+    """
+    if GameSession.paced(client_sockets):
+        time.sleep(seconds)
+
+
+def serve(server_socket, workers=SessionPool.DEFAULT_WORKERS, max_pending=SessionPool.DEFAULT_PENDING):
+    """
+    Accepts clients and starts games until a client sends QUIT_MESS
+    :param server_socket: bound, listening server socket
+    :param workers: games played at once
+    :param max_pending: games that may wait for a free worker before new games are refused
+    """
+    pool = SessionPool.SessionPool(run_game, workers, max_pending)
+    Metrics.active_games.set_function(lambda: pool.stats()["active"])
+    accept_clients(server_socket, functools.partial(start_game, pool))
+    log.info("Games: " + SessionPool.format_stats(pool.stats()))
+    pool.shutdown()
+
+
+def accept_clients(server_socket, start):
+    """
+    Accepts clients, reading each one's first message on its own thread,
+    until a client sends QUIT_MESS. Connections beyond MAX_HANDSHAKES
+    still sending their first message are closed at once.
+    :param server_socket: bound, listening server socket
+    :param start: function called with game id and both client sockets to start a game
+    """
+    matchmaker = Matchmaker.Matchmaker()
+    game_ids = itertools.count(FIRST_GAME_ID)
+    stopped = threading.Event()
+    handshakes = threading.BoundedSemaphore(MAX_HANDSHAKES)
+    Metrics.queue_depth.set_function(matchmaker.queue_depth)
+
+    server_socket.settimeout(ACCEPT_POLL)
+    log.info("Waiting for players")
+    while not stopped.is_set():
+        try:
+            new_socket, addr1 = server_socket.accept()
+        except socket.timeout:
+            matchmaker.prune()
+            continue
+        accepted = time.monotonic()
+        new_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        Metrics.connections.inc()
+        log.debug("Got connection from %s" % str(addr1))
+        if not handshakes.acquire(blocking=False):
+            log.warning("Server busy (" + str(MAX_HANDSHAKES) + " clients sending first message). "
+                        "Refusing connection.")
+            new_socket.close()
+            continue
+        threading.Thread(target=limited_handshake,
+                         args=(handshakes, new_socket, matchmaker, game_ids, start, stopped, accepted),
+                         daemon=True).start()
+
+    log.info("Matchmaking: " + Matchmaker.format_stats(matchmaker.stats()))
+    for game_id, conn in matchmaker.waiting():
+        try:
+            send_msg(conn, [QUIT_MESS, GameSession.STOP_MESS])
+        except OSError:
+            pass
+        conn.close()
+
+
+def limited_handshake(handshakes, *args):
+    """
+    Runs handshake, then frees its place for another connection
+    :param handshakes: semaphore held for this handshake
+    :param args: arguments for handshake
+    """
+    try:
+        handshake(*args)
+    finally:
+        handshakes.release()
+
+
+def handshake(new_socket, matchmaker, game_ids, start, stopped, accepted=None):
+    """
+    Reads first message from a new client and starts or queues its game,
+    off the accept loop so a slow client cannot hold up other connections
+    :param new_socket: newly accepted socket
+    :param matchmaker: queue of players waiting for a remote opponent
+    :param game_ids: iterator of new game ids
+    :param start: function called with game id and both client sockets to start a game
+    :param stopped: event set when server is remotely shut down
+    :param accepted: time.monotonic() when the connection was accepted, defaults to now
+    """
+    if accepted is None:
+        accepted = time.monotonic()
+    client_socket1 = None
+    handed_off = False
+    try:
+        try:
+            new_socket.settimeout(HANDSHAKE_TIMEOUT)
+            client_socket1 = Transport.accept(new_socket)
+            msg_in1 = client_socket1.recv(time.monotonic() + HANDSHAKE_TIMEOUT)
+            client_socket1.codec = Protocol.negotiate(msg_in1)
+            msg = Protocol.check_first_message(client_socket1.codec.decode(msg_in1))
+            client_socket1.settimeout(None)
+        except socket.timeout:
+            log.warning("Client sent no first message in " + str(HANDSHAKE_TIMEOUT) + " seconds. Disconnecting.")
+            return
+        except (OSError, EOFError) as err:
+            log.warning("Error: " + str(err) + ".")
+            if client_socket1 is not None and client_socket1.codec is not None:
+                send_error(client_socket1, str(err))
+            return
+        except (pickle.UnpicklingError, ValueError) as err:
+            log.warning("Unreadable first message: " + str(err) + ".")
+            return
+
+        if msg[0] == INIT:
+            client_socket1.delta = len(msg) > 2 and bool(msg[2])
+            size = msg[3] if len(msg) > 3 else LOAServer.ROWS
+            rating = msg[4] if len(msg) > 4 else Matchmaker.UNRATED
+            if size != LOAServer.ROWS:
+                err_msg = "Board size " + str(size) + " is not supported."
+                log.warning(err_msg)
+                send_error(client_socket1, err_msg)
+            elif msg[1]:
+                game_id, opp, wait = matchmaker.pair(client_socket1, game_ids, size, rating, accepted)
+                handed_off = True
+                if opp is not None:
+                    Metrics.pairing_time.observe(wait)
+                    Metrics.pairing_time.observe(time.monotonic() - accepted)
+                    log.info("Game #" + str(game_id) + ": Got remote opponent after %.1f s. Starting game." % wait)
+                    start(game_id, opp, client_socket1)
+                else:
+                    log.info("Game #" + str(game_id) + ": Got player who needs remote opponent. Adding to queue (" +
+                             str(matchmaker.queue_depth()) + " waiting).")
+            else:
+                game_id = next(game_ids)
+                Metrics.pairing_time.observe(time.monotonic() - accepted)
+                log.info("Game #" + str(game_id) + ": No remote player needed. Starting game.")
+                handed_off = True
+                start(game_id, client_socket1, None)
+        elif msg[0] == QUIT_MESS:
+            log.info("Server remotely shut down.")
+            stopped.set()
+        else:
+            err_msg = "Server needs to know if player 2 is remote. Passing."
+            log.warning(err_msg)
+            send_error(client_socket1, err_msg)
+    finally:
+        if not handed_off:
+            new_socket.close()
+
+
+def start_game(pool, game_id, client_socket1, client_socket2):
+    """
+    Queues game for the session pool, refusing it if the pool is saturated
+    :param pool: pool that plays games
+    :param game_id: unique game identifier
+    :param client_socket1: socket object for client 1
+    :param client_socket2: socket object for client 2 ("None" if local game)
+    """
+    if pool.submit(game_id, client_socket1, client_socket2):
+        return
+    Metrics.games_rejected.inc()
+    log.warning("Game #" + str(game_id) + ": Server busy (" + SessionPool.format_stats(pool.stats()) +
+                "). Refusing game.")
+    for client_socket in (client_socket1, client_socket2):
+        if client_socket is not None:
+            try:
+                send_msg(client_socket, [ERR_MESS, BUSY_MESS])
+            except OSError:
+                pass
+    close_sockets(client_socket1, client_socket2)
+
+
+def run_game(game_id, client_socket1, client_socket2, clock=None):
+    """
+    Function to control one game, run by a session pool worker
+    :param game_id: unique game identifier
+    :param client_socket1: socket object for client 1
+    :param client_socket2: socket object for client 2 ("None" if local game)
+    :param clock: Clock for this game, defaults to one set up by GameSession.set_clock
+    """
+    session = GameSession.GameSession(game_id, client_socket2 is not None, clock)
+    outcome = CONTINUE_GAME
+    try:
+        for client_id, client_socket in ((P2, client_socket2), (P1, client_socket1)):
+            if client_socket is None:
+                continue
+            try:
+                send_msg(client_socket, session.init_message(client_id, client_socket.delta), session.board)
+            except OSError as err:
+                outcome, reply, delay = session.error(client_id, str(err))
+                send_reply(session, client_socket1, client_socket2, reply, delay)
+                break
+
+        while outcome == CONTINUE_GAME:
+            client_socket = session.mover(client_socket1, client_socket2)
+            pause(TIME_DELAY, (client_socket,))
+            msg = get_move(session, client_socket)
+            client_id = session.current_player
+            outcome, reply, delay = session.play(msg)
+            err_str = send_reply(session, client_socket1, client_socket2, reply, delay)
+            if err_str is not None and outcome == CONTINUE_GAME:
+                outcome, reply, delay = session.error(client_id, err_str)
+                send_reply(session, client_socket1, client_socket2, reply, delay)
+    finally:
+        close_sockets(client_socket1, client_socket2)
+
+
+def get_move(session, client_socket):
+    """
+    Sends message to socket requesting move, forfeiting the game for the
+    player as soon as their clock runs out
+    :param session: GameSession of the game
+    :param client_socket: socket of player to move
+    :return: client move if successful, error message otherwise
+    """
+    pause(TIME_DELAY, (client_socket,))
+    session.start_turn()
+    msg = send_request(session, client_socket, client_socket.delta)
+    if session.needs_resync(msg):
+        msg = send_request(session, client_socket, False)
+    return session.end_turn(msg)
+
+
+def send_request(session, client_socket, delta):
+    """
+    Sends move request to socket and waits for the reply until the clock runs out
+    :param session: GameSession of the game, with the clock running for the player to move
+    :param client_socket: socket of player to move
+    :param delta: true to send position hash instead of full board
+    :return: client reply if successful, error message otherwise
+    """
+    sent = time.perf_counter()
+    try:
+        send_msg(client_socket, session.move_request(delta), session.board)
+    except OSError as err:
+        return [ERR_MESS, str(err)]
+    wait = session.time_left()
+    if wait is not None and wait <= 0:
+        return session.out_of_time()
+    try:
+        msg_in = client_socket.recv(time.monotonic() + wait if wait is not None else None)
+    except socket.timeout:
+        return session.out_of_time()
+    except (OSError, EOFError) as err:
+        return [ERR_MESS, str(err)]
+    Metrics.round_trip_time.since(sent)
+    try:
+        start = time.perf_counter()
+        msg = client_socket.codec.decode(msg_in)
+        Metrics.decode_time.since(start)
+        return msg
+    except (pickle.UnpicklingError, EOFError, Protocol.ProtocolError, ValueError) as err:
+        return [ERR_MESS, "Unreadable message from Player " + str(session.current_player) + ": " + str(err)]
+
+
+def send_reply(session, client_socket1, client_socket2, reply, delay):
+    """
+    Sends both clients what the game session decided they are sent
+    :param session: GameSession of the game
+    :param client_socket1: socket for client 1
+    :param client_socket2: socket for client 2 (None if local game)
+    :param reply: function of a client's delta flag giving its message, None to send nothing
+    :param delay: seconds to pause before sending
+    :return: None if sent, error string otherwise
+    """
+    if reply is None:
+        return None
+    pause(delay, (client_socket1, client_socket2))
+    for client_socket in (client_socket1, client_socket2):
+        if client_socket is not None:
+            try:
+                send_msg(client_socket, reply(client_socket.delta), session.board)
+            except OSError as err:
+                return str(err)
+    return None
+
+
+def send_msg(client_socket, msg, board=None):
+    """
+    Encodes message with the codec agreed with the client and sends it
+    :param client_socket: client's FramedSocket
+    :param msg: message list
+    :param board: board the message's grid came from, if any
+    """
+    start = time.perf_counter()
+    data = client_socket.codec.encode(msg, board)
+    Metrics.encode_time.since(start)
+    client_socket.send(data)
+
+
+def send_error(client_socket, err_msg):
+    """
+    Sends error message to a client, ignoring a lost connection
+    :param client_socket: client's FramedSocket
+    :param err_msg: error string
+    """
+    try:
+        send_msg(client_socket, [ERR_MESS, err_msg])
+    except OSError:
+        pass
+
+
+def close_sockets(client_socket1, client_socket2):
+    """
+    Closes sockets
+    :param client_socket1: socket for client 1
+    :param client_socket2: socket for client 2
+    """
+    try:
+        client_socket1.close()
+    except OSError:
+        pass
+    if client_socket2 is not None:
+        try:
+            client_socket2.close()
+        except OSError:
+            pass
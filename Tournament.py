@@ -0,0 +1,466 @@
+"""
+Engine tournaments
+
+Plays a round robin, or a gauntlet of the first player against each
+of the others, between client configurations given as SelfPlay
+player specs, e.g. ClientOkayC or ClientSearchC:time_limit=0.5.
+Games are played by SelfPlay on a pool of processes, and players
+swap sides every game.
+
+Every result is appended to a JSON lines results store as soon as
+its game ends. Running the same tournament again with the same store
+reads it back and plays only the games still missing, so an
+interrupted tournament carries on where it stopped. A CSV store could
+not be read back, so it is refused. Each game's seed
+comes from the tournament seed, the pairing and the round, so the
+schedule is the same however often it is resumed.
+
+Ratings are Elo, fitted to all results with the first player
+anchored at 0, each with a 95% confidence interval. Every pairing is
+also shown head to head with its own interval.
+
+With --sprt ELO0 ELO1, each pairing is a sequential probability
+ratio test of "the first player is ELO0 stronger" against "ELO1
+stronger". The pairing stops as soon as the log-likelihood ratio
+crosses a bound set by --alpha and --beta, rather than always
+playing every game. No pairing stops before SPRT_MIN_GAMES games,
+as the normal approximation the test uses is poor before then.
+
+Usage: python Tournament.py SPEC SPEC [SPEC ...] [-G] [-n GAMES] [-j JOBS] [-o STORE] [--sprt ELO0 ELO1]
+
+Starbuck Beagley
+"""
+import argparse
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import queue
+import random
+import sys
+import SelfPlay
+
+DEFAULT_STORE = "tournament.jsonl"
+GAMES_PER_PAIR = 100
+IN_FLIGHT = 2
+Z_95 = 1.96
+ALPHA = 0.05
+BETA = 0.05
+SPRT_MIN_GAMES = 16
+VARIANCE_FLOOR = 0.01
+FIT_ROUNDS = 200
+MAX_ELO = 1000
+
+H0 = "H0"
+H1 = "H1"
+
+
+class Tournament:
+    def __init__(self, players, gauntlet=False, games_per_pair=GAMES_PER_PAIR, store=DEFAULT_STORE,
+                 time_limit=SelfPlay.DEFAULT_TIME, max_plies=SelfPlay.MAX_PLIES, seed=0, sprt=None,
+                 alpha=ALPHA, beta=BETA):
+        """
+        Constructor, reads back any results already in the store
+        :param players: list of player specs
+        :param gauntlet: true to play the first player against each of the others only
+        :param games_per_pair: most games per pairing
+        :param store: JSON lines file results are kept in, not CSV, which cannot be read back
+        :param time_limit: seconds per move for clients that take a time limit
+        :param max_plies: moves before a game is called a draw
+        :param seed: tournament seed, from which every game's seed is made
+        :param sprt: (elo0, elo1) to stop pairings early by SPRT, None to play every game
+        :param alpha: SPRT false positive rate
+        :param beta: SPRT false negative rate
+        """
+        if store.endswith(".csv"):
+            raise ValueError("the results store must be JSON lines, not CSV, to be resumed")
+        self.players = players
+        if gauntlet:
+            self.pairs = [(players[0], p) for p in players[1:]]
+        else:
+            self.pairs = list(itertools.combinations(players, 2))
+        self.games_per_pair = games_per_pair
+        self.store = store
+        self.time_limit = time_limit
+        self.max_plies = max_plies
+        self.seed = seed
+        self.sprt = sprt
+        self.bounds = sprt_bounds(alpha, beta)
+        self.counts = {pair: [0, 0, 0] for pair in self.pairs}
+        self.verdicts = {}
+        self.announced = set()
+        self.done = set()
+        self.load()
+
+    def load(self):
+        """ Reads results store, skipping other games and cutting off a line an interruption left unfinished """
+        if not os.path.exists(self.store):
+            return
+        with open(self.store, "rb+") as f:
+            data = f.read()
+            end = data.rfind(b"\n") + 1
+            if end < len(data):
+                f.truncate(end)
+        for line in data[:end].decode("utf-8").splitlines():
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            pair = self.pair_of(result)
+            key = (pair, result.get("round"))
+            if pair is not None and key[1] is not None and key not in self.done:
+                self.done.add(key)
+                self.record(pair, result)
+
+    def pair_of(self, result):
+        """
+        Finds pairing a result belongs to
+        :param result: result dict
+        :return: (first player, second player) pairing, None if not in this tournament
+        """
+        for pair in self.pairs:
+            if {result["player1"], result["player2"]} == set(pair) and result["player1"] != result["player2"]:
+                return pair
+        return None
+
+    def record(self, pair, result):
+        """
+        Counts result from the pairing's first player's point of view, and updates its SPRT
+        :param pair: pairing
+        :param result: result dict
+        """
+        counts = self.counts[pair]
+        if result["winner"] == SelfPlay.NO_WIN:
+            counts[1] += 1
+        elif result["player" + str(result["winner"])] == pair[0]:
+            counts[0] += 1
+        else:
+            counts[2] += 1
+        if self.sprt is not None and pair not in self.verdicts and sum(counts) >= SPRT_MIN_GAMES:
+            llr = sprt_llr(counts[0], counts[1], counts[2], self.sprt[0], self.sprt[1])
+            if llr <= self.bounds[0]:
+                self.verdicts[pair] = H0
+            elif llr >= self.bounds[1]:
+                self.verdicts[pair] = H1
+
+    def tasks(self):
+        """
+        Lists games still to play, one round of every pairing at a time
+        :return: list of (pairing, SelfPlay task tuple)
+        """
+        tasks = []
+        for game in range(0, self.games_per_pair):
+            for p in range(0, len(self.pairs)):
+                pair = self.pairs[p]
+                if (pair, game) in self.done:
+                    continue
+                if game % 2 == 0:
+                    spec1, spec2 = pair
+                else:
+                    spec2, spec1 = pair
+                seed = random.Random("%d:%d:%d" % (self.seed, p, game)).getrandbits(SelfPlay.SEED_BITS)
+                tasks.append((pair, (game, spec1, spec2, seed, self.time_limit, self.max_plies, False)))
+        return tasks
+
+    def run(self, jobs=None):
+        """
+        Plays missing games, appending each result to the store, until every pairing is
+        complete or stopped by SPRT
+        :param jobs: number of processes, defaults to one per core; 1 plays in this process
+        """
+        pending = [task for task in self.tasks() if task[0] not in self.verdicts]
+        writer = SelfPlay.ResultWriter(self.store, append=True)
+        try:
+            if jobs == 1:
+                for pair, task in pending:
+                    if pair not in self.verdicts:
+                        self.finish(writer, pair, SelfPlay.play_task(task))
+                return
+            for spec in self.players:
+                SelfPlay.check_jobs(spec, jobs)
+            if jobs is None:
+                jobs = multiprocessing.cpu_count()
+            results = queue.Queue()
+            with multiprocessing.Pool(jobs) as pool:
+                in_flight = 0
+                pending.reverse()
+                while pending or in_flight:
+                    while pending and in_flight < jobs * IN_FLIGHT:
+                        pair, task = pending.pop()
+                        if pair in self.verdicts:
+                            continue
+                        pool.apply_async(SelfPlay.play_task, (task,),
+                                         callback=lambda result, pair=pair: results.put((pair, result)),
+                                         error_callback=lambda err, pair=pair: results.put((pair, err)))
+                        in_flight += 1
+                    if not in_flight:
+                        break
+                    pair, result = results.get()
+                    in_flight -= 1
+                    if isinstance(result, Exception):
+                        print("Game failed: " + repr(result))
+                        continue
+                    self.finish(writer, pair, result)
+        finally:
+            writer.close()
+
+    def finish(self, writer, pair, result):
+        """
+        Stores and counts one finished game
+        :param writer: SelfPlay.ResultWriter for the store
+        :param pair: pairing the game belongs to
+        :param result: result dict from SelfPlay.play_task
+        """
+        result["round"] = result["game"]
+        writer.write(result)
+        self.done.add((pair, result["round"]))
+        self.record(pair, result)
+        if pair in self.verdicts and pair not in self.announced:
+            print("SPRT " + pair[0] + " vs " + pair[1] + ": " + self.verdicts[pair] + " accepted after "
+                  + str(sum(self.counts[pair])) + " games")
+            self.announced.add(pair)
+
+    def ratings(self):
+        """
+        Fits Elo ratings to every result, first player anchored at 0
+        :return: dict of player spec to (rating, 95% interval half-width)
+        """
+        return fit_ratings(self.players, self.counts)
+
+    def report(self):
+        """
+        Formats standings, head-to-head results and SPRT verdicts
+        :return: report text
+        """
+        lines = ["Standings (Elo, 95% interval):"]
+        ratings = self.ratings()
+        for spec in sorted(self.players, key=lambda s: -ratings[s][0]):
+            rating, margin = ratings[spec]
+            lines.append("  %+7.1f +/- %-6s %s" % (rating, format_margin(margin), spec))
+        lines.append("Pairings (first player's view):")
+        for pair in self.pairs:
+            w, d, l = self.counts[pair]
+            line = "  %s vs %s: +%d =%d -%d" % (pair[0], pair[1], w, d, l)
+            if w + d + l:
+                diff, low, high = elo_interval(w, d, l)
+                line += ", Elo %s [%s, %s]" % (format_elo(diff), format_elo(low), format_elo(high))
+            if self.sprt is not None:
+                llr = sprt_llr(w, d, l, self.sprt[0], self.sprt[1])
+                line += ", LLR %.2f (%.2f, %.2f) %s" % (llr, self.bounds[0], self.bounds[1],
+                                                        self.verdicts.get(pair, "running"))
+            lines.append(line)
+        return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("players", help="player specs, as for SelfPlay", nargs="+")
+    parser.add_argument("-G", "--gauntlet", help="play first player against each of the others only",
+                        action="store_true")
+    parser.add_argument("-n", "--games", help="most games per pairing", type=int, default=GAMES_PER_PAIR)
+    parser.add_argument("-j", "--jobs", help="processes to play games on (default: one per core)", type=int)
+    parser.add_argument("-o", "--store", help="JSON lines results store, resumed if it exists", default=DEFAULT_STORE)
+    parser.add_argument("-t", "--time_limit", help="seconds per move for clients that take a time limit",
+                        type=float, default=SelfPlay.DEFAULT_TIME)
+    parser.add_argument("-m", "--max_plies", help="moves before a game is called a draw", type=int,
+                        default=SelfPlay.MAX_PLIES)
+    parser.add_argument("-S", "--seed", help="tournament seed", type=int, default=0)
+    parser.add_argument("--sprt", help="stop each pairing once H0: Elo = ELO0 or H1: Elo = ELO1 is accepted",
+                        type=float, nargs=2, metavar=("ELO0", "ELO1"))
+    parser.add_argument("--alpha", help="SPRT false positive rate", type=float, default=ALPHA)
+    parser.add_argument("--beta", help="SPRT false negative rate", type=float, default=BETA)
+    args = parser.parse_args()
+
+    if len(args.players) < 2 or len(set(args.players)) != len(args.players):
+        print("Error: need at least two different players.")
+        sys.exit(1)
+    for spec in args.players:
+        try:
+            SelfPlay.check_jobs(spec, args.jobs)
+        except (ImportError, AttributeError, ValueError) as err:
+            print("Error: " + str(err))
+            sys.exit(1)
+
+    try:
+        tournament = Tournament(args.players, args.gauntlet, args.games, args.store, args.time_limit,
+                                args.max_plies, args.seed, args.sprt, args.alpha, args.beta)
+    except ValueError as err:
+        print("Error: " + str(err))
+        sys.exit(1)
+    if tournament.done:
+        print("Resuming with " + str(len(tournament.done)) + " games from " + args.store)
+    try:
+        tournament.run(args.jobs)
+    except KeyboardInterrupt:
+        print("Interrupted; run again with the same store to resume.")
+    print(tournament.report())
+
+
+def score_stats(w, d, l):
+    """
+    Gets mean and variance of the per-game score (1, 0.5 or 0)
+    :param w: wins
+    :param d: draws
+    :param l: losses
+    :return: (games, mean score, variance of one game's score)
+    """
+    n = w + d + l
+    if n == 0:
+        return 0, 0.5, 0.0
+    s = (w + d / 2) / n
+    var = (w * (1 - s) ** 2 + d * (0.5 - s) ** 2 + l * s ** 2) / n
+    return n, s, var
+
+
+def elo(score):
+    """
+    Converts expected score to Elo difference
+    :param score: expected score, 0 to 1
+    :return: Elo difference, infinite for a score of 0 or 1
+    """
+    if score <= 0:
+        return -math.inf
+    elif score >= 1:
+        return math.inf
+    return -400 * math.log10(1 / score - 1)
+
+
+def expected_score(diff):
+    """
+    Converts Elo difference to expected score
+    :param diff: Elo difference
+    :return: expected score
+    """
+    return 1 / (1 + 10 ** (-diff / 400))
+
+
+def elo_interval(w, d, l):
+    """
+    Gets Elo difference with 95% confidence interval from head-to-head results. The interval is a
+    Wilson score interval using the variance of one game's score, so it stays wide after a run of
+    identical results, and all three values are kept within MAX_ELO, as fitted ratings are
+    :param w: wins
+    :param d: draws
+    :param l: losses
+    :return: (Elo difference, lower bound, upper bound)
+    """
+    n, s, var = score_stats(w, d, l)
+    if n == 0:
+        return 0.0, -MAX_ELO, MAX_ELO
+    z2 = Z_95 ** 2 / n
+    centre = (s + z2 / 2) / (1 + z2)
+    margin = Z_95 * math.sqrt(var / n + z2 / (4 * n)) / (1 + z2)
+    return tuple(max(-MAX_ELO, min(MAX_ELO, elo(x))) for x in (s, centre - margin, centre + margin))
+
+
+def sprt_llr(w, d, l, elo0, elo1):
+    """
+    Gets log-likelihood ratio of H1: Elo = elo1 against H0: Elo = elo0, by the
+    normal approximation to the trinomial score distribution. The variance is kept
+    above VARIANCE_FLOOR, so a run of identical results still ends the test
+    :param w: wins
+    :param d: draws
+    :param l: losses
+    :param elo0: Elo difference under H0
+    :param elo1: Elo difference under H1
+    :return: log-likelihood ratio, 0 before any games
+    """
+    n, s, var = score_stats(w, d, l)
+    if n == 0:
+        return 0.0
+    var = max(var, VARIANCE_FLOOR)
+    s0 = expected_score(elo0)
+    s1 = expected_score(elo1)
+    return n * (s1 - s0) * (2 * s - s0 - s1) / (2 * var)
+
+
+def sprt_bounds(alpha, beta):
+    """
+    Gets SPRT stopping bounds
+    :param alpha: false positive rate
+    :param beta: false negative rate
+    :return: (lower bound accepting H0, upper bound accepting H1)
+    """
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+def fit_ratings(players, counts):
+    """
+    Fits Elo ratings to head-to-head results by Newton steps on the logistic model. The first player
+    stays at 0 and the others are kept within MAX_ELO of it, so a player who won or lost every game
+    gets a finite rating. Each interval comes from the curvature of the likelihood in the player's
+    own rating at the fit, summed over the player's own games
+    :param players: list of player specs, the first anchored at 0
+    :param counts: dict of (spec, spec) pairing to [wins, draws, losses] of its first player
+    :return: dict of spec to (rating, 95% interval half-width)
+    """
+    ratings = {spec: 0.0 for spec in players}
+    scale = 400 / math.log(10)
+    for r in range(0, FIT_ROUNDS):
+        for spec in players[1:]:
+            score, expected, information = fit_stats(spec, ratings, counts)
+            if information > 0:
+                step = scale * (score - expected) / information
+                ratings[spec] = max(-MAX_ELO, min(MAX_ELO, ratings[spec] + step))
+    result = {}
+    for spec in players:
+        score, expected, information = fit_stats(spec, ratings, counts)
+        if information > 0:
+            margin = Z_95 * scale / math.sqrt(information)
+        else:
+            margin = math.inf
+        result[spec] = (ratings[spec], margin)
+    return result
+
+
+def fit_stats(spec, ratings, counts):
+    """
+    Gets a player's points, expected points and Fisher information under the current ratings
+    :param spec: player spec
+    :param ratings: dict of spec to Elo rating
+    :param counts: dict of (spec, spec) pairing to [wins, draws, losses] of its first player
+    :return: (points, expected points, information in score units)
+    """
+    score = 0.0
+    expected = 0.0
+    information = 0.0
+    for (a, b), (w, d, l) in counts.items():
+        n = w + d + l
+        if spec == a:
+            score += w + d / 2
+            e = expected_score(ratings[a] - ratings[b])
+        elif spec == b:
+            score += l + d / 2
+            e = expected_score(ratings[b] - ratings[a])
+        else:
+            continue
+        expected += n * e
+        information += n * e * (1 - e)
+    return score, expected, information
+
+
+def format_elo(diff):
+    """
+    Formats Elo difference
+    :param diff: Elo difference, possibly infinite
+    :return: text
+    """
+    if math.isinf(diff):
+        return "+inf" if diff > 0 else "-inf"
+    return "%+.1f" % diff
+
+
+def format_margin(margin):
+    """
+    Formats interval half-width
+    :param margin: half-width, possibly infinite
+    :return: text
+    """
+    if math.isinf(margin):
+        return "inf"
+    return "%.1f" % margin
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Lines of Action transposition table
+
+Fixed-size table keyed on Board.hash. Entries live in parallel
+arrays rather than a dict of tuples, so memory is set once by the
+megabyte cap and stays flat however many positions are stored.
+
+Each bucket has two slots. With the DEPTH_PREFERRED policy the first
+slot keeps the deepest result of the current search and the second
+slot is always replaced. With ALWAYS_REPLACE only the first slot is
+used and every store overwrites it.
+
+Starbuck Beagley
+"""
+from array import array
+
+EXACT = 1
+LOWER = 2
+UPPER = 3
+
+DEPTH_PREFERRED = 0
+ALWAYS_REPLACE = 1
+
+DEFAULT_MB = 16
+NO_MOVE = 0
+ENTRY_BYTES = 8 + 4 + 1 + 1 + 4 + 1
+BUCKET_SLOTS = 2
+
+
+class TransTable:
+    def __init__(self, mb=DEFAULT_MB, policy=DEPTH_PREFERRED):
+        """
+        Constructor
+        :param mb: memory cap in megabytes
+        :param policy: DEPTH_PREFERRED or ALWAYS_REPLACE
+        """
+        buckets = 1
+        while (buckets * 2) * BUCKET_SLOTS * ENTRY_BYTES <= mb * 1024 * 1024:
+            buckets *= 2
+        self.mask = buckets - 1
+        self.policy = policy
+        size = buckets * BUCKET_SLOTS
+        self.keys = array('Q', bytes(8 * size))
+        self.scores = array('i', bytes(4 * size))
+        self.depths = array('b', bytes(size))
+        self.flags = array('B', bytes(size))
+        self.moves = array('I', bytes(4 * size))
+        self.ages = array('B', bytes(size))
+        self.age = 1
+        self.hits = 0
+        self.probes = 0
+
+    def new_search(self):
+        """ Marks entries from earlier searches as replaceable """
+        self.age = self.age % 255 + 1
+        self.hits = 0
+        self.probes = 0
+
+    def clear(self):
+        """ Empties table """
+        size = len(self.keys)
+        self.keys = array('Q', bytes(8 * size))
+        self.flags = array('B', bytes(size))
+        self.ages = array('B', bytes(size))
+
+    def probe(self, key):
+        """
+        Looks up position
+        :param key: 64-bit position hash
+        :return: (depth, score, flag, move) tuple, None if not stored
+        """
+        self.probes += 1
+        slot = (key & self.mask) * BUCKET_SLOTS
+        for s in range(slot, slot + BUCKET_SLOTS):
+            if self.flags[s] and self.keys[s] == key:
+                self.hits += 1
+                return self.depths[s], self.scores[s], self.flags[s], self.moves[s]
+        return None
+
+    def store(self, key, depth, score, flag, move):
+        """
+        Stores search result according to replacement policy
+        :param key: 64-bit position hash
+        :param depth: remaining depth searched
+        :param score: score found
+        :param flag: EXACT, LOWER or UPPER
+        :param move: packed best move, NO_MOVE if none
+        """
+        slot = (key & self.mask) * BUCKET_SLOTS
+        if self.policy == ALWAYS_REPLACE:
+            s = slot
+        elif self.keys[slot + 1] == key and self.flags[slot + 1]:
+            s = slot + 1
+        elif self.keys[slot] == key or not self.flags[slot] or self.ages[slot] != self.age or \
+                depth >= self.depths[slot]:
+            s = slot
+        else:
+            s = slot + 1
+        if self.keys[s] == key and self.flags[s] and move == NO_MOVE:
+            move = self.moves[s]
+        self.keys[s] = key
+        self.scores[s] = score
+        self.depths[s] = depth
+        self.flags[s] = flag
+        self.moves[s] = move
+        self.ages[s] = self.age
+
+    def entries(self):
+        """
+        Gets number of slots in table
+        :return: slot count
+        """
+        return len(self.keys)
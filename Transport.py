@@ -0,0 +1,198 @@
+"""
+Framed message transport
+
+Every message is sent as a 4-byte big-endian length followed by the
+payload, so a reader never depends on one recv returning exactly one
+message. Incoming bytes are read with recv_into into a buffer that is
+reused for the life of the connection; several messages arriving in
+one read are handed out one at a time as memoryview slices of that
+buffer without copying. A slice is only valid until the next call to
+recv.
+
+Clients from before framing send bare pickles. A pickle always starts
+with the PROTO opcode (0x80), which a length prefix for any allowed
+frame size never does, so the server can tell the two apart from the
+first byte and fall back to one-message-per-recv for old clients.
+
+recv can be given a deadline for the whole message. The time left is
+recomputed before every read, so a peer that trickles a frame in a
+few bytes at a time still times out when the deadline passes.
+
+Starbuck Beagley
+"""
+
+import errno
+import select
+import socket
+import struct
+import time
+
+BUFF_SIZE = 4096
+MAX_FRAME = 1 << 20
+HEADER = struct.Struct('!I')
+PICKLE_PROTO = 0x80
+
+
+class ConnectionClosed(ConnectionError):
+    """ Raised when the other end closes the connection """
+    pass
+
+
+class FramedSocket:
+    def __init__(self, sock, framed=True, buff_size=BUFF_SIZE):
+        """
+        Constructor
+        :param sock: connected socket
+        :param framed: true for length-prefixed messages, false for old unframed clients
+        :param buff_size: initial receive buffer size
+        """
+        self.sock = sock
+        self.framed = framed
+        self.codec = None
+        self.delta = False
+        self.buffer = bytearray(buff_size)
+        self.start = 0
+        self.end = 0
+
+    def send(self, payload):
+        """
+        Sends one message
+        :param payload: message bytes
+        """
+        if self.framed:
+            if len(payload) > MAX_FRAME:
+                raise ConnectionError(errno.EMSGSIZE, "Message too large to send")
+            self.sock.sendall(HEADER.pack(len(payload)) + payload)
+        else:
+            self.sock.sendall(payload)
+
+    def recv(self, deadline=None):
+        """
+        Receives one message, reading from the socket only if no whole message is buffered
+        :param deadline: time.monotonic() by which the whole message must arrive, None to use the socket's timeout
+        :return: memoryview of message bytes, valid until the next recv
+        """
+        if deadline is None:
+            return self.recv_message(None)
+        timeout = self.sock.gettimeout()
+        try:
+            return self.recv_message(deadline)
+        finally:
+            self.sock.settimeout(timeout)
+
+    def recv_message(self, deadline):
+        """
+        Receives one message, setting the socket's timeout to the time left before each read
+        :param deadline: time.monotonic() by which the whole message must arrive, None for no deadline
+        :return: memoryview of message bytes
+        """
+        if not self.framed:
+            self.wait_until(deadline)
+            data = self.sock.recv(len(self.buffer))
+            if not data:
+                raise ConnectionClosed(errno.ECONNRESET, "Connection closed")
+            return memoryview(data)
+        while 1:
+            available = self.end - self.start
+            if available >= HEADER.size:
+                length = HEADER.unpack_from(self.buffer, self.start)[0]
+                if length > MAX_FRAME:
+                    raise ConnectionError(errno.EMSGSIZE, "Incoming message too large")
+                if available >= HEADER.size + length:
+                    begin = self.start + HEADER.size
+                    self.start = begin + length
+                    if self.start == self.end:
+                        self.start = 0
+                        self.end = 0
+                    return memoryview(self.buffer)[begin:begin + length]
+                self.make_room(HEADER.size + length)
+            else:
+                self.make_room(HEADER.size)
+            self.wait_until(deadline)
+            n = self.sock.recv_into(memoryview(self.buffer)[self.end:])
+            if n == 0:
+                raise ConnectionClosed(errno.ECONNRESET, "Connection closed")
+            self.end += n
+
+    def wait_until(self, deadline):
+        """
+        Sets socket timeout to the time left before a deadline
+        :param deadline: time.monotonic() deadline, None for no deadline
+        """
+        if deadline is None:
+            return
+        left = deadline - time.monotonic()
+        if left <= 0:
+            raise socket.timeout("timed out")
+        self.sock.settimeout(left)
+
+    def make_room(self, needed):
+        """
+        Makes sure the buffer can hold a message of given size after the unread bytes
+        :param needed: bytes the next message needs, header included
+        """
+        if self.start + needed <= len(self.buffer) and self.end < len(self.buffer):
+            return
+        unread = self.end - self.start
+        if self.start > 0:
+            self.buffer[:unread] = self.buffer[self.start:self.end]
+            self.start = 0
+            self.end = unread
+        if needed > len(self.buffer) or self.end == len(self.buffer):
+            grown = bytearray(max(needed, len(self.buffer) * 2))
+            grown[:self.end] = self.buffer[:self.end]
+            self.buffer = grown
+
+    def get_unread(self):
+        """
+        Gets bytes received but not yet returned by recv, e.g. to hand the connection to another process
+        :return: unread bytes
+        """
+        return bytes(self.buffer[self.start:self.end])
+
+    def set_unread(self, data):
+        """
+        Sets bytes to be read before anything else is received, e.g. those from get_unread.
+        Only valid before the first recv.
+        :param data: unread bytes
+        """
+        if len(data) > len(self.buffer):
+            self.buffer = bytearray(len(data) * 2)
+        self.buffer[:len(data)] = data
+        self.start = 0
+        self.end = len(data)
+
+    def settimeout(self, seconds):
+        """
+        Sets timeout on underlying socket
+        :param seconds: timeout, None to block
+        """
+        self.sock.settimeout(seconds)
+
+    def is_alive(self):
+        """
+        Checks without blocking whether the other end is still connected, e.g. while it waits for an opponent
+        :return: false if the other end closed the connection or the socket failed
+        """
+        try:
+            if not select.select([self.sock], [], [], 0)[0]:
+                return True
+            return bool(self.sock.recv(1, socket.MSG_PEEK))
+        except (OSError, ValueError):
+            return False
+
+    def close(self):
+        """ Closes underlying socket """
+        self.sock.close()
+
+
+def accept(sock):
+    """
+    Wraps a newly accepted socket, choosing framing from the client's first byte
+    :param sock: accepted socket
+    :return: FramedSocket
+    """
+    first = sock.recv(1, socket.MSG_PEEK)
+    if not first:
+        raise ConnectionClosed(errno.ECONNRESET, "Connection closed")
+    return FramedSocket(sock, first[0] != PICKLE_PROTO)
@@ -0,0 +1,944 @@
+"""
+Tests for the board's incremental state, move generation, search, the servers'
+transport and protocol, matchmaking, the opening book and tournament ratings
+
+Run with: python -m pytest -q
+
+Starbuck Beagley
+"""
+import argparse
+import asyncio
+import csv
+import itertools
+import json
+import pickle
+import random
+import socket
+import threading
+import time
+import pytest
+import AsyncServer
+import ClientNetwork
+import ClientOkayC
+import ClientSearchC
+import Clock
+import GameSession
+import Geometry
+import LOAServer
+import MCTS
+import Matchmaker
+import Metrics
+import OpeningBook
+import ParallelSearch
+import Protocol
+import SelfPlay
+import SessionPool
+import Shard
+import ThreadedServer
+import Tournament
+import TransTable
+import Transport
+from SuperClient import SuperClient
+
+ROWS = 8
+COLS = 8
+INIT = 0
+P1_MOVE_REQ = 1
+P2_MOVE_REQ = 2
+P1_MOVE_WAS = 3
+P2_MOVE_WAS = 4
+ERR_MESS = 6
+QUIT_MESS = 7
+RESYNC_MESS = 10
+
+PLAYOUTS = 20
+PLAYOUT_PLIES = 40
+UNDO_RATE = 0.2
+SHORT_GAME_PLIES = 6
+BUDGET_SLACK = 0.1  # seconds a move may take past its limit
+
+
+def legal_moves(client, player):
+    """
+    Gets every legal move for a player by trying every pair of cells with Move.legal_move
+    :param client: SuperClient whose board holds the position
+    :param player: player to move
+    :return: set of (r1, c1, r2, c2)
+    """
+    moves = set()
+    for r1, c1, r2, c2 in itertools.product(range(0, ROWS), range(0, COLS), range(0, ROWS), range(0, COLS)):
+        if client.move.legal_move(player, r1, c1, r2, c2) == "Legal":
+            moves.add((r1, c1, r2, c2))
+    return moves
+
+
+def test_generate_moves_matches_legal_move():
+    rng = random.Random(1)
+    client = SuperClient(1)
+    players = {1: client.player, 2: client.opponent}
+    for i in range(0, PLAYOUTS):
+        client.initialize()
+        client.position_replaced()
+        for ply in range(0, PLAYOUT_PLIES):
+            player = players[client.board.get_side()]
+            generated = list(client.move.generate_moves(player))
+            assert len(generated) == len(set(generated))
+            assert set(generated) == legal_moves(client, player)
+            if not generated or client.move.check_for_win(players[1]) or client.move.check_for_win(players[2]):
+                break
+            client.move.apply(rng.choice(generated))
+
+
+def random_game(seed, plies=PLAYOUT_PLIES):
+    """
+    Plays random legal moves on a client's board, taking some of them back along the way
+    :param seed: random seed
+    :param plies: moves and undos to make
+    :return: iterator of the client after each move or undo
+    """
+    rng = random.Random(seed)
+    client = SuperClient(1)
+    client.initialize()
+    client.position_replaced()
+    players = {1: client.player, 2: client.opponent}
+    for ply in range(0, plies):
+        if client.move.undo_stack and rng.random() < UNDO_RATE:
+            client.move.undo()
+        else:
+            moves = list(client.move.generate_moves(players[client.board.get_side()]))
+            if not moves:
+                return
+            client.move.apply(rng.choice(moves))
+        yield client
+
+
+def occupied_cells(grid, pieces):
+    """
+    Lists cells holding one of the given pieces
+    :param grid: list of lists of pieces
+    :param pieces: pieces to look for
+    :return: list of (r, c)
+    """
+    return [(r, c) for r in range(0, ROWS) for c in range(0, COLS) if grid[r][c] in pieces]
+
+
+def test_line_counts_match_recount():
+    for seed in range(0, PLAYOUTS):
+        for client in random_game(seed):
+            board = client.board
+            cells = occupied_cells(board.get_grid(), (client.player.get_piece(), client.opponent.get_piece()))
+            assert board.count_lines() == board.get_line_counts()
+            for r in range(0, ROWS):
+                for c in range(0, COLS):
+                    assert board.row_count(r) == sum(1 for r2, c2 in cells if r2 == r)
+                    assert board.col_count(c) == sum(1 for r2, c2 in cells if c2 == c)
+                    assert board.diag_count(r, c) == sum(1 for r2, c2 in cells if r2 - c2 == r - c)
+                    assert board.anti_count(r, c) == sum(1 for r2, c2 in cells if r2 + c2 == r + c)
+
+
+def count_groups(cells):
+    """
+    Counts groups of cells connected through any of their 8 neighbors, one cell at a time
+    :param cells: list of (r, c)
+    :return: group count
+    """
+    left = set(cells)
+    groups = 0
+    while left:
+        groups += 1
+        stack = [left.pop()]
+        while stack:
+            r, c = stack.pop()
+            for dr, dc in itertools.product((-1, 0, 1), repeat=2):
+                if (r + dr, c + dc) in left:
+                    left.remove((r + dr, c + dc))
+                    stack.append((r + dr, c + dc))
+    return groups
+
+
+def test_find_groups_matches_cell_search():
+    rng = random.Random(5)
+    geometry = Geometry.get_geometry(ROWS, COLS)
+    for i in range(0, 200):
+        bits = rng.getrandbits(ROWS * COLS) & rng.getrandbits(ROWS * COLS)
+        groups = geometry.find_groups(bits)
+        cells = [divmod(n, COLS) for n in range(0, ROWS * COLS) if (bits >> n) & 1]
+        assert len(groups) == count_groups(cells)
+        assert sum(groups) == bits
+        for group in groups:
+            assert geometry.flood(group & -group, bits) == group
+
+
+def test_groups_match_recount():
+    for seed in range(0, PLAYOUTS):
+        for client in random_game(seed):
+            grid = client.board.get_grid()
+            for player in (client.player, client.opponent):
+                groups = count_groups(occupied_cells(grid, (player.get_piece(),)))
+                assert client.board.group_count(player.get_piece()) == groups
+                assert client.move.check_for_win(player) == (groups == 1)
+
+
+def board_state(client):
+    """
+    Gets everything apply and undo change on a client
+    :param client: SuperClient
+    :return: tuple of bitboards, side, hash, line counts, groups, grid and pieces left
+    """
+    board = client.board
+    return (board.bits1, board.bits2, board.get_side(), board.get_hash(),
+            tuple(tuple(counts) for counts in board.get_line_counts()),
+            tuple(sorted(board.groups1)), tuple(sorted(board.groups2)),
+            tuple(tuple(row) for row in board.get_grid()),
+            client.player.get_pieces_left(), client.opponent.get_pieces_left())
+
+
+def test_undo_restores_every_earlier_position():
+    start = SuperClient(1)
+    start.initialize()
+    start.position_replaced()
+    for seed in range(0, PLAYOUTS):
+        states = [board_state(start)]
+        for client in random_game(seed):
+            depth = len(client.move.undo_stack)
+            if depth < len(states):
+                assert board_state(client) == states[depth]
+                del states[depth + 1:]
+            else:
+                states.append(board_state(client))
+        while client.move.undo():
+            assert board_state(client) == states[len(client.move.undo_stack)]
+        assert board_state(client) == states[0]
+
+
+def test_hash_matches_fresh_board():
+    fresh = SuperClient(2)
+    for seed in range(0, PLAYOUTS):
+        for client in random_game(seed):
+            board = client.board
+            assert board.get_hash() == board.compute_hash()
+            fresh.resync(board.get_grid(), board.get_side())
+            assert fresh.board.get_hash() == board.get_hash()
+            fresh.resync(board.get_grid(), 3 - board.get_side())
+            assert fresh.board.get_hash() != board.get_hash()
+
+
+def round_trip(codec, msg, board=None):
+    """
+    Encodes and decodes a message
+    :param codec: BinaryCodec
+    :param msg: message list
+    :param board: Board the message's grid came from
+    :return: decoded message list
+    """
+    return codec.decode(bytes(codec.encode(msg, board)))
+
+
+def test_binary_codec_round_trip():
+    codec = Protocol.BinaryCodec()
+    game_server = LOAServer.LOAServer()
+    grid = game_server.board.get_grid()
+    assert round_trip(codec, [0, True, True, 8, 1500]) == [0, True, True, 8, 1500]
+    assert round_trip(codec, [0, False, False]) == [0, False, False]
+    assert round_trip(codec, game_server.initialize_client(2, 7, True)) == [0, 2, 7, 2, grid]
+    assert round_trip(codec, game_server.initialize_client(1, 7)) == [0, 1, 7, 1]
+    assert round_trip(codec, game_server.request_move(1), game_server.board) == [P1_MOVE_REQ, "", grid]
+    assert round_trip(codec, [P1_MOVE_REQ, ['1', 'b', '3', 'b']]) == [P1_MOVE_REQ, ['1', 'b', '3', 'b']]
+    assert round_trip(codec, game_server.send_quit(2)) == game_server.send_quit(2)
+    assert round_trip(codec, [7]) == [7]
+
+
+def test_delta_update_with_resync():
+    codec = Protocol.BinaryCodec()
+    game_server = LOAServer.LOAServer()
+    client = SuperClient(2)
+    client.initialize()
+
+    assert game_server.evaluate_move(1, [P1_MOVE_REQ, ['1', 'a', '1', 'c']])[0] != 6
+    msg = round_trip(codec, game_server.send_move(P1_MOVE_WAS, [P1_MOVE_REQ, ['1', 'a', '1', 'c']], True))
+    assert msg == [P1_MOVE_WAS, [1, 0, 1, 2], game_server.board.get_hash()]
+    client.move_was(1, msg[1])
+    assert client.in_sync(msg[2])
+
+    game_server.evaluate_move(2, [2, ['0', 'b', '2', 'b']])
+    msg = round_trip(codec, game_server.send_move(P2_MOVE_WAS, [2, ['0', 'b', '2', 'b']], True))
+    assert not client.in_sync(msg[2])
+    assert round_trip(codec, [RESYNC_MESS]) == [RESYNC_MESS, ""]
+
+    msg = round_trip(codec, game_server.request_move(1), game_server.board)
+    assert msg[2] == game_server.board.get_grid()
+    client.resync(msg[2], 1)
+    assert client.in_sync(game_server.board.get_hash())
+
+
+def test_negotiate():
+    assert isinstance(Protocol.negotiate(b'\x80\x04'), Protocol.PickleCodec)
+    codec = Protocol.negotiate(bytes(Protocol.BinaryCodec().encode([0, True, False])))
+    assert isinstance(codec, Protocol.BinaryCodec)
+    assert codec.version == Protocol.VERSION
+
+
+def test_newer_client_switches_to_agreed_version():
+    client_codec = Protocol.BinaryCodec(version=Protocol.VERSION + 1)
+    server_codec = Protocol.negotiate(bytes(client_codec.encode([0, False, True])))
+    assert server_codec.version == Protocol.VERSION
+    assert server_codec.decode(bytes(client_codec.encode([0, False, True]))) == [0, False, True]
+
+    reply = bytes(server_codec.encode(LOAServer.LOAServer().initialize_client(1, 1)))
+    assert client_codec.decode(reply) == [0, 1, 1, 1]
+    assert client_codec.version == Protocol.VERSION
+    msg = [P1_MOVE_REQ, ['1', 'a', '1', 'c']]
+    assert server_codec.decode(bytes(client_codec.encode(msg))) == msg
+
+
+def test_other_messages_need_agreed_version():
+    newer = Protocol.BinaryCodec(version=Protocol.VERSION + 1)
+    with pytest.raises(Protocol.ProtocolError):
+        Protocol.BinaryCodec().decode(bytes(newer.encode([P1_MOVE_REQ, ['1', 'a', '1', 'c']])))
+
+
+class Conn:
+    def __init__(self, alive=True):
+        """
+        Constructor, a stand-in for a player's connection
+        :param alive: true if the player is still connected
+        """
+        self.alive = alive
+        self.closed = False
+
+    def is_alive(self):
+        return self.alive and not self.closed
+
+    def close(self):
+        self.closed = True
+
+
+def test_matchmaker_pairs_by_size():
+    matchmaker = Matchmaker.Matchmaker()
+    game_ids = itertools.count(1)
+    a, b, c = Conn(), Conn(), Conn()
+    assert matchmaker.pair(a, game_ids, 8) == (1, None, 0)
+    assert matchmaker.pair(b, game_ids, 6) == (2, None, 0)
+    game_id, opp, wait = matchmaker.pair(c, game_ids, 8)
+    assert (game_id, opp) == (1, a)
+    assert matchmaker.queue_depth() == 1
+    assert matchmaker.waiting() == [(2, b)]
+    assert matchmaker.queue_depth() == 0
+
+
+def test_matchmaker_pairs_by_rating_band():
+    matchmaker = Matchmaker.Matchmaker(rating_band=200)
+    game_ids = itertools.count(1)
+    unrated, low, far = Conn(), Conn(), Conn()
+    matchmaker.pair(unrated, game_ids, 8)
+    matchmaker.pair(low, game_ids, 8, 1000)
+    assert matchmaker.pair(far, game_ids, 8, 1450)[1] is None
+    assert matchmaker.pair(Conn(), game_ids, 8, 1250)[1] is low
+    assert matchmaker.pair(Conn(), game_ids, 8, 1599)[1] is far
+    assert matchmaker.pair(Conn(), game_ids, 8)[1] is unrated
+    assert matchmaker.queue_depth() == 0
+    assert matchmaker.stats()["paired"] == 3
+
+
+def test_matchmaker_drops_disconnected_players():
+    matchmaker = Matchmaker.Matchmaker()
+    game_ids = itertools.count(1)
+    gone, waiting = Conn(), Conn()
+    matchmaker.pair(gone, game_ids, 8)
+    matchmaker.pair(waiting, game_ids, 8, 1000)
+    gone.alive = False
+    assert matchmaker.pair(Conn(), game_ids, 8)[1] is None
+    assert gone.closed
+    assert matchmaker.queue_depth() == 2
+
+    waiting.alive = False
+    assert matchmaker.prune() == 1
+    assert waiting.closed
+    assert matchmaker.queue_depth() == 1
+    assert matchmaker.stats()["dropped"] == 2
+
+
+def test_elo_interval_after_identical_results():
+    diff, low, high = Tournament.elo_interval(10, 0, 0)
+    assert diff == high == Tournament.MAX_ELO
+    assert 0 < low < diff
+    diff, low, high = Tournament.elo_interval(0, 10, 0)
+    assert low < diff < high
+    assert low == pytest.approx(-high)
+
+
+def test_fit_ratings_anchored_and_bounded():
+    players = ["A", "B", "C"]
+    ratings = Tournament.fit_ratings(players, {("A", "B"): [0, 0, 10], ("A", "C"): [0, 0, 10], ("B", "C"): [5, 0, 5]})
+    assert ratings["A"][0] == 0
+    assert ratings["B"][0] == ratings["C"][0] == Tournament.MAX_ELO
+    assert all(0 < margin < float("inf") for rating, margin in ratings.values())
+
+    counts = {("A", "B"): [30, 40, 30], ("A", "C"): [50, 0, 50], ("B", "C"): [0, 0, 0]}
+    ratings = Tournament.fit_ratings(players, counts)
+    assert abs(ratings["B"][0]) < 1e-6 and abs(ratings["C"][0]) < 1e-6
+    assert ratings["A"][1] < ratings["B"][1]
+
+
+def test_tournament_refuses_unresumable_setups(tmp_path):
+    with pytest.raises(ValueError):
+        Tournament.Tournament(["ClientBadC", "ClientOkayC"], store=str(tmp_path / "results.csv"))
+    tournament = Tournament.Tournament(["ClientBadC", "ClientMCTSC:workers=2"], games_per_pair=2,
+                                       store=str(tmp_path / "results.jsonl"))
+    with pytest.raises(ValueError):
+        tournament.run(2)
+    assert not tournament.done
+
+
+def test_self_play_game_replays_from_its_moves(tmp_path):
+    task = (1, "ClientOkayC", "ClientBadC", 12345, 0.1, SelfPlay.MAX_PLIES, True)
+    result = SelfPlay.play_task(task)
+    again = SelfPlay.play_task(task)
+    assert (again["winner"], again["plies"], again["moves"]) == (result["winner"], result["plies"], result["moves"])
+    assert result["reason"] == "connected" and result["plies"] == len(result["moves"])
+
+    referee = SuperClient(1)
+    referee.initialize()
+    players = {1: referee.player, 2: referee.opponent}
+    for ply, move in enumerate(result["moves"]):
+        assert not referee.move.check_for_win(players[1]) and not referee.move.check_for_win(players[2])
+        m = OpeningBook.parse_move(move)
+        assert referee.move.is_legal_move(players[ply % 2 + 1], *m)
+        referee.move.apply(m)
+    assert referee.move.check_for_win(players[result["winner"]])
+
+    for name in ("results.jsonl", "results.csv"):
+        path = str(tmp_path / name)
+        writer = SelfPlay.ResultWriter(path)
+        writer.write(result)
+        writer.close()
+        writer = SelfPlay.ResultWriter(path, append=True)
+        writer.write(again)
+        writer.close()
+        with open(path, newline="") as f:
+            if name.endswith(".csv"):
+                rows = list(csv.DictReader(f))
+                assert [row["moves"].split() for row in rows] == [result["moves"], again["moves"]]
+                assert [int(row["winner"]) for row in rows] == [result["winner"]] * 2
+                assert rows[0]["seed"] == "12345" and rows[0]["game"] == "1"
+            else:
+                assert [json.loads(line) for line in f] == [result, again]
+
+
+def test_accept_loop_refuses_connections_beyond_handshake_limit(monkeypatch):
+    monkeypatch.setattr(ThreadedServer, "MAX_HANDSHAKES", 1)
+    monkeypatch.setattr(ThreadedServer, "ACCEPT_POLL", 0.05)
+    server_socket = socket.create_server(("127.0.0.1", 0))
+    accepting = threading.Thread(target=ThreadedServer.accept_clients,
+                                 args=(server_socket, lambda *args: None), daemon=True)
+    accepting.start()
+    slow = socket.create_connection(server_socket.getsockname())
+    extra = socket.create_connection(server_socket.getsockname())
+    try:
+        extra.settimeout(2)
+        assert extra.recv(1024) == b""
+        slow.sendall(frame(pickle.dumps([QUIT_MESS])))
+        accepting.join(2)
+        assert not accepting.is_alive()
+    finally:
+        slow.close()
+        extra.close()
+        server_socket.close()
+
+
+@pytest.mark.parametrize("first", [b'\x80\x04', pickle.dumps(5), pickle.dumps([0]), pickle.dumps("INIT")])
+def test_handshake_closes_bad_first_message(first):
+    server_end, client_end = socket.socketpair()
+    client_end.sendall(first)
+    started = []
+    ThreadedServer.handshake(server_end, Matchmaker.Matchmaker(), itertools.count(1),
+                             lambda *args: started.append(args), threading.Event())
+    client_end.settimeout(1)
+    while client_end.recv(1024):
+        pass
+    assert server_end.fileno() == -1
+    assert not started
+    client_end.close()
+
+
+def test_pause_returns_at_once_without_pacing():
+    server_end, client_end = socket.socketpair()
+    framed = Transport.FramedSocket(server_end)
+    bare = Transport.FramedSocket(client_end, False)
+    GameSession.set_pacing(False)
+    try:
+        start = time.monotonic()
+        ThreadedServer.pause(10, (framed, None))
+        asyncio.run(AsyncServer.pause(10, (framed,)))
+        assert time.monotonic() - start < 1
+        assert not GameSession.paced((framed, None))
+        assert GameSession.paced((framed, bare))
+    finally:
+        GameSession.set_pacing(True)
+        server_end.close()
+        client_end.close()
+    assert GameSession.paced((framed, None))
+
+
+def test_game_ends_cleanly_on_truncated_move():
+    server_end, client_end = socket.socketpair()
+    client_socket = Transport.FramedSocket(server_end)
+    client_socket.codec = Protocol.PickleCodec()
+    client_end.sendall(Transport.HEADER.pack(2) + b'\x80\x04')
+    GameSession.set_pacing(False)
+    try:
+        ThreadedServer.run_game(1, client_socket, None)
+    finally:
+        GameSession.set_pacing(True)
+    client = Transport.FramedSocket(client_end)
+    codes = []
+    client_end.settimeout(1)
+    try:
+        while 1:
+            codes.append(Protocol.PickleCodec.decode(client.recv())[0])
+    except Transport.ConnectionClosed:
+        pass
+    assert codes[-1] == ERR_MESS
+    assert server_end.fileno() == -1
+    client_end.close()
+
+
+def test_async_server_plays_game_and_stops_it_on_quit():
+    server = AsyncServer.AsyncGameServer()
+    serving = threading.Thread(target=asyncio.run, args=(server.serve("127.0.0.1", 0),), daemon=True)
+    GameSession.set_pacing(False)
+    serving.start()
+    try:
+        while server.server is None or not server.server.sockets:
+            time.sleep(0.01)
+        address = server.server.sockets[0].getsockname()
+        player = Transport.FramedSocket(socket.create_connection(address))
+        player.codec = Protocol.PickleCodec()
+        player.settimeout(5)
+        player.send(player.codec.encode([INIT, False]))
+        assert player.codec.decode(player.recv())[0] == INIT
+        clients = {1: ClientOkayC.ClientOkayC(1), 2: ClientOkayC.ClientOkayC(2)}
+        for client in clients.values():
+            client.initialize()
+        moves = 0
+        while 1:
+            msg = player.codec.decode(player.recv())
+            if msg[0] in (P1_MOVE_WAS, P2_MOVE_WAS):
+                for client in clients.values():
+                    client.move_was(msg[0] - P1_MOVE_WAS + 1, msg[1])
+                moves += 1
+            elif moves < SHORT_GAME_PLIES:
+                assert msg[0] in (P1_MOVE_REQ, P2_MOVE_REQ) and msg[2] == clients[1].board.get_grid()
+                player.send(player.codec.encode([msg[0], clients[msg[0]].next_move()]))
+            else:
+                break
+
+        quitter = Transport.FramedSocket(socket.create_connection(address))
+        quitter.codec = Protocol.PickleCodec()
+        quitter.send(quitter.codec.encode([QUIT_MESS]))
+        assert player.codec.decode(player.recv()) == [QUIT_MESS, GameSession.STOP_MESS]
+        with pytest.raises(Transport.ConnectionClosed):
+            player.recv()
+        serving.join(5)
+        assert not serving.is_alive()
+        assert server.stats()["active"] == 0
+        player.close()
+        quitter.close()
+    finally:
+        GameSession.set_pacing(True)
+
+
+def test_session_pool_refuses_game_when_saturated():
+    release = threading.Event()
+    pool = SessionPool.SessionPool(lambda *args: release.wait(5), workers=1, max_pending=0)
+    server_end, client_end = socket.socketpair()
+    try:
+        assert pool.submit(1, None, None)
+        while pool.stats()["active"] < 1:
+            time.sleep(0.01)
+        client_socket = Transport.FramedSocket(server_end)
+        client_socket.codec = Protocol.PickleCodec()
+        ThreadedServer.start_game(pool, 2, client_socket, None)
+        assert pool.stats() == {"active": 1, "pending": 0, "finished": 0, "rejected": 1}
+        client = Transport.FramedSocket(client_end)
+        client.settimeout(1)
+        assert Protocol.PickleCodec.decode(client.recv()) == [ERR_MESS, ThreadedServer.BUSY_MESS]
+        assert server_end.fileno() == -1
+    finally:
+        release.set()
+        pool.shutdown()
+        for worker in pool.workers:
+            worker.join(5)
+        client_end.close()
+    assert pool.stats() == {"active": 0, "pending": 0, "finished": 1, "rejected": 1}
+
+
+def test_move_request_carries_clock():
+    codec = Protocol.BinaryCodec()
+    session = GameSession.GameSession(1, False, Clock.Clock(60, 1, 30))
+    session.start_turn()
+    msg = round_trip(codec, session.move_request(True))
+    assert msg[:3] == [P1_MOVE_REQ, "", session.board.get_hash()]
+    assert 29 < msg[3] <= 30 and msg[4] == 60
+    assert Protocol.PickleCodec.decode(Protocol.PickleCodec.encode(session.move_request(True)))[4] == 60
+
+    client = SuperClient(1)
+    client.set_time(msg[3], msg[4])
+    assert client.time_budget(Protocol.MAX_MOVE_TIME) == 60 / 20
+    client.set_time(msg[3], None)
+    assert 29 < client.time_budget(Protocol.MAX_MOVE_TIME) <= 30
+    client.set_time(None, None)
+    assert client.time_budget(Protocol.MAX_MOVE_TIME) == Protocol.MAX_MOVE_TIME
+
+    untimed = GameSession.GameSession(2, False, Clock.Clock())
+    untimed.start_turn()
+    assert round_trip(codec, untimed.move_request(True)) == [P1_MOVE_REQ, "", untimed.board.get_hash()]
+
+
+def test_opening_book_min_games_per_move(tmp_path):
+    results = tmp_path / "games.jsonl"
+    games = [(["1A1C", "0D2D"], 1), (["1A1C", "0E2E"], 1), (["1A3C", "0D2D"], 1)]
+    results.write_text("".join(json.dumps({"winner": winner, "moves": moves}) + "\n" for moves, winner in games))
+    stats = OpeningBook.games_stats([str(results)], min_games=2)
+    book_path = str(tmp_path / "book.bin")
+    OpeningBook.write_book(book_path, stats)
+    book = OpeningBook.OpeningBook(book_path)
+    client = SuperClient(1)
+    client.initialize()
+    try:
+        assert book.entries(client.board.get_hash()) == [(OpeningBook.parse_move("1A1C"), 2, 4)]
+        assert len(book) == 1
+        assert book.lookup(client.board, client.move, client.player) == OpeningBook.parse_move("1A1C")
+    finally:
+        book.close()
+
+
+def test_opening_book_skips_illegal_moves(tmp_path):
+    client = SuperClient(1)
+    client.initialize()
+    key = client.board.get_hash()
+    stats = {}
+    OpeningBook.add_result(stats, key, (1, 1, 4, 1), 5, 10)
+    book_path = str(tmp_path / "book.bin")
+    OpeningBook.write_book(book_path, stats)
+    book = OpeningBook.OpeningBook(book_path)
+    try:
+        assert book.lookup(client.board, client.move, client.player) is None
+    finally:
+        book.close()
+
+    searcher = ClientSearchC.ClientSearchC(1, time_limit=0.05, table_mb=0, book=book_path)
+    searcher.initialize()
+    try:
+        m = searcher.next_move()
+        a = []
+        assert LOAServer.translate(m, a, COLS)
+        assert searcher.move.legal_move(searcher.player, *a) == "Legal"
+    finally:
+        searcher.close()
+
+
+def test_empty_opening_book_file(tmp_path):
+    book_path = tmp_path / "book.bin"
+    book_path.write_bytes(b"")
+    book = OpeningBook.OpeningBook(str(book_path))
+    client = SuperClient(1)
+    client.initialize()
+    try:
+        assert len(book) == 0
+        assert book.lookup(client.board, client.move, client.player) is None
+    finally:
+        book.close()
+
+    searcher = ClientSearchC.ClientSearchC(1, time_limit=0.05, table_mb=0, book=str(book_path))
+    searcher.initialize()
+    try:
+        a = []
+        assert LOAServer.translate(searcher.next_move(), a, COLS)
+    finally:
+        searcher.close()
+
+
+def test_search_pool_replaces_dead_worker():
+    client = SuperClient(1)
+    client.initialize()
+    pool = ParallelSearch.SearchPool(ParallelSearch.ALPHA_BETA, 2, table_mb=0)
+    try:
+        dead = pool.processes[0]
+        dead.terminate()
+        dead.join()
+        moves = list(client.move.generate_moves(client.player))
+        assert pool.best_move(client.board, client.player, 1.0, moves) in moves
+        assert pool.processes[0] is not dead
+        assert all(process.is_alive() for process in pool.processes)
+    finally:
+        pool.close()
+
+
+def test_trans_table_replacement():
+    table = TransTable.TransTable(1)
+    assert table.entries() * TransTable.ENTRY_BYTES <= 1024 * 1024
+    buckets = table.mask + 1
+    deep, shallow, other = 5, 5 + buckets, 5 + 2 * buckets
+    assert table.probe(deep) is None
+    table.store(deep, 6, 10, TransTable.EXACT, 77)
+    table.store(shallow, 2, -3, TransTable.LOWER, 12)
+    table.store(other, 1, 4, TransTable.UPPER, 13)
+    assert table.probe(deep) == (6, 10, TransTable.EXACT, 77)
+    assert table.probe(shallow) is None
+    assert table.probe(other) == (1, 4, TransTable.UPPER, 13)
+
+    table.store(deep, 7, 11, TransTable.LOWER, TransTable.NO_MOVE)
+    assert table.probe(deep) == (7, 11, TransTable.LOWER, 77)
+    table.new_search()
+    table.store(shallow, 1, 0, TransTable.EXACT, 12)
+    assert table.probe(deep) is None
+    assert table.probe(shallow) == (1, 0, TransTable.EXACT, 12)
+
+    table = TransTable.TransTable(1, TransTable.ALWAYS_REPLACE)
+    table.store(deep, 6, 10, TransTable.EXACT, 77)
+    table.store(shallow, 1, 0, TransTable.EXACT, 12)
+    assert table.probe(deep) is None
+    assert table.probe(shallow) == (1, 0, TransTable.EXACT, 12)
+
+
+def frame(payload):
+    """
+    Frames payload as FramedSocket sends it
+    :param payload: message bytes
+    :return: length-prefixed bytes
+    """
+    return Transport.HEADER.pack(len(payload)) + payload
+
+
+def test_framed_socket_pipelined_and_partial_frames():
+    server_end, client_end = socket.socketpair()
+    framed = Transport.FramedSocket(server_end)
+    server_end.settimeout(5)
+    try:
+        client_end.sendall(frame(b"one") + frame(b"") + frame(b"three"))
+        assert bytes(framed.recv()) == b"one"
+        assert bytes(framed.recv()) == b""
+        assert bytes(framed.recv()) == b"three"
+
+        big = bytes(range(256)) * 40
+        data = frame(b"x") + frame(big)
+
+        def trickle():
+            for i in range(0, len(data), 1000):
+                client_end.sendall(data[i:i + 1000])
+                time.sleep(0.01)
+        sender = threading.Thread(target=trickle)
+        sender.start()
+        assert bytes(framed.recv()) == b"x"
+        assert bytes(framed.recv()) == big
+        sender.join()
+
+        client_end.sendall(Transport.HEADER.pack(Transport.MAX_FRAME + 1))
+        with pytest.raises(ConnectionError):
+            framed.recv()
+    finally:
+        server_end.close()
+        client_end.close()
+
+
+def test_framed_socket_deadline_and_close():
+    server_end, client_end = socket.socketpair()
+    framed = Transport.FramedSocket(server_end)
+    try:
+        client_end.sendall(frame(b"late")[:3])
+        with pytest.raises(socket.timeout):
+            framed.recv(time.monotonic() + 0.1)
+        client_end.sendall(frame(b"late")[3:])
+        assert bytes(framed.recv()) == b"late"
+        client_end.close()
+        with pytest.raises(Transport.ConnectionClosed):
+            framed.recv()
+    finally:
+        server_end.close()
+
+
+def test_shard_handoff_keeps_buffered_bytes():
+    server_end, client_end = socket.socketpair()
+    parent, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    front = Shard.Front(0, 1, 0)
+    front.channels.append(parent)
+    front.next_channel = itertools.cycle([0])
+    framed = Transport.FramedSocket(server_end)
+    framed.codec = Protocol.PickleCodec()
+    framed.delta = True
+    taken = None
+    try:
+        client_end.sendall(frame(pickle.dumps([INIT, True])) + frame(pickle.dumps([P1_MOVE_REQ, "first"])))
+        assert framed.codec.decode(framed.recv()) == [INIT, True]
+        assert framed.get_unread()
+        front.start_game(5, framed, None)
+        assert server_end.fileno() == -1
+        client_end.sendall(frame(pickle.dumps([P1_MOVE_REQ, "second"])))
+
+        data, fds, flags, addr = socket.recv_fds(child, Shard.HANDOFF_SIZE, Shard.MAX_FDS)
+        game_id, states = pickle.loads(data)
+        assert game_id == 5 and len(fds) == len(states) == 1
+        taken = Shard.take_socket(fds[0], states[0])
+        taken.settimeout(1)
+        assert taken.framed and taken.delta and isinstance(taken.codec, Protocol.PickleCodec)
+        assert taken.codec.decode(taken.recv()) == [P1_MOVE_REQ, "first"]
+        assert taken.codec.decode(taken.recv()) == [P1_MOVE_REQ, "second"]
+    finally:
+        if taken is not None:
+            taken.close()
+        parent.close()
+        child.close()
+        client_end.close()
+
+
+def test_clock_bank_increment_and_move_limit(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(Clock.time, "monotonic", lambda: now[0])
+    clock = Clock.Clock(10, 2, 6)
+    clock.start(1)
+    assert clock.time_left() == 6
+    now[0] += 4
+    assert clock.time_left() == 2
+    assert clock.stop(1)
+    assert clock.get_remaining(1) == 8
+    assert clock.get_remaining(2) == 10
+
+    clock.start(1)
+    now[0] += 7
+    assert clock.time_left() == 0
+    assert not clock.stop(1)
+    assert clock.get_remaining(1) == 1
+
+    clock.start(1)
+    assert clock.time_left() == 1
+
+    untimed = Clock.Clock()
+    untimed.start(2)
+    now[0] += 1000
+    assert untimed.time_left() is Clock.NO_LIMIT
+    assert untimed.stop(2)
+    assert untimed.get_remaining(2) is Clock.NO_LIMIT
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Metrics.Histogram("loa_test_seconds", "Test", buckets=[0.1, 1])
+    for value in (0.05, 0.1, 0.5, 2):
+        histogram.observe(value)
+    assert histogram.render() == [
+        "# HELP loa_test_seconds Test",
+        "# TYPE loa_test_seconds histogram",
+        'loa_test_seconds_bucket{le="0.1"} 2',
+        'loa_test_seconds_bucket{le="1"} 3',
+        'loa_test_seconds_bucket{le="+Inf"} 4',
+        "loa_test_seconds_sum 2.65",
+        "loa_test_seconds_count 4",
+    ]
+
+
+def test_logger_drops_debug_and_flushes_errors_at_once(capsys):
+    logger = Metrics.Logger(Metrics.INFO, buffer_lines=100, flush_interval=60)
+    assert not logger.enabled(Metrics.DEBUG)
+    logger.debug("step")
+    logger.info("game")
+    assert capsys.readouterr().out == ""
+    logger.error("failed")
+    lines = capsys.readouterr().out.splitlines()
+    assert [line.split(" ", 1)[1] for line in lines] == ["INFO game", "ERROR failed"]
+    logger.debug("step")
+    logger.flush()
+    assert capsys.readouterr().out == ""
+
+
+def test_playout_board_matches_board():
+    geometry = Geometry.get_geometry(ROWS, COLS)
+    playout = MCTS.PlayoutBoard(geometry)
+    rng = random.Random(3)
+    for seed in range(0, PLAYOUTS):
+        for client in random_game(seed):
+            board = client.board
+            playout.set_board(board)
+            player = client.player if board.get_side() == 1 else client.opponent
+            moves = set((geometry.index(r1, c1), geometry.index(r2, c2))
+                        for r1, c1, r2, c2 in client.move.generate_moves(player))
+            assert set(playout.moves()) == moves
+            if not moves:
+                continue
+            assert playout.random_move(rng) in moves
+            i, j = sorted(moves)[0]
+            playout.play(i, j)
+            client.move.apply(divmod(i, COLS) + divmod(j, COLS))
+            assert playout.bits[1:] == [board.bits1, board.bits2]
+            assert playout.counts == [list(counts) for counts in board.get_line_counts()]
+            assert playout.side == board.get_side()
+            players = {1: client.player, 2: client.opponent}
+            expected = 1 if client.move.check_for_win(players[1]) else 2 if client.move.check_for_win(players[2]) else 0
+            assert playout.winner() == expected
+            client.move.undo()
+
+
+def winning_moves(client):
+    """
+    Finds moves that win at once for the side to move, player 1 winning if both sides connect
+    :param client: SuperClient whose board holds the position
+    :return: list of (r1, c1, r2, c2)
+    """
+    players = {1: client.player, 2: client.opponent}
+    side = client.board.get_side()
+    wins = []
+    for m in list(client.move.generate_moves(players[side])):
+        client.move.apply(m)
+        if client.move.check_for_win(players[1]):
+            winner = 1
+        elif client.move.check_for_win(players[2]):
+            winner = 2
+        else:
+            winner = 0
+        client.move.undo()
+        if winner == side:
+            wins.append(m)
+    return wins
+
+
+def test_mcts_finds_win_in_one():
+    positions = [
+        (["...o....", ".ox.o...", ".o...x..", "....x.o.", ".o......", "o.x.xxo.", "...xx...", "..x....."],
+         (1, 2, 4, 5)),
+        (["..o....o", ".x....o.", ".x.....o", "x.......", "....x...", "..xxx...", "..o....o", "....xo.."],
+         (7, 4, 4, 1)),
+    ]
+    for rows, win in positions:
+        client = SuperClient(1)
+        client.resync([[' ' if cell == '.' else cell for cell in row] for row in rows], 1)
+        assert winning_moves(client) == [win]
+        search = MCTS.MCTS(client.board, progressive_bias=True, seed=1)
+        assert search.best_move(0.2) == win
+        stats = search.get_stats()
+        assert stats["playouts"] > 0 and stats["tree_nodes"] > 1
+        assert sum(visits for visits, won in search.root_visits().values()) == stats["playouts"]
+
+
+def test_network_client_workers_at_least_one():
+    assert ClientNetwork.positive("2") == 2
+    for value in ("0", "-1", "two"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            ClientNetwork.positive(value)
+    SuperClient(1).close()
+
+
+def test_search_client_answers_within_budget():
+    client = ClientSearchC.ClientSearchC(1, time_limit=0.3, table_mb=1)
+    rows = ["...o....", ".ox.o...", ".o...x..", "....x.o.", ".o......", "o.x.xxo.", "...xx...", "..x....."]
+    client.resync([[' ' if cell == '.' else cell for cell in row] for row in rows], 1)
+    start = time.monotonic()
+    assert client.next_move() == [1, 'C', 4, 'F']
+    assert time.monotonic() - start < 0.3 + BUDGET_SLACK
+    client.initialize()
+    client.position_replaced()
+    client.set_time(0.2, None)
+    start = time.monotonic()
+    m = client.next_move()
+    assert time.monotonic() - start < 0.2 + BUDGET_SLACK
+    a = []
+    assert LOAServer.translate(m, a, COLS)
+    assert client.move.legal_move(client.player, *a) == "Legal"